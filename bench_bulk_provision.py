@@ -0,0 +1,62 @@
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vc_bulk_provision import ProvisioningBatch
+from vc_session_pool import session_pool
+from vc_tasks import task_tracker
+from vm import VMCreationRequest, create_vm_from_template
+import argparse
+import time
+
+def creation_requests(vcenter, prefix, count, datastores):
+    return [VMCreationRequest(
+        vcenter_server=vcenter.server, datacenter_name='dc0', cluster_name='dc0-cl0',
+        datastore_name=f"dc0-cl0-ds{index % datastores}", template_name='template',
+        vm_name=f"{prefix}-{index}", cpu=2, memory=4, disk_size_gb=40, network_name='dc0-cl0-net0')
+        for index in range(count)]
+
+def report(label, vcenter, count, elapsed):
+    print(f"{label:<12} vms={count:<6} round_trips={vcenter.round_trips:<8} seconds={elapsed:<8.3f} "
+          f"vms_per_minute={count * 60 / elapsed:.1f}")
+
+def run_sequential(vcenter, requests):
+    vcenter.reset_calls()
+    started = time.perf_counter()
+    with session_pool.session({'server': vcenter.server}) as service_instance:
+        for request in requests:
+            create_vm_from_template(service_instance, request)
+    report('sequential', vcenter, len(requests), time.perf_counter() - started)
+
+def run_bulk(vcenter, requests, max_per_datastore, max_per_host):
+    vcenter.reset_calls()
+    started = time.perf_counter()
+    batch = ProvisioningBatch(requests, {vcenter.server: {'server': vcenter.server}},
+                              max_per_datastore, max_per_host).start().wait()
+    report('bulk', vcenter, len(requests), time.perf_counter() - started)
+    if batch['counts'] != {'success': len(requests)}:
+        raise SystemExit(f"Bulk provisioning did not create every VM: {batch['counts']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare bulk and sequential clone throughput against a fake vCenter")
+    parser.add_argument('--vms', type=int, default=40, help="VMs to create with each method")
+    parser.add_argument('--inventory-vms', type=int, default=500, help="Existing VMs in the inventory")
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--datastores', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.002, help="Seconds added to every round trip")
+    parser.add_argument('--clone-seconds', type=float, default=0.5, help="Duration of each clone task")
+    parser.add_argument('--max-per-datastore', type=int, default=4)
+    parser.add_argument('--max-per-host', type=int, default=2)
+    args = parser.parse_args()
+
+    vcenter = FakeVCenter(latency=args.latency, task_duration=args.clone_seconds).build_inventory(
+        hosts=args.hosts, datastores=args.datastores, vms=args.inventory_vms)
+    datacenter = vcenter.find_by_name(vim.Datacenter, 'dc0')
+    vcenter.add_vm(datacenter, 'template', template=True)
+    session_pool.connect = vcenter.connect
+    task_tracker.poll_interval = min(args.clone_seconds / 10, 1.0)
+
+    run_sequential(vcenter, creation_requests(vcenter, 'seq', args.vms, args.datastores))
+    run_bulk(vcenter, creation_requests(vcenter, 'bulk', args.vms, args.datastores),
+             args.max_per_datastore, args.max_per_host)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vc_property_collector import collect_vm_details
+import argparse
+import time
+
+# The per-VM property walk get_vm_details used before the PropertyCollector engine
+def collect_vm_details_by_walking(content):
+    container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+    vms = container.view
+    container.Destroy()
+    vm_details_list = []
+    for vm in vms:
+        vm_detail = {
+            'vm_name': vm.summary.config.name,
+            'networks': [net.name for net in vm.network if isinstance(net, vim.Network)],
+            'storage': [],
+            'datastores': [],
+            'ip_addresses': []
+        }
+        for net_info in vm.guest.net:
+            if net_info.ipConfig is not None and net_info.ipConfig.ipAddress:
+                for ip in net_info.ipConfig.ipAddress:
+                    vm_detail['ip_addresses'].append(ip.ipAddress)
+        for device in vm.config.hardware.device:
+            if isinstance(device, vim.vm.device.VirtualDisk):
+                vm_detail['storage'].append({'label': device.deviceInfo.label, 'size_GB': device.capacityInKB / 1024 / 1024})
+        for ds in vm.datastore:
+            vm_detail['datastores'].append(ds.name)
+        vm_details_list.append(vm_detail)
+    return vm_details_list
+
+def run(label, vcenter, collect):
+    content = vcenter.connect().RetrieveContent()
+    vcenter.reset_calls()
+    started = time.perf_counter()
+    details = collect(content)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<20} vms={len(details):<7} round_trips={vcenter.round_trips:<8} seconds={elapsed:.3f}")
+    return details
+
+def main():
+    parser = argparse.ArgumentParser(description="Count SOAP round trips for a vm_details sweep against a fake vCenter")
+    parser.add_argument('--vms', type=int, default=1000, help="VMs per cluster")
+    parser.add_argument('--clusters', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every round trip")
+    parser.add_argument('--page-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    vcenter = FakeVCenter(latency=args.latency).build_inventory(clusters=args.clusters, vms=args.vms)
+    walked = run('property walk', vcenter, collect_vm_details_by_walking)
+    collected = run('property collector', vcenter, lambda content: collect_vm_details(content, args.page_size))
+    if walked != collected:
+        raise SystemExit("PropertyCollector output differs from the property walk")
+
+if __name__ == '__main__':
+    main()
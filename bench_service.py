@@ -0,0 +1,137 @@
+from fake_vcenter import FakeFleet
+import argparse
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+
+SCENARIOS = ['find-vcenter', 'query-cluster-info', 'capture-vm-details', 'create-vm', 'add-disk', 'add-network']
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def reset_peak_rss():
+    # Linux lets a process reset its high-water mark; elsewhere the peak only grows
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def scenario_request(name, index, args):
+    """
+    (method, path, json body) for the index-th request of a scenario.
+    """
+    vc = index % args.vcenters
+    server = f"vc{vc}.example.com"
+    cluster = f"dc0-cl{index % args.clusters}"
+    vm_name = f"vc{vc}-{cluster}-vm{index // args.vcenters % args.vms}"
+    if name == 'find-vcenter':
+        return 'GET', f"/find-vcenter/{vm_name}", None
+    if name == 'query-cluster-info':
+        return 'GET', f"/query-cluster-info/?cluster_name={cluster}", None
+    if name == 'capture-vm-details':
+        return 'GET', "/capture-vm-details", None
+    if name == 'create-vm':
+        return 'POST', "/create-vm/", {
+            'vcenter_server': server, 'datacenter_name': 'dc0', 'cluster_name': cluster,
+            'datastore_name': f"{cluster}-ds0", 'template_name': 'dc0-template0',
+            'vm_name': f"bench-{time.monotonic_ns()}-{index}", 'cpu': 2, 'memory': 4, 'disk_size_gb': 40,
+            'network_name': f"{cluster}-net0"}
+    if name == 'add-disk':
+        return 'POST', "/add-disk-to-vm/", {'vcenter_server': server, 'vm_name': vm_name, 'disk_size_gb': 10,
+                                            'datastore_name': f"{cluster}-ds0"}
+    if name == 'add-network':
+        return 'POST', "/add-network-to-vm/", {'vcenter_server': server, 'vm_name': vm_name,
+                                               'network_name': f"{cluster}-net1"}
+    raise ValueError(name)
+
+async def run_scenario(client, fleet, name, concurrency, requests, args):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(index):
+        nonlocal errors
+        method, path, body = scenario_request(name, index, args)
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors += 1
+
+    fleet.reset_calls()
+    reset_peak_rss()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<20} concurrency={concurrency:<4} requests={requests:<6} rps={requests / elapsed:<9.1f} "
+          f"p50_ms={percentile(latencies, 0.5) * 1000:<9.2f} p99_ms={percentile(latencies, 0.99) * 1000:<9.2f} "
+          f"soap_per_request={fleet.round_trips / requests:<8.1f} peak_rss_mb={peak_rss_mb():<8.1f} errors={errors}")
+
+async def run(args, fleet):
+    import httpx
+    import vc_service
+    from vc_session_pool import session_pool
+    from vc_tasks import task_tracker
+
+    session_pool.connect = fleet.connect
+    task_tracker.poll_interval = max(min(args.task_seconds / 10, 1.0), 0.01)
+    app = vc_service.app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            # Snapshots the read endpoints serve from
+            for path in ('/capture-vm-details', '/collect-cluster-info'):
+                response = await client.get(path)
+                response.raise_for_status()
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    requests = args.capture_requests if name == 'capture-vm-details' else args.requests
+                    await run_scenario(client, fleet, name, concurrency, requests, args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the service's endpoints against a fleet of fake vCenters")
+    parser.add_argument('--vcenters', type=int, default=2)
+    parser.add_argument('--datacenters', type=int, default=1)
+    parser.add_argument('--clusters', type=int, default=2, help="Clusters per datacenter")
+    parser.add_argument('--hosts', type=int, default=4, help="Hosts per cluster")
+    parser.add_argument('--vms', type=int, default=500, help="VMs per cluster")
+    parser.add_argument('--latency', type=float, default=0.001, help="Seconds added to every round trip")
+    parser.add_argument('--task-seconds', type=float, default=0.0, help="Duration of each vSphere task")
+    parser.add_argument('--concurrency', type=lambda value: [int(level) for level in value.split(',')],
+                        default=[1, 8, 32], help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per scenario and level")
+    parser.add_argument('--capture-requests', type=int, default=4, help="Requests per level for /capture-vm-details")
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=SCENARIOS,
+                        help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    fleet = FakeFleet(args.vcenters, args.latency, args.task_seconds, datacenters=args.datacenters,
+                      clusters=args.clusters, hosts=args.hosts, vms=args.vms, templates=1)
+    # The service keeps its snapshots, store and credentials in the working directory
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        with open('creds.json', 'w') as file:
+            json.dump(fleet.creds(), file)
+        asyncio.run(run(args, fleet))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+from vc_fanout import save_json_atomic
+from vc_snapshot import Snapshot, convert_json_snapshot
+from vc_vm_index import VMIndex
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+def synthetic_vm_details(vcenters, vms, networks, datastores):
+    # Same shape as vm_details.json: names are unique, networks and datastores repeat
+    rng = random.Random(7)
+    all_vms = {}
+    for vc in range(vcenters):
+        all_vms[f"vc{vc}.example.com"] = [{
+            'vm_name': f"vc{vc}-vm-{index:07d}",
+            'networks': [f"vc{vc}-net{rng.randrange(networks)}" for _ in range(rng.randint(1, 2))],
+            'storage': [{'label': f"Hard disk {disk + 1}", 'size_GB': float(rng.choice((40, 80, 200)))}
+                        for disk in range(rng.randint(1, 3))],
+            'datastores': [f"vc{vc}-ds{rng.randrange(datastores)}"],
+            'ip_addresses': [f"10.{vc}.{index // 250 % 250}.{index % 250 + 1}"],
+        } for index in range(vms // vcenters)]
+    return all_vms
+
+def rss_kb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+def measure(method, file_path, vm_name):
+    # Runs in a fresh interpreter so each method starts from the same RSS
+    before = rss_kb()
+    started = time.perf_counter()
+    if method == 'json':
+        with open(file_path) as file:
+            index = VMIndex(json.load(file))
+    else:
+        index = VMIndex.from_snapshot(Snapshot(file_path))
+    loaded = time.perf_counter()
+    entry = index.find_by_name(vm_name)
+    looked_up = time.perf_counter()
+    if entry is None:
+        raise SystemExit(f"{vm_name} not found in {file_path}")
+    print(json.dumps({'load_seconds': loaded - started, 'first_lookup_seconds': looked_up - loaded,
+                      'rss_mb': (rss_kb() - before) / 1024}))
+
+def run(method, file_path, vm_name):
+    output = subprocess.run([sys.executable, __file__, '--measure', method, file_path, vm_name],
+                            check=True, capture_output=True, text=True).stdout
+    result = json.loads(output)
+    print(f"{method:<8} file_mb={os.path.getsize(file_path) / 2**20:<8.1f} load_seconds={result['load_seconds']:<8.3f} "
+          f"first_lookup_seconds={result['first_lookup_seconds']:<8.3f} rss_mb={result['rss_mb']:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and binary VM snapshot load time and memory")
+    parser.add_argument('--vms', type=int, default=200000)
+    parser.add_argument('--vcenters', type=int, default=4)
+    parser.add_argument('--networks', type=int, default=200, help="Networks per vCenter")
+    parser.add_argument('--datastores', type=int, default=50, help="Datastores per vCenter")
+    parser.add_argument('--measure', nargs=3, metavar=('METHOD', 'FILE', 'VM_NAME'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, 'vm_details.json')
+        all_vms = synthetic_vm_details(args.vcenters, args.vms, args.networks, args.datastores)
+        vm_name = all_vms[list(all_vms)[-1]][-1]['vm_name']
+        save_json_atomic(json_path, all_vms)
+        del all_vms
+        started = time.perf_counter()
+        snap_path = convert_json_snapshot(json_path)
+        print(f"converted in {time.perf_counter() - started:.3f}s")
+        run('json', json_path, vm_name)
+        run('snapshot', snap_path, vm_name)
+
+if __name__ == '__main__':
+    main()
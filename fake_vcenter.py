@@ -0,0 +1,621 @@
+from collections import Counter
+from pyVmomi import vim, vmodl
+from vc_metrics import instrument_stub_class
+import datetime
+import itertools
+import threading
+import time
+
+PropertyCollector = vmodl.query.PropertyCollector
+
+
+def same_value(old, new):
+    # Inventory mutations replace values, so identity is enough to spot a change
+    if isinstance(old, list) and isinstance(new, list):
+        return len(old) == len(new) and all(a is b or a == b for a, b in zip(old, new))
+    return old is new or old == new
+
+
+class FakeStub:
+    """
+    Stand-in for pyVmomi's SOAP stub adapter.
+
+    Every property read and method call on a managed object bound to this stub
+    is one round trip, which is counted and optionally delayed by latency.
+    """
+
+    def __init__(self, vcenter):
+        self.vcenter = vcenter
+
+    def InvokeAccessor(self, mo, info):
+        self.vcenter.round_trip(info.name)
+        return self.vcenter.get_property(mo, info.name, info.type)
+
+    def InvokeMethod(self, mo, info, args):
+        self.vcenter.round_trip(info.name)
+        params = {param.name: arg for param, arg in zip(info.params, args)}
+        handler = getattr(self.vcenter, 'do_' + info.name, None)
+        if handler is None:
+            raise vmodl.fault.NotSupported(msg=f"{info.name} is not implemented by the fake vCenter")
+        return handler(mo, **params)
+
+    def DropConnections(self):
+        # Called by pyVim's Disconnect; there is no socket to close
+        pass
+
+# Property reads are separate round trips here, unlike on the real stub
+instrument_stub_class(FakeStub, ('InvokeMethod', 'InvokeAccessor'))
+
+
+class FakeVCenter:
+    """
+    In-process vCenter with an in-memory inventory, for benchmarks.
+
+    Managed objects are real pyVmomi types bound to a FakeStub, so code under
+    test talks to it exactly as it would to a vCenter over SOAP.
+    """
+
+    def __init__(self, server='fake-vcenter', latency=0.0, task_duration=0.0):
+        self.server = server
+        self.latency = latency
+        self.task_duration = task_duration
+        self.tasks = {}        # task moId -> task record
+        self.stub = FakeStub(self)
+        self.calls = Counter()
+        self.properties = {}   # moId -> {property name: value}
+        self.parents = {}      # moId -> parent moId
+        self.objects = {}      # moId -> managed object
+        self._ids = itertools.count(1)
+        self._tokens = {}
+        self._collectors = {}   # collector moId -> {'filters': {filter moId: spec}, 'states': {version: state}}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self.generation = 0
+
+        self.root_folder = self.add(vim.Folder, 'group-d1', name='Datacenters', childEntity=[])
+        self.view_manager = self.add(vim.view.ViewManager, 'ViewManager')
+        self.property_collector = self.add(vim.PropertyCollector, 'propertyCollector')
+        self.session_manager = self.add(vim.SessionManager, 'SessionManager')
+        self.service_instance = vim.ServiceInstance('ServiceInstance', self.stub)
+        self.content = vim.ServiceInstanceContent(
+            rootFolder=self.root_folder, viewManager=self.view_manager,
+            propertyCollector=self.property_collector, sessionManager=self.session_manager,
+            about=vim.AboutInfo(name='VMware vCenter Server', apiType='VirtualCenter', instanceUuid=f"fake-{server}"))
+        self.properties['ServiceInstance'] = {'content': self.content}
+        self.properties['SessionManager']['currentSession'] = vim.UserSession(key='fake-session', userName='fake')
+
+    @property
+    def round_trips(self):
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def round_trip(self, name):
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def connect(self, creds=None):
+        # Same shape as SmartConnect; used as the session pool's connect function
+        self.round_trip('Login')
+        return self.service_instance
+
+    def next_id(self, prefix):
+        return f"{prefix}-{next(self._ids)}"
+
+    # Inventory construction
+
+    def add(self, vimtype, moId, parent=None, **props):
+        mo = vimtype(moId, self.stub)
+        self.objects[moId] = mo
+        self.properties[moId] = props
+        if parent is not None:
+            self.parents[moId] = parent._moId
+        self.changed()
+        return mo
+
+    def changed(self):
+        # Wake up WaitForUpdatesEx callers after an inventory mutation
+        with self._changed:
+            self.generation += 1
+            self._changed.notify_all()
+
+    def add_child(self, folder, vimtype, prefix, **props):
+        mo = self.add(vimtype, self.next_id(prefix), parent=folder, **props)
+        self.properties[folder._moId].setdefault('childEntity', []).append(mo)
+        return mo
+
+    def add_datacenter(self, name):
+        datacenter = self.add_child(self.root_folder, vim.Datacenter, 'datacenter', name=name)
+        for folder_prop, prefix in (('vmFolder', 'group-v'), ('hostFolder', 'group-h'),
+                                    ('datastoreFolder', 'group-s'), ('networkFolder', 'group-n')):
+            folder = self.add(vim.Folder, self.next_id(prefix), parent=datacenter, name=folder_prop, childEntity=[])
+            self.properties[datacenter._moId][folder_prop] = folder
+        return datacenter
+
+    def folder(self, datacenter, folder_prop):
+        return self.properties[datacenter._moId][folder_prop]
+
+    def add_datastore(self, datacenter, name, capacity_gb=1024, free_gb=512, ds_type='VMFS'):
+        summary = vim.Datastore.Summary(
+            name=name, capacity=capacity_gb * 1024**3, freeSpace=free_gb * 1024**3,
+            type=ds_type, accessible=True)
+        return self.add_child(self.folder(datacenter, 'datastoreFolder'), vim.Datastore, 'datastore',
+                              name=name, summary=summary, vm=[])
+
+    def add_network(self, datacenter, name):
+        return self.add_child(self.folder(datacenter, 'networkFolder'), vim.Network, 'network',
+                              name=name, host=[], vm=[])
+
+    def add_cluster(self, datacenter, name, datastores=(), networks=()):
+        cluster = self.add_child(self.folder(datacenter, 'hostFolder'), vim.ClusterComputeResource, 'domain-c',
+                                 name=name, host=[], datastore=list(datastores), network=list(networks))
+        pool = self.add(vim.ResourcePool, self.next_id('resgroup'), parent=cluster, name='Resources', owner=cluster)
+        self.properties[cluster._moId]['resourcePool'] = pool
+        return cluster
+
+    def add_host(self, cluster, name, cpu_cores=16, cpu_mhz=2600, memory_gb=256):
+        hardware = vim.host.HardwareInfo(
+            cpuInfo=vim.host.CpuInfo(numCpuCores=cpu_cores, hz=cpu_mhz * 1000 * 1000),
+            memorySize=memory_gb * 1024**3)
+        cluster_props = self.properties[cluster._moId]
+        # A steady quarter of each host in use, so capacity rollups have something to report
+        summary = vim.host.Summary(quickStats=vim.host.Summary.QuickStats(
+            overallCpuUsage=cpu_cores * cpu_mhz // 4, overallMemoryUsage=memory_gb * 1024 // 4))
+        host = self.add(vim.HostSystem, self.next_id('host'), parent=cluster, name=name, hardware=hardware,
+                        summary=summary, datastore=list(cluster_props['datastore']),
+                        network=list(cluster_props['network']), vm=[])
+        cluster_props['host'].append(host)
+        self.refresh_cluster_summary(cluster)
+        return host
+
+    def refresh_cluster_summary(self, cluster):
+        cores = mhz = memory = 0
+        for host in self.properties[cluster._moId]['host']:
+            hardware = self.properties[host._moId]['hardware']
+            cores += hardware.cpuInfo.numCpuCores
+            mhz += hardware.cpuInfo.numCpuCores * hardware.cpuInfo.hz // (1000 * 1000)
+            memory += hardware.memorySize
+        self.properties[cluster._moId]['summary'] = vim.ClusterComputeResource.Summary(
+            totalCpu=mhz, totalMemory=memory, numCpuCores=cores,
+            effectiveCpu=int(mhz * 0.9), effectiveMemory=int(memory * 0.9 / 1024**2))
+
+    def vm_config(self, name, cpu, memory_mb, devices, template=False, host=None,
+                  cpu_hot_add=False, memory_hot_add=False):
+        config = vim.vm.ConfigInfo(
+            name=name, template=template, cpuHotAddEnabled=cpu_hot_add, memoryHotAddEnabled=memory_hot_add,
+            hardware=vim.vm.VirtualHardware(numCPU=cpu, memoryMB=memory_mb, device=list(devices)))
+        summary = vim.vm.Summary(
+            config=vim.vm.Summary.ConfigSummary(name=name, numCpu=cpu, memorySizeMB=memory_mb, template=template),
+            runtime=vim.vm.RuntimeInfo(powerState='poweredOff' if template else 'poweredOn', host=host))
+        return {'config': config, 'summary': summary, 'runtime': summary.runtime}
+
+    def add_vm(self, datacenter, name, host=None, datastores=(), networks=(), disks_gb=(40,), ips=(),
+               cpu=2, memory_mb=4096, template=False, folder=None):
+        devices = [vim.vm.device.ParaVirtualSCSIController(key=1000, busNumber=0, deviceInfo=vim.Description(label='SCSI controller 0'))]
+        for unit, size_gb in enumerate(disks_gb):
+            devices.append(vim.vm.device.VirtualDisk(
+                key=2000 + unit, unitNumber=unit, controllerKey=1000, capacityInKB=size_gb * 1024 * 1024,
+                deviceInfo=vim.Description(label=f"Hard disk {unit + 1}"),
+                backing=vim.vm.device.VirtualDisk.FlatVer2BackingInfo(fileName=f"[{name}] {name}/{name}_{unit}.vmdk", diskMode='persistent')))
+        for index, network in enumerate(networks):
+            devices.append(vim.vm.device.VirtualVmxnet3(
+                key=4000 + index, deviceInfo=vim.Description(label=f"Network adapter {index + 1}"),
+                backing=vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(
+                    network=network, deviceName=self.properties[network._moId]['name'])))
+        guest_net = []
+        if ips:
+            guest_net.append(vim.vm.GuestInfo.NicInfo(ipConfig=vim.net.IpConfigInfo(
+                ipAddress=[vim.net.IpConfigInfo.IpAddress(ipAddress=ip) for ip in ips])))
+        vm = self.add_child(folder or self.folder(datacenter, 'vmFolder'), vim.VirtualMachine, 'vm',
+                            name=name, guest=vim.vm.GuestInfo(net=guest_net, ipAddress=ips[0] if ips else None),
+                            network=list(networks), datastore=list(datastores),
+                            **self.vm_config(name, cpu, memory_mb, devices, template, host))
+        for ref in list(datastores) + list(networks) + ([host] if host is not None else []):
+            self.properties[ref._moId].setdefault('vm', []).append(vm)
+        return vm
+
+    def update_vm(self, vm, name=None, cpu=None, memory_mb=None, devices=None, cpu_hot_add=None, memory_hot_add=None):
+        props = self.properties[vm._moId]
+        config = props['config']
+        props['name'] = name or props['name']
+        props.update(self.vm_config(
+            props['name'], cpu or config.hardware.numCPU, memory_mb or config.hardware.memoryMB,
+            config.hardware.device if devices is None else devices, config.template, props['runtime'].host,
+            config.cpuHotAddEnabled if cpu_hot_add is None else cpu_hot_add,
+            config.memoryHotAddEnabled if memory_hot_add is None else memory_hot_add))
+        self.changed()
+
+    def rename(self, mo, name):
+        if isinstance(mo, vim.VirtualMachine):
+            self.update_vm(mo, name=name)
+            return
+        self.properties[mo._moId]['name'] = name
+        self.changed()
+
+    def remove(self, mo):
+        moId = mo._moId
+        for props in self.properties.values():
+            for key in ('childEntity', 'vm', 'host'):
+                refs = props.get(key)
+                if isinstance(refs, list) and mo in refs:
+                    refs.remove(mo)
+        self.properties.pop(moId, None)
+        self.objects.pop(moId, None)
+        self.parents.pop(moId, None)
+        self.changed()
+
+    def build_inventory(self, datacenters=1, clusters=1, hosts=2, vms=10, datastores=2, networks=2,
+                        templates=0, vm_prefix=''):
+        """
+        Populate a regular inventory of the given size; vms is per cluster.
+
+        Templates are named dc<n>-template<i>; vm_prefix keeps VM names unique
+        across several fake vCenters.
+        """
+        for dc_index in range(datacenters):
+            datacenter = self.add_datacenter(f"dc{dc_index}")
+            for cl_index in range(clusters):
+                prefix = f"dc{dc_index}-cl{cl_index}"
+                cl_datastores = [self.add_datastore(datacenter, f"{prefix}-ds{i}") for i in range(datastores)]
+                cl_networks = [self.add_network(datacenter, f"{prefix}-net{i}") for i in range(networks)]
+                cluster = self.add_cluster(datacenter, prefix, cl_datastores, cl_networks)
+                cl_hosts = [self.add_host(cluster, f"{prefix}-esx{i}.example.com") for i in range(hosts)]
+                for vm_index in range(vms):
+                    self.add_vm(datacenter, f"{vm_prefix}{prefix}-vm{vm_index}",
+                                host=cl_hosts[vm_index % len(cl_hosts)] if cl_hosts else None,
+                                datastores=[cl_datastores[vm_index % len(cl_datastores)]] if cl_datastores else [],
+                                networks=[cl_networks[vm_index % len(cl_networks)]] if cl_networks else [],
+                                ips=[f"10.{dc_index}.{cl_index}.{vm_index % 250 + 1}"])
+            for template_index in range(templates):
+                self.add_vm(datacenter, f"dc{dc_index}-template{template_index}", template=True)
+        return self
+
+    # Property access
+
+    def get_property(self, mo, name, prop_type=None):
+        props = self.properties.get(mo._moId)
+        if props is None:
+            raise vmodl.fault.ManagedObjectNotFound(obj=mo)
+        if name == 'parent' and mo._moId in self.parents:
+            return self.objects.get(self.parents[mo._moId])
+        if name == 'view' and isinstance(mo, vim.view.ContainerView):
+            return self.view_members(props)
+        if name == 'info' and isinstance(mo, vim.Task):
+            return self.task_info(mo)
+        value = props.get(name)
+        if value is None and prop_type is not None and issubclass(prop_type, list):
+            return []
+        return value
+
+    def get_path(self, mo, path):
+        head, _, rest = path.partition('.')
+        value = self.get_property(mo, head)
+        owner_type = type(mo)
+        for index, part in enumerate([head] + (rest.split('.') if rest else [])):
+            if index:
+                if value is None:
+                    break
+                owner_type = type(value)
+                value = getattr(value, part, None)
+            if isinstance(value, list) and not hasattr(type(value), 'Item'):
+                # PropertyCollector results carry typed arrays, as they would off the wire
+                value = owner_type._GetPropertyInfo(part).type(value)
+        return value
+
+    def descendants(self, container_id):
+        for moId in self.objects:
+            parent = self.parents.get(moId)
+            while parent is not None:
+                if parent == container_id:
+                    yield moId
+                    break
+                parent = self.parents.get(parent)
+
+    # Methods
+
+    def do_RetrieveContent(self, mo):
+        return self.content
+
+    def do_CurrentTime(self, mo):
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def view_members(self, view_props):
+        # Container views track the inventory, as they do in vCenter
+        container = view_props['container']
+        members = list(self.descendants(container._moId)) if view_props['recursive'] else [
+            child._moId for child in self.properties[container._moId].get('childEntity', [])]
+        return [self.objects[moId] for moId in members
+                if any(isinstance(self.objects[moId], vimtype) for vimtype in view_props['type'])]
+
+    def do_CreateContainerView(self, mo, container, type, recursive):
+        return self.add(vim.view.ContainerView, self.next_id('session[fake]view'),
+                        container=container, type=list(type), recursive=recursive)
+
+    def do_Destroy(self, mo):
+        if isinstance(mo, vim.VirtualMachine):
+            return self.start_task(mo, 'VirtualMachine.destroy', lambda: self.remove(mo))
+        if isinstance(mo, (vim.view.View, PropertyCollector, PropertyCollector.Filter)):
+            self.properties.pop(mo._moId, None)
+            self.objects.pop(mo._moId, None)
+            self._collectors.pop(mo._moId, None)
+            for collector in self._collectors.values():
+                collector['filters'].pop(mo._moId, None)
+            return None
+        raise vmodl.fault.NotSupported(msg=f"Destroy is not implemented for {type(mo).__name__}")
+
+    def do_WaitForUpdates(self, mo, version):
+        # Only used by pyVim's WaitForTask: sleep until the next running task is due
+        now = time.monotonic()
+        due = [task['started'] + task['duration'] - now for task in self.tasks.values() if task['state'] == 'running']
+        time.sleep(min(max(min(due), 0), 1.0) if due else 0.01)
+        return PropertyCollector.UpdateSet(version=str(self.generation), filterSet=[])
+
+    def do_CreatePropertyCollector(self, mo):
+        collector = vim.PropertyCollector(self.next_id('session[fake]collector'), self.stub)
+        self._collectors[collector._moId] = {'filters': {}, 'states': {}}
+        return collector
+
+    def do_CreateFilter(self, mo, spec, partialUpdates):
+        filter_mo = PropertyCollector.Filter(self.next_id('session[fake]filter'), self.stub)
+        self._collectors.setdefault(mo._moId, {'filters': {}, 'states': {}})['filters'][filter_mo._moId] = spec
+        return filter_mo
+
+    def do_WaitForUpdatesEx(self, mo, version, options):
+        collector = self._collectors.setdefault(mo._moId, {'filters': {}, 'states': {}})
+        if version and version not in collector['states']:
+            raise vmodl.query.InvalidCollectorVersion()
+        max_wait = options.maxWaitSeconds if options and options.maxWaitSeconds is not None else 60
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._changed:
+                generation = self.generation
+            filter_updates, state = self.filter_updates(collector, collector['states'].get(version, {}))
+            if filter_updates:
+                new_version = str(len(collector['states']) + 1)
+                collector['states'][new_version] = state
+                return PropertyCollector.UpdateSet(version=new_version, filterSet=filter_updates, truncated=False)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._changed:
+                if self.generation == generation:
+                    self._changed.wait(remaining)
+
+    def filter_updates(self, collector, previous):
+        state = {}
+        filter_updates = []
+        for filter_id, spec in collector['filters'].items():
+            old = previous.get(filter_id, {})
+            new = {content.obj._moId: (content.obj, {prop.name: prop.val for prop in content.propSet})
+                   for content in self.evaluate_filter(spec)}
+            state[filter_id] = new
+            object_updates = []
+            for moId, (obj, props) in new.items():
+                if moId not in old:
+                    changes = [PropertyCollector.Change(name=name, op='assign', val=val) for name, val in props.items()]
+                    object_updates.append(PropertyCollector.ObjectUpdate(kind='enter', obj=obj, changeSet=changes))
+                    continue
+                old_props = old[moId][1]
+                changes = [PropertyCollector.Change(name=name, op='assign', val=val)
+                           for name, val in props.items() if not same_value(old_props.get(name), val)]
+                changes += [PropertyCollector.Change(name=name, op='remove') for name in old_props if name not in props]
+                if changes:
+                    object_updates.append(PropertyCollector.ObjectUpdate(kind='modify', obj=obj, changeSet=changes))
+            for moId, (obj, _) in old.items():
+                if moId not in new:
+                    object_updates.append(PropertyCollector.ObjectUpdate(kind='leave', obj=obj, changeSet=[]))
+            if object_updates:
+                filter_updates.append(PropertyCollector.FilterUpdate(
+                    filter=PropertyCollector.Filter(filter_id, self.stub), objectSet=object_updates))
+        return filter_updates, state
+
+    def do_RetrievePropertiesEx(self, mo, specSet, options):
+        results = []
+        for filter_spec in specSet:
+            results.extend(self.evaluate_filter(filter_spec))
+        return self.page(results, options.maxObjects if options else None)
+
+    def do_ContinueRetrievePropertiesEx(self, mo, token):
+        results, page_size = self._tokens.pop(token)
+        return self.page(results, page_size)
+
+    def do_RetrieveContents(self, mo, specSet):
+        results = []
+        for filter_spec in specSet:
+            results.extend(self.evaluate_filter(filter_spec))
+        return results
+
+    def page(self, results, page_size):
+        token = None
+        if page_size and len(results) > page_size:
+            token = self.next_id('token')
+            self._tokens[token] = (results[page_size:], page_size)
+            results = results[:page_size]
+        return PropertyCollector.RetrieveResult(token=token, objects=results)
+
+    def evaluate_filter(self, filter_spec):
+        named = {}
+
+        def register(select_set):
+            for spec in select_set or []:
+                if isinstance(spec, PropertyCollector.TraversalSpec) and spec.name and spec.name not in named:
+                    named[spec.name] = spec
+                    register(spec.selectSet)
+
+        for object_spec in filter_spec.objectSet:
+            register(object_spec.selectSet)
+
+        selected = {}
+        traversed = set()
+
+        def visit(obj, select_set):
+            for spec in select_set or []:
+                if not isinstance(spec, PropertyCollector.TraversalSpec):
+                    spec = named[spec.name]
+                if not isinstance(obj, spec.type) or (obj._moId, spec.name, spec.path) in traversed:
+                    continue
+                traversed.add((obj._moId, spec.name, spec.path))
+                targets = self.get_path(obj, spec.path)
+                if not isinstance(targets, list):
+                    targets = [targets] if targets is not None else []
+                for target in targets:
+                    if not spec.skip:
+                        selected.setdefault(target._moId, target)
+                    visit(target, spec.selectSet)
+
+        for object_spec in filter_spec.objectSet:
+            if not object_spec.skip:
+                selected.setdefault(object_spec.obj._moId, object_spec.obj)
+            visit(object_spec.obj, object_spec.selectSet)
+
+        contents = []
+        for obj in selected.values():
+            prop_set = []
+            for prop_spec in filter_spec.propSet:
+                if not isinstance(obj, prop_spec.type):
+                    continue
+                # As on vCenter, an empty pathSet returns no properties unless all is set
+                paths = list(self.properties.get(obj._moId, {})) if prop_spec.all else prop_spec.pathSet or []
+                for path in paths:
+                    value = self.get_path(obj, path)
+                    if value is not None:
+                        prop_set.append(vmodl.DynamicProperty(name=path, val=value))
+            if prop_set or any(isinstance(obj, prop_spec.type) for prop_spec in filter_spec.propSet):
+                contents.append(PropertyCollector.ObjectContent(obj=obj, propSet=prop_set))
+        return contents
+
+    # Tasks
+
+    def start_task(self, entity, description, effect, duration=None):
+        task = self.add(vim.Task, self.next_id('task'))
+        self.tasks[task._moId] = {
+            'task': task, 'entity': entity, 'description': description, 'effect': effect,
+            'started': time.monotonic(), 'duration': self.task_duration if duration is None else duration,
+            'state': 'running', 'result': None, 'error': None,
+        }
+        return task
+
+    def task_info(self, task):
+        record = self.tasks[task._moId]
+        elapsed = time.monotonic() - record['started']
+        with self._lock:
+            if record['state'] == 'running' and elapsed >= record['duration']:
+                try:
+                    record['result'] = record['effect']()
+                    record['state'] = 'success'
+                except vmodl.MethodFault as e:
+                    record['error'] = e
+                    record['state'] = 'error'
+        progress = 100 if record['state'] != 'running' else int(100 * elapsed / record['duration'])
+        return vim.TaskInfo(
+            key=task._moId, task=task, descriptionId=record['description'], entity=record['entity'],
+            state=record['state'], progress=min(progress, 100), result=record['result'], error=record['error'],
+            cancelable=False, cancelled=False)
+
+    def find_by_name(self, vimtype, name):
+        for moId, mo in self.objects.items():
+            if isinstance(mo, vimtype) and self.properties[moId].get('name') == name:
+                return mo
+        return None
+
+    def do_Clone(self, mo, folder, name, spec):
+        def clone():
+            if self.find_by_name(vim.VirtualMachine, name):
+                raise vim.fault.DuplicateName(name=name, object=mo)
+            template = self.properties[mo._moId]
+            config = template['config']
+            location = spec.location
+            datastores = [location.datastore] if location and location.datastore else template['datastore']
+            host = location.host if location and location.host else None
+            if host is None and location and location.pool:
+                hosts = self.properties[self.properties[location.pool._moId]['owner']._moId]['host']
+                host = hosts[len(self.tasks) % len(hosts)] if hosts else None
+            devices = list(config.hardware.device)
+            networks = list(template['network'])
+            vm = self.add_child(folder, vim.VirtualMachine, 'vm', name=name, guest=vim.vm.GuestInfo(net=[]),
+                                network=networks, datastore=list(datastores),
+                                **self.vm_config(name, config.hardware.numCPU, config.hardware.memoryMB, devices,
+                                                 False, host, config.cpuHotAddEnabled, config.memoryHotAddEnabled))
+            if spec.config:
+                self.apply_config_spec(vm, spec.config)
+            for ref in list(datastores) + ([host] if host is not None else []):
+                self.properties[ref._moId].setdefault('vm', []).append(vm)
+            return vm
+        return self.start_task(mo, 'VirtualMachine.clone', clone)
+
+    def do_Reconfigure(self, mo, spec):
+        return self.start_task(mo, 'VirtualMachine.reconfigure', lambda: self.apply_config_spec(mo, spec))
+
+    def apply_config_spec(self, vm, spec):
+        props = self.properties[vm._moId]
+        devices = list(props['config'].hardware.device)
+        networks = list(props['network'])
+        datastores = list(props['datastore'])
+        next_key = max([device.key for device in devices] + [4999]) + 1
+        for change in spec.deviceChange or []:
+            device = change.device
+            if change.operation == 'remove':
+                if not any(existing.key == device.key for existing in devices):
+                    raise vmodl.fault.InvalidArgument(invalidProperty='deviceChange.device.key')
+                devices = [existing for existing in devices if existing.key != device.key]
+                continue
+            if device.key is None or device.key < 0:
+                device.key = next_key
+                next_key += 1
+            if isinstance(device, vim.vm.device.VirtualDisk):
+                if any(getattr(existing, 'controllerKey', None) == device.controllerKey and
+                       getattr(existing, 'unitNumber', None) == device.unitNumber for existing in devices):
+                    raise vim.fault.InvalidDeviceSpec(deviceIndex=0)
+                disk_count = sum(isinstance(existing, vim.vm.device.VirtualDisk) for existing in devices)
+                device.deviceInfo = vim.Description(label=f"Hard disk {disk_count + 1}", summary='')
+                if device.backing and device.backing.datastore and device.backing.datastore not in datastores:
+                    datastores.append(device.backing.datastore)
+            elif isinstance(device, vim.vm.device.VirtualEthernetCard):
+                nic_count = sum(isinstance(existing, vim.vm.device.VirtualEthernetCard) for existing in devices)
+                device.deviceInfo = vim.Description(label=f"Network adapter {nic_count + 1}", summary='')
+                network = getattr(device.backing, 'network', None)
+                if network is not None and network not in networks:
+                    networks.append(network)
+            devices.append(device)
+        # NICs that were removed take their network with them
+        networks = [network for network in networks if any(
+            getattr(getattr(device, 'backing', None), 'network', None) == network for device in devices)]
+        props['network'] = networks
+        props['datastore'] = datastores
+        self.update_vm(vm, cpu=spec.numCPUs, memory_mb=spec.memoryMB, devices=devices,
+                       cpu_hot_add=spec.cpuHotAddEnabled, memory_hot_add=spec.memoryHotAddEnabled)
+
+
+class FakeFleet:
+    """
+    Several fake vCenters behind one connect function, for whole-service benchmarks.
+
+    Install with session_pool.connect = fleet.connect and write fleet.creds()
+    to creds.json; every vCenter gets the same inventory shape, with VM names
+    prefixed by vc<n>- so they stay unique across the fleet.
+    """
+
+    def __init__(self, vcenters=1, latency=0.0, task_duration=0.0, **inventory):
+        self.vcenters = {}
+        for index in range(vcenters):
+            server = f"vc{index}.example.com"
+            self.vcenters[server] = FakeVCenter(server, latency, task_duration).build_inventory(
+                vm_prefix=f"vc{index}-", **inventory)
+
+    def creds(self):
+        return [{'server': server, 'user': 'fake', 'password': 'fake'} for server in self.vcenters]
+
+    def connect(self, creds):
+        return self.vcenters[creds['server']].connect(creds)
+
+    @property
+    def round_trips(self):
+        return sum(vcenter.round_trips for vcenter in self.vcenters.values())
+
+    def reset_calls(self):
+        for vcenter in self.vcenters.values():
+            vcenter.reset_calls()
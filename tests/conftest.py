@@ -0,0 +1,41 @@
+import json
+import pytest
+import vc_capacity
+import vc_changes
+import vc_common
+import vc_generations
+import vc_inventory_store
+import vc_placement
+import vc_search
+import vc_vm_index
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Run in an empty directory with fresh module singletons.
+
+    Snapshots, the store, the change log and the generation counters all
+    live in the working directory, and their singletons are keyed on
+    relative paths, so every test starts from scratch.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(vc_generations, '_counters', {})
+    monkeypatch.setattr(vc_inventory_store, '_store', None)
+    monkeypatch.setattr(vc_changes, '_change_log', None)
+    monkeypatch.setattr(vc_vm_index, '_indexes', {})
+    monkeypatch.setattr(vc_search, '_index', None)
+    monkeypatch.setattr(vc_capacity, '_rollups', None)
+    monkeypatch.setattr(vc_placement, '_index', None)
+    return tmp_path
+
+
+@pytest.fixture
+def vcenter_creds(monkeypatch):
+    """
+    Credentials for vc0 and vc1, read from the environment by a fresh registry.
+    """
+    vcenters = [{'server': server, 'user': 'admin', 'password': 'secret'} for server in ('vc0', 'vc1')]
+    monkeypatch.setenv(vc_common.CREDS_ENV_VAR, json.dumps(vcenters))
+    monkeypatch.setattr(vc_common, 'credentials', vc_common.CredentialsRegistry())
+    return vcenters
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vc_admission import AdmissionController, AdmissionRejected
+from vc_session_pool import SessionPool
+from vc_tasks import task_tracker
+import vc_admission
+import vm
+
+
+@pytest.fixture(autouse=True)
+def no_cooldown(monkeypatch):
+    # Every back-off takes effect, instead of one per ADMISSION_COOLDOWN seconds
+    monkeypatch.setattr(vc_admission, 'ADMISSION_COOLDOWN', 0)
+
+
+def run_in_order(controller, requests):
+    """
+    Queue (operation, key) requests behind a held ticket, release it, and return the keys in the order they ran.
+    """
+    order = []
+    done = threading.Event()
+
+    def runner(key):
+        def run(ticket):
+            order.append(key)
+            ticket.release()
+            if len(order) == len(requests):
+                done.set()
+        return run
+
+    held = controller.try_admit('vc0')
+    positions = [controller.enqueue('vc0', operation, key, runner(key))[0] for operation, key in requests]
+    held.release()
+    assert done.wait(5)
+    return positions, order
+
+
+def test_queued_requests_start_by_priority_then_arrival():
+    # One at a time, so the order they start in is the order they ran
+    controller = AdmissionController(initial_limit=1, max_limit=1)
+    positions, order = run_in_order(controller, [('create-vm', 'create-1'), ('add-disk-to-vm', 'disk'),
+                                                 ('create-vm', 'create-2'), ('delete-vm', 'delete')])
+    # Each request's place in line when it was queued
+    assert positions == [1, 1, 3, 1]
+    assert order == ['delete', 'disk', 'create-1', 'create-2']
+    assert controller.stats()['vc0']['in_flight'] == 0
+
+
+def test_nothing_jumps_ahead_of_an_equal_or_better_queued_request():
+    controller = AdmissionController(initial_limit=1)
+    held = controller.try_admit('vc0', 'create-vm')
+    controller.enqueue('vc0', 'add-disk-to-vm', 'disk', lambda ticket: None)
+    assert controller.try_admit('vc0', 'create-vm') is None
+    assert controller.try_admit('vc1', 'create-vm') is not None
+    assert controller.queue_position('disk')[0] == 1
+    held.release()
+
+
+def test_a_full_queue_is_rejected_with_a_retry_estimate():
+    controller = AdmissionController(initial_limit=1, max_queue=1)
+    controller.try_admit('vc0')
+    controller.enqueue('vc0', 'create-vm', 'first', lambda ticket: None)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enqueue('vc0', 'create-vm', 'second', lambda ticket: None)
+    assert rejected.value.queued == 1
+    assert rejected.value.retry_after >= 1
+    assert controller.stats()['vc0']['rejected'] == 1
+
+
+def test_slow_submits_halve_the_limit():
+    controller = AdmissionController(initial_limit=8)
+    for _ in range(5):
+        controller.try_admit('vc0').submitted(0.1)
+    assert controller.stats()['vc0']['limit'] == 8
+    controller.try_admit('vc0').submitted(5.0)
+    assert controller.stats()['vc0']['limit'] == 4
+
+
+def test_failures_halve_the_limit_and_clean_runs_raise_it():
+    controller = AdmissionController(initial_limit=8)
+    for _ in range(vc_admission.ADMISSION_WINDOW // 2):
+        controller.try_admit('vc0').release(failed=True)
+    assert controller.stats()['vc0']['limit'] == 4
+    # Client errors are no reason to back off
+    for _ in range(vc_admission.ADMISSION_WINDOW):
+        controller.try_admit('vc0').release()
+    assert controller.stats()['vc0']['limit'] == 4
+
+    # A clean completion while the limit is the bottleneck raises it by 1/limit
+    tickets = [controller.try_admit('vc0') for _ in range(4)]
+    assert controller.try_admit('vc0') is None
+    for ticket in tickets:
+        ticket.release()
+    assert controller.stats()['vc0']['limit'] == 4.25
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    controller = AdmissionController()
+    monkeypatch.setattr(vm, 'admission', controller)
+    return controller
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    fake = FakeVCenter(server='vc0')
+    pool = SessionPool(connect=fake.connect, disconnect=lambda service_instance: None)
+    monkeypatch.setattr(vm, 'session_pool', pool)
+    yield fake, pool
+    pool.close_all()
+
+
+def submit(start):
+    return asyncio.run(vm.submit_vm_task({'server': 'vc0'}, 'reconfigure-vm', 'web01', start, {},
+                                         failure_detail="Reconfiguration failed"))
+
+
+def raise_error(error):
+    def start(service_instance):
+        raise error
+    return start
+
+
+def test_only_vcenter_failures_count_against_the_limit(admission, fake_pool):
+    with pytest.raises(HTTPException) as raised:
+        submit(lambda service_instance: (None, "VM not found"))
+    assert raised.value.status_code == 400
+    with pytest.raises(HTTPException) as raised:
+        submit(raise_error(ValueError("invalid disk size")))
+    assert raised.value.status_code == 500
+    assert admission.stats()['vc0']['error_rate'] == 0.0
+
+    submit_error = ConnectionResetError("connection reset by peer")
+    with pytest.raises(HTTPException):
+        submit(raise_error(submit_error))
+    stats = admission.stats()['vc0']
+    assert stats['error_rate'] == round(1 / 3, 2)
+    assert (stats['in_flight'], stats['sessions']) == (0, 0)
+
+
+def test_login_failures_count_only_when_vcenter_is_unreachable(admission, fake_pool):
+    fake, pool = fake_pool
+
+    def refuse(error):
+        def connect(creds):
+            raise error
+        return connect
+
+    pool.connect = refuse(vim.fault.InvalidLogin())
+    with pytest.raises(HTTPException):
+        submit(lambda service_instance: (None, None))
+    assert admission.stats()['vc0']['error_rate'] == 0.0
+    pool.connect = refuse(ConnectionRefusedError("connection refused"))
+    with pytest.raises(HTTPException):
+        submit(lambda service_instance: (None, None))
+    assert admission.stats()['vc0']['error_rate'] == 0.5
+
+
+def test_a_full_queue_is_a_429_and_leaves_no_job(admission, monkeypatch):
+    monkeypatch.setattr(admission, 'max_queue', 0)
+    monkeypatch.setattr(admission, 'initial_limit', 1)
+    held = admission.try_admit('vc0')
+    jobs = len(task_tracker.list())
+    with pytest.raises(HTTPException) as raised:
+        submit(lambda service_instance: (None, None))
+    assert raised.value.status_code == 429
+    assert int(raised.value.headers['Retry-After']) >= 1
+    assert len(task_tracker.list()) == jobs
+    held.release()
+
+
+def test_a_queued_request_that_fails_after_submitting_gives_its_slot_back():
+    controller = AdmissionController(initial_limit=1)
+    ran = threading.Event()
+
+    def run(ticket):
+        ticket.submitted(0.1)
+        ran.set()
+        raise RuntimeError("task never reached the tracker")
+
+    held = controller.try_admit('vc0')
+    controller.enqueue('vc0', 'create-vm', 'create', run)
+    held.release()
+    assert ran.wait(5)
+    for _ in range(50):
+        if controller.stats()['vc0']['in_flight'] == 0:
+            break
+        time.sleep(0.01)
+    stats = controller.stats()['vc0']
+    assert (stats['in_flight'], stats['sessions']) == (0, 0)
+    assert controller.try_admit('vc0') is not None
+
+
+def test_a_tracker_failure_after_submitting_gives_the_slot_back(admission, fake_pool, monkeypatch):
+    def broken_submit(*args, **kwargs):
+        raise RuntimeError("tracker unavailable")
+
+    monkeypatch.setattr(task_tracker, 'submit', broken_submit)
+    with pytest.raises(RuntimeError):
+        submit(lambda service_instance: (vim.Task('task-1', None), None))
+    stats = admission.stats()['vc0']
+    assert (stats['in_flight'], stats['sessions']) == (0, 0)
@@ -0,0 +1,128 @@
+import threading
+import pytest
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vc_admission import AdmissionController
+from vc_bulk_provision import InventoryResolver, ProvisioningBatch
+from vc_object_cache import object_cache
+from vc_session_pool import session_pool
+from vc_tasks import TaskTracker
+from vm import VMCreationRequest
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeVCenter(server='vc0', task_duration=0.05).build_inventory(hosts=2, datastores=2)
+    fake.add_vm(fake.find_by_name(vim.Datacenter, 'dc0'), 'template', template=True)
+    monkeypatch.setattr(session_pool, 'connect', fake.connect)
+    # Names cached from another test's fake vCenter would point at its objects
+    object_cache.clear()
+    yield fake
+    session_pool.close_all()
+
+
+@pytest.fixture
+def tracker():
+    return TaskTracker(poll_interval=0.01)
+
+
+def creation_requests(count):
+    return [VMCreationRequest(
+        vcenter_server='vc0', datacenter_name='dc0', cluster_name='dc0-cl0', datastore_name=f"dc0-cl0-ds{index % 2}",
+        template_name='template', vm_name=f"bulk-{index}", cpu=2, memory=4, disk_size_gb=40,
+        network_name='dc0-cl0-net0') for index in range(count)]
+
+
+def test_bulk_clones_stay_within_the_admission_limit(fake, tracker):
+    controller = AdmissionController(initial_limit=2, max_limit=2)
+    batch = ProvisioningBatch(creation_requests(8), {'vc0': {'server': 'vc0'}}, 10, 10, tracker, controller)
+    peak = 0
+    original_start = batch._start
+
+    def counting_start(entry, host, ticket):
+        nonlocal peak
+        peak = max(peak, controller.stats()['vc0']['in_flight'])
+        original_start(entry, host, ticket)
+
+    batch._start = counting_start
+    snapshot = batch.start().wait(10)
+    assert snapshot['counts'] == {'success': 8}
+    assert peak == 2
+    assert controller.stats()['vc0']['in_flight'] == 0
+
+
+def test_a_full_admission_queue_fails_the_item_and_frees_its_slots(fake, tracker):
+    controller = AdmissionController(initial_limit=1, max_limit=1, max_queue=0)
+    held = controller.try_admit('vc0', 'create-vm')
+    batch = ProvisioningBatch(creation_requests(2), {'vc0': {'server': 'vc0'}}, 1, 1, tracker, controller)
+    snapshot = batch.start().wait(10)
+    held.release()
+    assert snapshot['counts'] == {'error': 2}
+    assert all('queued; retry in' in item['error'] for item in snapshot['items'])
+    assert set(batch._in_flight.values()) == {0}
+    assert controller.stats()['vc0']['in_flight'] == 0
+
+
+def test_a_failed_clone_gives_its_ticket_back(fake, tracker, monkeypatch):
+    controller = AdmissionController(initial_limit=2)
+
+    def broken_clone(*args, **kwargs):
+        raise ValueError("invalid clone spec")
+
+    batch = ProvisioningBatch(creation_requests(1), {'vc0': {'server': 'vc0'}}, 10, 10, tracker, controller)
+    monkeypatch.setattr(vim.VirtualMachine, 'Clone', broken_clone, raising=False)
+    snapshot = batch.start().wait(10)
+    assert snapshot['counts'] == {'error': 1}
+    assert snapshot['items'][0]['error'] == "VM creation failed: invalid clone spec"
+    stats = controller.stats()['vc0']
+    assert stats['in_flight'] == 0
+    # The request's own fault does not shrink the limit
+    assert stats['limit'] == 2
+
+
+def test_a_batch_resolves_its_names_in_one_call_per_scope(fake):
+    requests = creation_requests(6) + [VMCreationRequest(
+        vcenter_server='vc0', datacenter_name='dc0', cluster_name='dc0-cl0', datastore_name='missing',
+        template_name='template', vm_name='bulk-missing', cpu=2, memory=4, disk_size_gb=40,
+        network_name='dc0-cl0-net0')]
+    with session_pool.session({'server': 'vc0'}) as service_instance:
+        resolver = InventoryResolver(session_pool.content(service_instance))
+        fake.reset_calls()
+        resolver.load(requests)
+        # Datacenters, clusters, datastores and templates together, then the networks in dc0;
+        # each is a container view, one retrieval and the view's teardown
+        assert fake.round_trips == 2 * 3
+        plans = [resolver.plan(request) for request in requests]
+        # Only dc0's VM folder and the cluster's host list are left to read
+        assert fake.round_trips == 2 * 3 + 2
+    assert [plan['datastore'].name for plan, error in plans[:2]] == ['dc0-cl0-ds0', 'dc0-cl0-ds1']
+    assert plans[-1] == (None, "Datastore missing not found")
+
+
+def test_busy_datastores_and_hosts_do_not_hold_up_other_items(fake):
+    # Requests alternate between dc0-cl0-ds0 and dc0-cl0-ds1; the cluster has two hosts
+    batch = ProvisioningBatch(creation_requests(4), {'vc0': {'server': 'vc0'}}, 1, 1)
+    sessions = {}
+    pending = batch._resolve(sessions)
+    for service_instance in sessions.values():
+        session_pool.release(service_instance)
+
+    def start_next():
+        entry, host = batch._next_startable(pending)
+        if entry is None:
+            return None, None
+        pending.remove(entry)
+        batch._reserve(entry, host, 1)
+        return entry, host
+
+    with batch._cond:
+        first, first_host = start_next()
+        second, second_host = start_next()
+        assert (first[0]['index'], second[0]['index']) == (0, 1)
+        assert first_host.name != second_host.name
+        # Both datastores and both hosts are at their cap
+        assert start_next() == (None, None)
+        batch._reserve(first, first_host, -1)
+        third, third_host = start_next()
+        assert third[0]['index'] == 2
+        assert third_host.name == first_host.name
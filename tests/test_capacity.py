@@ -0,0 +1,29 @@
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vc_capacity import collect_capacity, rollup_capacity
+from vc_session_pool import session_pool
+
+
+def test_shared_datastores_count_once_per_scope(monkeypatch):
+    # Two clusters of three hosts, each host mounting both of its cluster's datastores
+    fake = FakeVCenter(server='vc0').build_inventory(clusters=2, hosts=3, datastores=2)
+    fake.add_datastore(fake.find_by_name(vim.Datacenter, 'dc0'), 'dc0-unmounted')
+    monkeypatch.setattr(session_pool, 'connect', fake.connect)
+    with session_pool.session({'server': 'vc0'}) as service_instance:
+        capacity = collect_capacity(session_pool.content(service_instance))
+    session_pool.close_all()
+
+    # The same inventory on two vCenters reuses every moId
+    rollups = rollup_capacity({'vc0': capacity, 'vc1': capacity, 'vc2': 'Connection failed'})
+    cluster = rollups['clusters']['vc0/dc0/dc0-cl0']
+    assert (cluster['hosts'], cluster['datastores']) == (3, 2)
+    assert cluster['storage_gb'] == {'total': 2048, 'used': 1024, 'free': 1024}
+    assert [datastore['name'] for datastore in rollups['placement']['vc0/dc0/dc0-cl0']['datastores']] == \
+        ['dc0-cl0-ds0', 'dc0-cl0-ds1']
+    # A datastore no host mounts still counts towards its datacenter
+    datacenter = rollups['datacenters']['vc0/dc0']
+    assert (datacenter['hosts'], datacenter['datastores'], datacenter['clusters']) == (6, 5, 2)
+    assert datacenter['storage_gb']['total'] == 5 * 1024
+    assert rollups['vcenters']['vc0']['datastores'] == 5
+    assert (rollups['total']['vcenters'], rollups['total']['datastores']) == (2, 10)
+    assert rollups['total']['storage_gb']['total'] == 10 * 1024
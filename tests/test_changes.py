@@ -0,0 +1,64 @@
+from fastapi.testclient import TestClient
+import vc_changes
+from vc_changes import ChangeLog, get_change_log
+
+
+def datastore(moid, name, free_gb):
+    return {'name': name, 'moId': moid, 'capacity_gb': 100.0, 'freeSpace_gb': free_gb, 'type': 'VMFS', 'accessible': True}
+
+
+def capture(*datastores):
+    # One cluster per datastore, as if each sat in its own datacenter
+    return {'vc0': [{'cluster_name': 'prod', 'datastores': [ds]} for ds in datastores]}
+
+
+def by_key(changes):
+    return {(change['key'], change['change']): change for change in changes}
+
+
+def test_datastore_changes_are_added_changed_and_removed(workdir):
+    change_log = get_change_log()
+    change_log.record_datastores(capture(datastore('datastore-1', 'local-ds', 50.0),
+                                         datastore('datastore-2', 'local-ds', 70.0)))
+    added = change_log.changes()
+    # Same name in two datacenters: two datastores, not one
+    assert set(by_key(added)) == {('datastore-1', 'added'), ('datastore-2', 'added')}
+
+    change_log.record_datastores(capture(datastore('datastore-1', 'local-ds', 40.0),
+                                         datastore('datastore-3', 'shared-ds', 10.0)))
+    changes = by_key(change_log.changes(since=added[-1]['version']))
+    assert set(changes) == {('datastore-1', 'changed'), ('datastore-3', 'added'), ('datastore-2', 'removed')}
+    assert changes[('datastore-1', 'changed')]['free_gb_delta'] == -10.0
+    assert changes[('datastore-1', 'changed')]['record']['freeSpace_gb'] == 40.0
+    assert changes[('datastore-2', 'removed')]['record'] is None
+
+
+def test_an_unchanged_capture_records_nothing(workdir):
+    change_log = get_change_log()
+    change_log.record_datastores(capture(datastore('datastore-1', 'local-ds', 50.0)))
+    latest = change_log.versions()[1]
+    # A vCenter that failed to collect is left out rather than reported as removed
+    change_log.record_datastores({**capture(datastore('datastore-1', 'local-ds', 50.0)), 'vc1': 'Connection failed'})
+    assert change_log.versions()[1] == latest
+
+
+def test_changes_feed_pages_and_reports_discarded_versions(workdir, monkeypatch):
+    change_log = ChangeLog(retention=2)
+    monkeypatch.setattr(vc_changes, '_change_log', change_log)
+    client = TestClient(vc_changes.app)
+    for free_gb in (50.0, 40.0, 30.0, 20.0):
+        change_log.record_datastores(capture(datastore('datastore-1', 'local-ds', free_gb)))
+    oldest, latest = change_log.versions()
+    assert (oldest, latest) == (3, 4)
+
+    response = client.get('/changes', params={'since': 0})
+    assert response.status_code == 410
+    assert f"version {latest}" in response.json()['detail']
+
+    page = client.get('/changes', params={'since': oldest - 1, 'limit': 1}).json()
+    assert [change['version'] for change in page['changes']] == [3]
+    assert page['more'] is True
+    page = client.get('/changes', params={'since': page['version']}).json()
+    assert [change['version'] for change in page['changes']] == [4]
+    assert page['more'] is False
+    assert client.get('/changes', params={'since': page['version']}).json()['version'] == latest
@@ -0,0 +1,33 @@
+import asyncio
+import threading
+from pyVmomi import vim
+from fake_vcenter import FakeFleet
+from vc_fanout import fan_out_first
+from vc_for_vm import search_vcenter
+from vc_object_cache import object_cache
+from vc_session_pool import session_pool
+
+
+def test_the_first_hit_stops_the_other_searches(monkeypatch):
+    fleet = FakeFleet(vcenters=3, hosts=1, vms=2)
+    monkeypatch.setattr(session_pool, 'connect', fleet.connect)
+    object_cache.clear()
+    slow, found, waiting = list(fleet.vcenters)
+    started = []
+    slow_stopped = threading.Event()
+
+    def search(vcenter, cancelled):
+        started.append(vcenter['server'])
+        if vcenter['server'] == slow:
+            # Still running when the hit comes back, and told to stop
+            if cancelled.wait(5):
+                slow_stopped.set()
+            return None
+        return search_vcenter(vcenter, 'vc1-dc0-cl0-vm0', cancelled)
+
+    # Two slots, so the third vCenter waits for one
+    hit = asyncio.run(fan_out_first(fleet.creds(), search, max_concurrency=2))
+    assert hit == (found, fleet.vcenters[found].find_by_name(vim.VirtualMachine, 'vc1-dc0-cl0-vm0')._moId)
+    assert slow_stopped.wait(5)
+    assert waiting not in started
+    session_pool.close_all()
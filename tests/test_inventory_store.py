@@ -0,0 +1,105 @@
+import asyncio
+import json
+from fake_vcenter import FakeVCenter
+from vc_heirarichal_data import collect_detailed_hierarchical_info, collect_detailed_info
+from vc_inventory_store import get_inventory_store
+from vc_session_pool import session_pool
+from vc_vm_cluster_details import collect_cluster_info, get_cluster_info
+import vc_common
+from vc_vm_index import publish_vm_snapshot
+import vc_search
+
+
+def cluster(name, datastores=(), networks=(), hosts=()):
+    return {
+        'cluster_name': name, 'total_cpu': 10.0, 'total_memory': 64.0, 'available_cpu': 8.0, 'available_memory': 32.0,
+        'hosts': [{'host_name': host, 'cpu_capacity': 5.0, 'memory_capacity': 32.0, 'storage_capacity': 100.0,
+                   'storage_free': 50.0} for host in hosts],
+        'datastores': [{'name': ds, 'capacity_gb': 100.0, 'freeSpace_gb': 50.0, 'type': 'VMFS', 'accessible': True}
+                       for ds in datastores],
+        'networks': [{'name': net, 'type': 'Network'} for net in networks],
+    }
+
+
+def test_publishing_vm_snapshots_leaves_cluster_inventory_alone(workdir):
+    store = get_inventory_store()
+    store.replace_cluster_info({'vc0': [cluster('prod', datastores=['ds-a', 'ds-b'], networks=['vlan10'],
+                                                hosts=['esx1'])]})
+    generation = store.generation.value()
+    vm = {'vm_name': 'web01', 'vm_id': 'vm-1', 'networks': ['vlan10'], 'datastores': ['ds-a'],
+          'ip_addresses': ['10.0.0.1'], 'storage': [{'label': 'Hard disk 1', 'size_GB': 40}]}
+    publish_vm_snapshot('vm_details.json', {'vc0': [vm]})
+    # /vm-ids/capture-vms publishes a snapshot with no datastores or networks at all
+    publish_vm_snapshot('vcenters.json', {'vc0': [{'vm_name': 'web01', 'vm_id': 'vm-1'}]})
+
+    assert store.generation.value() == generation
+    total, results = store.query_cluster_info()
+    assert total == 1
+    assert [ds['name'] for ds in results[0]['cluster_info']['datastores']] == ['ds-a', 'ds-b']
+    assert [net['name'] for net in results[0]['cluster_info']['networks']] == ['vlan10']
+    found = {(result['kind'], result['name']) for result in vc_search.get_search_index().search('ds-')}
+    assert found == {('datastore', 'ds-a'), ('datastore', 'ds-b')}
+
+
+def test_same_names_in_different_datacenters_stay_apart(workdir):
+    fake = FakeVCenter()
+    for i in range(2):
+        datacenter = fake.add_datacenter(f"dc{i}")
+        datastore = fake.add_datastore(datacenter, 'local-ds', capacity_gb=100 * (i + 1))
+        network = fake.add_network(datacenter, 'vlan10')
+        fake.add_host(fake.add_cluster(datacenter, 'prod', [datastore], [network]), f"esx{i}")
+    store = get_inventory_store()
+    store.replace_cluster_info({'vc0': get_cluster_info(fake.service_instance, with_moids=True)})
+    store.replace_hierarchy({'vc0': collect_detailed_info(fake.service_instance, with_moids=True)})
+
+    total, results = store.query_cluster_info(cluster_name='prod')
+    assert total == 2
+    assert [[host['host_name'] for host in result['cluster_info']['hosts']] for result in results] == [['esx0'], ['esx1']]
+    assert [[ds['capacity_gb'] for ds in result['cluster_info']['datastores']] for result in results] == [[100], [200]]
+    total, datacenters = store.query_hierarchy(cluster_name='prod')
+    assert total == 2
+    assert [datacenter['datacenter_name'] for datacenter in datacenters] == ['dc0', 'dc1']
+    for i, datacenter in enumerate(datacenters):
+        [prod] = datacenter['clusters']
+        assert [host['host_name'] for host in prod['hosts']] == [f"esx{i}"]
+        assert [(ds['name'], ds['capacity_gb']) for ds in prod['datastores']] == [('local-ds', 100 * (i + 1))]
+        assert [net['name'] for net in prod['networks']] == ['vlan10']
+
+
+def test_captures_keep_their_shape_without_moids(workdir, vcenter_creds, monkeypatch):
+    fake = FakeVCenter(server='vc0')
+    fake.build_inventory(datacenters=2, clusters=1, hosts=1, vms=0)
+    monkeypatch.setattr(session_pool, 'connect', fake.connect)
+    monkeypatch.setattr(vc_common, 'credentials', vc_common.CredentialsRegistry())
+    monkeypatch.setenv(vc_common.CREDS_ENV_VAR, json.dumps(vcenter_creds[:1]))
+
+    def keys(capture):
+        found = set()
+        for value in capture if isinstance(capture, list) else capture.values():
+            if isinstance(value, (dict, list)):
+                found |= keys(value)
+        return found | (set(capture) if isinstance(capture, dict) else set())
+
+    for collect, file_path, capture in ((collect_cluster_info, 'clusters.json', get_cluster_info),
+                                        (collect_detailed_hierarchical_info, 'detailed_hierarchical_clusters.json',
+                                         collect_detailed_info)):
+        returned = asyncio.run(collect())
+        with open(file_path) as file:
+            saved = json.load(file)
+        assert returned == saved == {'vc0': capture(fake.service_instance)}
+        assert 'moId' not in keys(saved)
+    # The store still got the moIds
+    assert get_inventory_store().connection().execute("SELECT moid FROM datastore LIMIT 1").fetchone()[0].startswith('datastore-')
+    session_pool.close_all()
+
+
+def test_hierarchy_is_collected_in_one_round_trip(monkeypatch):
+    fake = FakeVCenter(server='vc0')
+    fake.build_inventory(datacenters=2, clusters=2, hosts=2, vms=0)
+    monkeypatch.setattr(session_pool, 'connect', fake.connect)
+    with session_pool.session({'server': 'vc0'}) as service_instance:
+        fake.reset_calls()
+        datacenters = collect_detailed_info(service_instance)
+        assert fake.round_trips == 1
+    assert [len(datacenter['clusters']) for datacenter in datacenters] == [2, 2]
+    session_pool.close_all()
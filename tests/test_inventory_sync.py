@@ -0,0 +1,50 @@
+import threading
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vc_inventory_sync import VMInventorySync
+from vc_object_cache import object_cache
+from vc_session_pool import session_pool
+import vc_inventory_sync
+
+
+def test_renames_and_removals_reach_the_model_and_the_name_cache(workdir, monkeypatch):
+    monkeypatch.setattr(vc_inventory_sync, 'SYNC_WAIT_SECONDS', 1)
+    fake = FakeVCenter(server='vc0').build_inventory(hosts=1, vms=3)
+    monkeypatch.setattr(session_pool, 'connect', fake.connect)
+    object_cache.clear()
+    renamed, removed = (fake.find_by_name(vim.VirtualMachine, name) for name in ('dc0-cl0-vm0', 'dc0-cl0-vm1'))
+
+    def lookup(name):
+        with session_pool.session({'server': 'vc0'}) as service_instance:
+            vm = object_cache.lookup(session_pool.content(service_instance), [vim.VirtualMachine], name)
+        return vm._moId if vm is not None else None
+
+    # Cache every VM name, and that the new name is missing
+    assert lookup('dc0-cl0-vm1') == removed._moId
+    assert lookup('web01') is None
+
+    changed = threading.Event()
+    sync = VMInventorySync({'server': 'vc0'}, on_change=changed.set, checkpoint_dir=str(workdir))
+    sync.start()
+    try:
+        assert changed.wait(5)
+        assert sorted(vm['vm_name'] for vm in sync.vm_details()) == ['dc0-cl0-vm0', 'dc0-cl0-vm1', 'dc0-cl0-vm2']
+
+        changed.clear()
+        fake.rename(renamed, 'web01')
+        assert changed.wait(5)
+        assert sorted(vm['vm_name'] for vm in sync.vm_details()) == ['dc0-cl0-vm1', 'dc0-cl0-vm2', 'web01']
+        # Found straight away, although the miss was remembered a moment ago
+        assert lookup('web01') == renamed._moId
+        assert lookup('dc0-cl0-vm0') is None
+
+        changed.clear()
+        fake.remove(removed)
+        assert changed.wait(5)
+        assert sorted(vm['vm_name'] for vm in sync.vm_details()) == ['dc0-cl0-vm2', 'web01']
+        assert lookup('dc0-cl0-vm1') is None
+        # Its datastore and network leave with it, as no other VM uses them
+        assert sync.status['leave'] == 3
+    finally:
+        sync.stop()
+        session_pool.close_all()
@@ -0,0 +1,78 @@
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vc_object_cache import ObjectCache, vcenter_key
+
+
+def vcenter(server):
+    fake = FakeVCenter(server=server)
+    datacenter = fake.add_datacenter('dc0')
+    for name in ('ds-a', 'ds-b'):
+        fake.add_datastore(datacenter, name)
+    return fake, fake.service_instance.RetrieveContent()
+
+
+def names(objects):
+    return [obj.name if obj is not None else None for obj in objects]
+
+
+def test_misses_are_remembered_until_the_name_appears():
+    cache = ObjectCache()
+    fake, content = vcenter('vc0')
+    assert names(cache.resolve(content, [([vim.Datastore], 'ds-a'), ([vim.Datastore], 'ds-new')])) == ['ds-a', None]
+    fake.reset_calls()
+    assert cache.lookup(content, [vim.Datastore], 'ds-new') is None
+    assert fake.round_trips == 0
+    assert cache.stats()['negative_hits'] == 1
+
+    # The inventory sync reports the new datastore; the next lookup goes back to vCenter
+    fake.add_datastore(fake.find_by_name(vim.Datacenter, 'dc0'), 'ds-new')
+    cache.invalidate_name(vcenter_key(content), 'ds-new')
+    assert cache.lookup(content, [vim.Datastore], 'ds-new').name == 'ds-new'
+    assert fake.round_trips > 0
+    assert cache.stats()['negative_entries'] == 0
+
+
+def test_misses_expire():
+    cache = ObjectCache(miss_ttl=0)
+    fake, content = vcenter('vc0')
+    assert cache.lookup(content, [vim.Datastore], 'ds-new') is None
+    fake.reset_calls()
+    assert cache.lookup(content, [vim.Datastore], 'ds-new') is None
+    assert fake.round_trips > 0
+
+
+def test_a_reload_replaces_only_its_own_vcenter_and_type():
+    cache = ObjectCache()
+    first, first_content = vcenter('vc0')
+    second, second_content = vcenter('vc1')
+    cache.lookup(first_content, [vim.Datastore], 'ds-a')
+    cache.lookup(second_content, [vim.Datastore], 'ds-a')
+    cache.lookup(first_content, [vim.Datacenter], 'dc0')
+    assert cache.stats()['entries'] == 5
+
+    first.rename(first.find_by_name(vim.Datastore, 'ds-b'), 'ds-c')
+    # ds-c is not cached yet, so vc0's datastores reload and ds-b goes with the reload
+    assert cache.lookup(first_content, [vim.Datastore], 'ds-c').name == 'ds-c'
+    second.reset_calls()
+    untouched = [cache.lookup(second_content, [vim.Datastore], 'ds-b'), cache.lookup(first_content, [vim.Datacenter], 'dc0')]
+    assert second.round_trips == 0
+    assert names(untouched) == ['ds-b', 'dc0']
+    assert cache.stats()['entries'] == 5
+
+    cache.clear(vcenter_key(first_content))
+    assert cache.stats()['entries'] == 2
+
+
+def test_invalidated_objects_leave_every_index():
+    cache = ObjectCache()
+    fake, content = vcenter('vc0')
+    ds_a = cache.lookup(content, [vim.Datastore], 'ds-a')
+    cache.lookup(content, [vim.Datastore], 'ds-b')
+    cache.invalidate_object(vcenter_key(content), ds_a._moId)
+    assert cache.stats()['entries'] == 1
+    # The reload replaces the group the invalidated entry belonged to
+    assert cache.lookup(content, [vim.Datastore], 'ds-a')._moId == ds_a._moId
+    cache.invalidate_object(vcenter_key(content), ds_a._moId)
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+    assert cache._groups == {} and cache._by_moid == {}
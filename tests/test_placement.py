@@ -0,0 +1,33 @@
+from fake_vcenter import FakeVCenter
+from vc_capacity import collect_capacity, rollup_capacity
+from vc_placement import PlacementIndex, PlacementRequest
+from vc_session_pool import session_pool
+
+
+def placement_index(monkeypatch):
+    # Two clusters of one host with 192 GB of memory free, each with two 1 TB datastores half free
+    fake = FakeVCenter(server='vc0').build_inventory(clusters=2, hosts=1, datastores=2)
+    monkeypatch.setattr(session_pool, 'connect', fake.connect)
+    with session_pool.session({'server': 'vc0'}) as service_instance:
+        capacity = collect_capacity(session_pool.content(service_instance))
+    session_pool.close_all()
+    return PlacementIndex(rollup_capacity({'vc0': capacity})['placement'])
+
+
+def test_placements_reserve_what_they_take(monkeypatch):
+    index = placement_index(monkeypatch)
+    request = PlacementRequest(cpu=2, memory=100, disk_size_gb=300)
+    # Recommending reserves nothing
+    assert index.recommend(request) == index.recommend(request)
+
+    first = index.place(request)
+    assert (first['cluster_name'], first['datastore_name'], first['memory_free_gb']) == ('dc0-cl0', 'dc0-cl0-ds0', 92)
+    # The first cluster now has less memory free than the second
+    second = index.place(request)
+    assert (second['cluster_name'], second['datastore_name']) == ('dc0-cl1', 'dc0-cl1-ds0')
+    # The first datastore would drop below its headroom, so the next disk goes to the other one
+    third = index.place(PlacementRequest(cpu=2, memory=50, disk_size_gb=300, cluster_name='dc0-cl0'))
+    assert (third['datastore_name'], third['memory_free_gb']) == ('dc0-cl0-ds1', 42)
+    # Neither cluster has 100 GB left
+    assert index.place(request) is None
+    assert index.recommend(request) == []
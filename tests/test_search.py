@@ -0,0 +1,67 @@
+from fastapi.testclient import TestClient
+from vc_inventory_store import get_inventory_store
+from vc_search import SearchIndex, trigrams
+from vc_vm_index import publish_vm_snapshot
+import vc_search
+
+OBJECTS = [
+    ('vm', 'vc0', 'web-prod-01'),
+    ('vm', 'vc0', 'web'),
+    ('vm', 'vc0', 'webserver'),
+    ('vm', 'vc1', 'legacy-web'),
+    ('vm', 'vc1', 'weeb'),
+    ('host', 'vc0', 'esx-web01.example.com'),
+    ('datastore', 'vc0', 'web-ds'),
+    ('network', 'vc1', 'dmz'),
+]
+
+
+def names(results):
+    return [result['name'] for result in results]
+
+
+def test_trigrams_ignore_case_and_separators():
+    assert trigrams('Web-Prod') == trigrams('webprod')
+    assert '  w' in trigrams('web') and 'eb ' in trigrams('web')
+
+
+def test_exact_then_prefix_then_substring_then_fuzzy():
+    results = SearchIndex(OBJECTS).search('Web')
+    assert [result['match'] for result in results] == ['exact', 'prefix', 'prefix', 'prefix',
+                                                       'substring', 'substring', 'fuzzy']
+    # Within a tier, shorter names and earlier matches come first
+    assert names(results)[:6] == ['web', 'web-ds', 'webserver', 'web-prod-01', 'legacy-web', 'esx-web01.example.com']
+    assert names(results)[6] == 'weeb'
+    assert 0 < results[6]['similarity'] < 1
+
+
+def test_typos_find_the_closest_names():
+    results = SearchIndex(OBJECTS).search('webprod01')
+    assert results[0] == {'kind': 'vm', 'name': 'web-prod-01', 'vcenter': 'vc0', 'match': 'fuzzy',
+                          'similarity': 1.0}
+    assert SearchIndex(OBJECTS).search('webprod01', fuzzy=False) == []
+
+
+def test_kind_vcenter_and_limit_filters():
+    index = SearchIndex(OBJECTS)
+    assert names(index.search('web', kinds=('datastore', 'host'))) == ['web-ds', 'esx-web01.example.com']
+    assert names(index.search('web', vcenter='vc1', fuzzy=False)) == ['legacy-web']
+    assert len(index.search('web', limit=2)) == 2
+    assert index.search('   ') == []
+
+
+def test_duplicates_are_indexed_once():
+    assert len(SearchIndex(OBJECTS + OBJECTS[:2] + [('vm', 'vc0', '')])) == len(OBJECTS)
+
+
+def test_search_endpoint_follows_new_captures(workdir):
+    client = TestClient(vc_search.app)
+    publish_vm_snapshot('vm_details.json', {'vc0': [{'vm_name': 'web01', 'vm_id': 'vm-1'}]})
+    assert names(client.get('/search', params={'q': 'web'}).json()['results']) == ['web01']
+
+    get_inventory_store().replace_cluster_info({'vc0': [{'cluster_name': 'prod', 'hosts': [], 'networks': [],
+                                                         'datastores': [{'name': 'web-ds', 'moId': 'datastore-1'}]}]})
+    body = client.get('/search', params={'q': 'web', 'kind': 'datastore'}).json()
+    assert body['objects'] == 2
+    assert names(body['results']) == ['web-ds']
+    assert client.get('/search', params={'q': 'web', 'kind': 'cluster'}).status_code == 422
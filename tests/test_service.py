@@ -0,0 +1,25 @@
+import importlib
+import pytest
+import vc_collector
+import vc_service
+
+
+@pytest.fixture
+def api_service(monkeypatch):
+    monkeypatch.setenv('VC_SERVICE_ROLE', 'api')
+    yield importlib.reload(vc_service)
+    monkeypatch.delenv('VC_SERVICE_ROLE')
+    importlib.reload(vc_service)
+
+
+def paths(app):
+    return set(app.openapi()['paths'])
+
+
+def test_mutations_and_jobs_are_served_by_one_process(api_service):
+    stateful = {'/create-vm/', '/create-vms/bulk', '/delete-vm/', '/jobs', '/jobs/{job_id}', '/admission-stats'}
+    assert not stateful & paths(api_service.app)
+    assert '/search' in paths(api_service.app)
+    assert stateful <= paths(vc_collector.app)
+    assert '/collect-cluster-info' in paths(vc_collector.app)
+    assert '/search' not in paths(vc_collector.app)
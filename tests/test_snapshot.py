@@ -0,0 +1,111 @@
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fake_vcenter import FakeVCenter
+from vc_session_pool import session_pool
+from vc_vm_details import collect_router
+import vc_vm_index
+from vc_snapshot import Snapshot, SnapshotBuilder, SnapshotError, convert_json_snapshot, snapshot_path, write_snapshot
+from vc_vm_index import VMIndex, get_vm_index, publish_vm_snapshot
+
+
+def vm(name, moid, networks=(), datastores=(), ips=(), disks=(), **extra):
+    return {'vm_name': name, 'vm_id': moid, 'networks': list(networks), 'datastores': list(datastores),
+            'ip_addresses': list(ips), 'storage': [{'label': label, 'size_GB': size} for label, size in disks], **extra}
+
+
+ALL_VMS = {
+    'vc0': [
+        vm('web01', 'vm-1', ['vlan10'], ['ds-a'], ['10.0.0.1', 'fe80::1'], [('Hard disk 1', 40.0), ('Hard disk 2', 0.5)]),
+        vm('Wéb02', 'vm-2', ['vlan10', 'vlan20'], ['ds-a', 'ds-b'], [], [], power_state='poweredOff'),
+        vm('db01', 'vm-3'),
+    ],
+    'vc1': [],
+    'vc2': 'Connection failed',
+    'vc3': [vm('web01', 'vm-1', ['vlan10'], ['ds-c'], ['10.0.1.1'], [('Hard disk 1', 100.0)])],
+}
+
+
+def test_snapshot_reads_back_what_was_written(tmp_path):
+    path = str(tmp_path / 'vm_details.snap')
+    write_snapshot(path, ALL_VMS)
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 4
+    assert snapshot.to_dict() == ALL_VMS
+    assert list(snapshot.entries()) == [(server, record) for server, vms in ALL_VMS.items()
+                                        if isinstance(vms, list) for record in vms]
+    # The empty vCenter shares its start row with the one after it
+    assert [snapshot.vcenter_of(row) for row in range(4)] == ['vc0', 'vc0', 'vc0', 'vc3']
+    assert list(snapshot.iter_column('vm_name')) == ['web01', 'Wéb02', 'db01', 'web01']
+    snapshot.close()
+
+
+def test_lookups_match_between_the_snapshot_and_the_json(tmp_path):
+    path = str(tmp_path / 'vm_details.snap')
+    write_snapshot(path, ALL_VMS)
+    mapped = VMIndex.from_snapshot(Snapshot(path))
+    loaded = VMIndex(json.loads(json.dumps(ALL_VMS)))
+    for index in (mapped, loaded):
+        assert index.vm_count == 4
+        assert index.find_by_name('WEB01') == ('vc0', ALL_VMS['vc0'][0])
+        assert index.find_by_name('wéb02') == ('vc0', ALL_VMS['vc0'][1])
+        assert index.find_by_name('missing') is None
+        assert index.find_by_moid('vm-1') == [('vc0', ALL_VMS['vc0'][0]), ('vc3', ALL_VMS['vc3'][0])]
+        assert index.find_by_ip('fe80::1') == [('vc0', ALL_VMS['vc0'][0])]
+        assert [entry[1]['vm_id'] for entry in index.find_by_network('VLAN10')] == ['vm-1', 'vm-2', 'vm-1']
+        assert [entry[1]['vm_id'] for entry in index.find_by_datastore('ds-b')] == ['vm-2']
+        assert list(index.iter_names()) == [('vc0', 'web01'), ('vc0', 'Wéb02'), ('vc0', 'db01'), ('vc3', 'web01')]
+
+
+def test_builder_resets_a_vcenter_collected_again(tmp_path):
+    path = str(tmp_path / 'vm_details.snap')
+    builder = SnapshotBuilder(['vc0', 'vc1'])
+    builder.add('vc0', [vm('stale', 'vm-9')])
+    builder.add('vc1', [vm('db01', 'vm-3')])
+    builder.reset('vc0')
+    builder.add('vc0', [vm('web01', 'vm-1', ['vlan10'])])
+    builder.write(path)
+    assert Snapshot(path).to_dict() == {'vc0': [vm('web01', 'vm-1', ['vlan10'])], 'vc1': [vm('db01', 'vm-3')]}
+
+
+def test_convert_json_snapshot(tmp_path):
+    json_path = tmp_path / 'vcenters.json'
+    json_path.write_text(json.dumps(ALL_VMS))
+    assert Snapshot(convert_json_snapshot(str(json_path))).to_dict() == ALL_VMS
+
+
+def test_corrupt_snapshots_are_rejected(tmp_path):
+    for name, content in (('empty.snap', b''), ('short.snap', b'VCSNAP01'), ('other.snap', b'x' * 64)):
+        path = tmp_path / name
+        path.write_bytes(content)
+        with pytest.raises(SnapshotError):
+            Snapshot(str(path))
+
+
+def test_published_snapshot_is_served_from_the_binary_file(workdir, monkeypatch):
+    publish_vm_snapshot('vm_details.json', ALL_VMS)
+    # Another worker has no resident index and maps the file the collector wrote
+    monkeypatch.setattr(vc_vm_index, '_indexes', {})
+    index = get_vm_index('vm_details.json')
+    assert index._snapshot is not None
+    assert index._snapshot.file_path == snapshot_path('vm_details.json')
+    assert index.find_by_ip('10.0.1.1') == [('vc3', ALL_VMS['vc3'][0])]
+
+
+def test_streamed_capture_publishes_the_snapshot_and_index(workdir, vcenter_creds, monkeypatch):
+    fake = FakeVCenter(server='vc0').build_inventory(hosts=1, vms=3)
+    monkeypatch.setattr(session_pool, 'connect', fake.connect)
+    app = FastAPI()
+    app.include_router(collect_router)
+    with TestClient(app) as client:
+        lines = [json.loads(line) for line in client.get('/capture-vm-details/stream').iter_lines() if line]
+    session_pool.close_all()
+    # The fake vCenter answers for both servers
+    assert sorted(line['vcenter'] for line in lines) == ['vc0'] * 3 + ['vc1'] * 3
+    with open('vm_details.json') as file:
+        saved = json.load(file)
+    assert [vm['vm_name'] for vm in saved['vc1']] == ['dc0-cl0-vm0', 'dc0-cl0-vm1', 'dc0-cl0-vm2']
+    assert Snapshot(snapshot_path('vm_details.json')).to_dict() == saved
+    assert get_vm_index('vm_details.json').find_by_name('dc0-cl0-vm1') == ('vc0', saved['vc0'][1])
+    assert not [path.name for path in workdir.iterdir() if path.name.endswith('.part')]
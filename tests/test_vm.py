@@ -0,0 +1,51 @@
+import pytest
+from fastapi.testclient import TestClient
+from pyVmomi import vim
+from fake_vcenter import FakeVCenter
+from vc_object_cache import object_cache
+from vc_session_pool import session_pool
+import vm
+
+CREATE_REQUEST = {'datacenter_name': 'dc0', 'cluster_name': 'prod', 'datastore_name': 'ds-a',
+                  'template_name': 'centos', 'vm_name': 'web01', 'cpu': 2, 'memory': 4, 'disk_size_gb': 40,
+                  'network_name': 'vlan10'}
+
+
+def test_create_vm_on_an_unknown_vcenter_is_a_404(workdir, vcenter_creds):
+    client = TestClient(vm.app)
+    response = client.post('/create-vm/', json={**CREATE_REQUEST, 'vcenter_server': 'vc9'})
+    assert response.status_code == 404
+    assert response.json()['detail'] == "vCenter credentials not found"
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeVCenter(server='vc0').build_inventory(hosts=1, datastores=1)
+    fake.add_vm(fake.find_by_name(vim.Datacenter, 'dc0'), 'web01', disks_gb=[40] * 6)
+    monkeypatch.setattr(session_pool, 'connect', fake.connect)
+    # Names cached from another test's fake vCenter would point at its objects
+    object_cache.clear()
+    yield fake
+    session_pool.close_all()
+
+
+def reconfigure(disks):
+    request = vm.VMReconfigureRequest(vcenter_server='vc0', vm_name='web01', add_disks=[
+        {'disk_size_gb': 10, 'datastore_name': 'dc0-cl0-ds0'} for _ in range(disks)])
+    with session_pool.session({'server': 'vc0'}) as service_instance:
+        return vm.reconfigure_vm(service_instance, request)
+
+
+def test_new_disks_skip_the_controllers_unit_number(fake):
+    assert reconfigure(3) == "VM reconfigured successfully"
+    devices = fake.find_by_name(vim.VirtualMachine, 'web01').config.hardware.device
+    assert [device.unitNumber for device in devices if isinstance(device, vim.vm.device.VirtualDisk)] == \
+        [0, 1, 2, 3, 4, 5, 6, 8, 9]
+
+
+def test_disks_past_the_last_unit_number_are_refused(fake):
+    # Units 6 and 8 to 15 are free, so nine more disks fit and ten do not
+    assert vm.next_disk_unit_numbers(fake.find_by_name(vim.VirtualMachine, 'web01').config.hardware.device, 9)[-1] == 15
+    assert reconfigure(10) == "Not enough free unit numbers on the SCSI controller"
+    devices = fake.find_by_name(vim.VirtualMachine, 'web01').config.hardware.device
+    assert sum(isinstance(device, vim.vm.device.VirtualDisk) for device in devices) == 6
@@ -0,0 +1,275 @@
+from collections import deque
+from pyVmomi import vim, vmodl
+from vc_metrics import admission_rejections, admission_wait_seconds
+from vc_session_pool import POOL_MAX_SIZE
+import heapq
+import http.client
+import itertools
+import math
+import threading
+import time
+
+ADMISSION_INITIAL_TASKS = 4        # Tasks in flight per vCenter before anything has been observed
+ADMISSION_MIN_TASKS = 1
+ADMISSION_MAX_TASKS = 32
+ADMISSION_MAX_SESSIONS = POOL_MAX_SIZE   # Submits holding a session at once; more would only wait inside the pool
+ADMISSION_MAX_QUEUE = 500          # Waiting requests per vCenter before new ones are turned away with 429
+ADMISSION_LATENCY_FACTOR = 2.0     # Back off when submits take this many times longer than the baseline
+ADMISSION_LATENCY_SLACK = 0.25     # Seconds of slowdown ignored, so jitter on a fast vCenter does not count
+ADMISSION_ERROR_RATE = 0.2         # Back off when this share of recent outcomes failed
+ADMISSION_WINDOW = 20              # Recent outcomes the error rate is taken over
+ADMISSION_BACKOFF = 0.5            # Limit multiplier on each back-off
+ADMISSION_COOLDOWN = 5             # Seconds between back-offs, so one burst of failures halves the limit once
+ADMISSION_DEFAULT_TASK_SECONDS = 30
+
+# Lower goes first. Quick reconfigurations should not wait behind long clones, and deletes free capacity.
+ADMISSION_PRIORITIES = {
+    'delete-vm': 0,
+    'add-disk-to-vm': 1,
+    'remove-disk-from-vm': 1,
+    'add-network-to-vm': 1,
+    'remove-network-from-vm': 1,
+    'reconfigure-vm': 1,
+    'create-vm': 2,
+}
+ADMISSION_DEFAULT_PRIORITY = 1
+
+# Errors that mean vCenter is unreachable or struggling. Anything else (bad credentials, a missing
+# object, an invalid spec) is the request's own fault and must not shrink the admission limit.
+VCENTER_FAILURES = (OSError, http.client.HTTPException, vmodl.fault.HostCommunication, vmodl.fault.SystemError,
+                    vim.fault.HostConnectFault)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, server, queued, retry_after):
+        super().__init__(f"vCenter {server} has {queued} requests queued")
+        self.queued = queued
+        self.retry_after = retry_after
+
+
+class _VCenterState:
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0     # Admitted and not finished: submitting, or a task vCenter is running
+        self.sessions = 0      # Admitted and still submitting, so holding a pooled session
+        self.queue = []        # heap of (priority, sequence, key, operation, queued_at, run)
+        self.outcomes = deque(maxlen=ADMISSION_WINDOW)   # True for each failure
+        self.latency = None    # Smoothed submit latency
+        self.baseline = None   # Lowest submit latency seen, drifting up slowly as vCenter changes
+        self.task_seconds = ADMISSION_DEFAULT_TASK_SECONDS
+        self.backed_off_at = 0.0
+        self.admitted = self.rejected = 0
+
+
+class Ticket:
+    """
+    One admitted request. submitted() frees its session slot once vCenter has
+    the task; finished() frees the task slot when the task completes, and
+    release() frees both for a request that never started a task. attach()
+    records the job whose completion will call finished(); a ticket no job
+    owns is released when its request ends, however it ended.
+    """
+
+    def __init__(self, controller, server):
+        self.controller = controller
+        self.server = server
+        self.job_id = None
+        self._submitting = True
+        self._done = False
+
+    def attach(self, job_id):
+        self.job_id = job_id
+
+    def submitted(self, seconds):
+        if self._submitting:
+            self._submitting = False
+            self.controller._submitted(self.server, seconds)
+
+    def release(self, failed=False):
+        if self._submitting:
+            self._submitting = False
+            self.controller._submitted(self.server, None)
+        self._finish(None, failed)
+
+    def finished(self, job):
+        self._finish(job['finished_at'] - job['submitted_at'], job['status'] == 'error')
+
+    def _finish(self, task_seconds, failed):
+        if not self._done:
+            self._done = True
+            self.controller._finished(self.server, task_seconds, failed)
+
+
+class AdmissionController:
+    """
+    Per-vCenter admission for mutation requests.
+
+    A request is admitted while its vCenter has fewer than `limit` tasks in
+    flight and fewer than max_sessions submits holding a session; the rest
+    wait in a priority queue and are started on their own thread as slots
+    free up. The limit adapts per vCenter: it creeps up by about one for
+    every `limit` requests that complete cleanly while it is the bottleneck,
+    and is cut by ADMISSION_BACKOFF when submits slow down past
+    ADMISSION_LATENCY_FACTOR times their baseline or too many recent
+    outcomes failed. When the queue is full, callers are told when to retry.
+    """
+
+    def __init__(self, initial_limit=ADMISSION_INITIAL_TASKS, min_limit=ADMISSION_MIN_TASKS,
+                 max_limit=ADMISSION_MAX_TASKS, max_sessions=ADMISSION_MAX_SESSIONS, max_queue=ADMISSION_MAX_QUEUE):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._vcenters = {}   # server -> _VCenterState
+        self._sequence = itertools.count()
+
+    def _state(self, server):
+        state = self._vcenters.get(server)
+        if state is None:
+            state = self._vcenters[server] = _VCenterState(self.initial_limit)
+        return state
+
+    def _has_room(self, state):
+        return state.in_flight < max(int(state.limit), self.min_limit) and state.sessions < self.max_sessions
+
+    def _admit(self, server, state):
+        state.in_flight += 1
+        state.sessions += 1
+        state.admitted += 1
+        return Ticket(self, server)
+
+    def try_admit(self, server, operation=None):
+        """
+        Return a Ticket if the request may start now and nothing of equal or higher priority is waiting, else None.
+        """
+        priority = ADMISSION_PRIORITIES.get(operation, ADMISSION_DEFAULT_PRIORITY)
+        with self._lock:
+            state = self._state(server)
+            if self._has_room(state) and not (state.queue and state.queue[0][0] <= priority):
+                return self._admit(server, state)
+        return None
+
+    def enqueue(self, server, operation, key, run):
+        """
+        Queue run(ticket) to start on its own thread once admitted; returns
+        (queue position, estimated seconds until it starts).
+
+        Raises AdmissionRejected when the queue is full.
+        """
+        priority = ADMISSION_PRIORITIES.get(operation, ADMISSION_DEFAULT_PRIORITY)
+        with self._lock:
+            state = self._state(server)
+            if len(state.queue) >= self.max_queue:
+                state.rejected += 1
+                admission_rejections.inc(vcenter=server, operation=operation)
+                raise AdmissionRejected(server, len(state.queue), self._retry_after(state, len(state.queue)))
+            entry = (priority, next(self._sequence), key, operation, time.monotonic(), run)
+            heapq.heappush(state.queue, entry)
+            position = self._position(state, entry)
+            retry_after = self._retry_after(state, position)
+        # A slot may have freed up between try_admit and here
+        self._dispatch(server)
+        return position, retry_after
+
+    def queue_position(self, key):
+        """
+        (position, estimated seconds until start) of a queued request, or None once it has been admitted.
+        """
+        with self._lock:
+            for state in self._vcenters.values():
+                for entry in state.queue:
+                    if entry[2] == key:
+                        position = self._position(state, entry)
+                        return position, self._retry_after(state, position)
+        return None
+
+    def _position(self, state, entry):
+        # 1-based place in line; the queue is small enough to count
+        return sum(1 for other in state.queue if other[:2] < entry[:2]) + 1
+
+    def _retry_after(self, state, position):
+        # Each round of `limit` tasks takes about one task duration
+        rounds = math.ceil(position / max(int(state.limit), self.min_limit))
+        return max(1, math.ceil(rounds * state.task_seconds))
+
+    def _dispatch(self, server):
+        started = []
+        with self._lock:
+            state = self._state(server)
+            while state.queue and self._has_room(state):
+                _, _, _, operation, queued_at, run = heapq.heappop(state.queue)
+                admission_wait_seconds.observe(time.monotonic() - queued_at, vcenter=server, operation=operation)
+                started.append((run, self._admit(server, state)))
+        for run, ticket in started:
+            threading.Thread(target=self._run, args=(run, ticket), name='vc-admitted', daemon=True).start()
+
+    def _run(self, run, ticket):
+        try:
+            run(ticket)
+        except Exception as e:
+            print(f"Queued request for vCenter {ticket.server} failed with error: {e}")
+        finally:
+            # run() normally hands the ticket to a job; otherwise give its slots back, even after submitted()
+            if ticket.job_id is None:
+                ticket.release()
+
+    # Feedback from admitted requests
+
+    def _submitted(self, server, seconds):
+        # seconds is None for a submit that did not start a task; its latency says nothing
+        with self._lock:
+            state = self._state(server)
+            state.sessions -= 1
+            if seconds is not None:
+                state.latency = seconds if state.latency is None else state.latency * 0.8 + seconds * 0.2
+                if state.baseline is None or seconds < state.baseline:
+                    state.baseline = seconds
+                else:
+                    state.baseline += (seconds - state.baseline) * 0.01
+                if state.latency > max(state.baseline * ADMISSION_LATENCY_FACTOR,
+                                       state.baseline + ADMISSION_LATENCY_SLACK):
+                    self._back_off(state)
+        self._dispatch(server)
+
+    def _finished(self, server, task_seconds, failed):
+        with self._lock:
+            state = self._state(server)
+            saturated = state.in_flight >= int(state.limit)
+            state.in_flight -= 1
+            state.outcomes.append(failed)
+            if task_seconds is not None and not failed:
+                state.task_seconds = state.task_seconds * 0.8 + task_seconds * 0.2
+            failures = sum(state.outcomes)
+            if failed and len(state.outcomes) >= ADMISSION_WINDOW // 2 \
+                    and failures / len(state.outcomes) > ADMISSION_ERROR_RATE:
+                self._back_off(state)
+            elif not failed and saturated:
+                state.limit = min(self.max_limit, state.limit + 1 / state.limit)
+        self._dispatch(server)
+
+    def _back_off(self, state):
+        now = time.monotonic()
+        if now - state.backed_off_at >= ADMISSION_COOLDOWN:
+            state.backed_off_at = now
+            state.limit = max(self.min_limit, state.limit * ADMISSION_BACKOFF)
+
+    def stats(self):
+        with self._lock:
+            return {server: {
+                'limit': round(state.limit, 2),
+                'in_flight': state.in_flight,
+                'sessions': state.sessions,
+                'queued': len(state.queue),
+                'admitted': state.admitted,
+                'rejected': state.rejected,
+                'submit_seconds': round(state.latency, 3) if state.latency is not None else None,
+                'baseline_seconds': round(state.baseline, 3) if state.baseline is not None else None,
+                'task_seconds': round(state.task_seconds, 1),
+                'error_rate': round(sum(state.outcomes) / len(state.outcomes), 2) if state.outcomes else 0.0,
+            } for server, state in self._vcenters.items()}
+
+
+# Shared controller used by every mutation endpoint
+admission = AdmissionController()
@@ -0,0 +1,350 @@
+from pyVmomi import vim
+from vc_admission import admission, AdmissionRejected, VCENTER_FAILURES
+from vc_object_cache import object_cache
+from vc_session_pool import session_pool
+from vc_tasks import task_tracker, JOB_RETENTION
+from collections import Counter
+from functools import partial
+import threading
+import time
+import uuid
+
+BULK_MAX_PER_DATASTORE = 4   # Clones copying onto one datastore at the same time
+BULK_MAX_PER_HOST = 2        # Clones registering on one host at the same time
+
+def build_clone_spec(vm_creation_request, cluster, datastore, network, host=None):
+    """
+    Clone spec for a VMCreationRequest: placement, CPU/memory and one vmxnet3 NIC.
+    """
+    clone_spec = vim.vm.CloneSpec()
+
+    # Relocation spec; host is left to DRS unless the caller picked one
+    reloc_spec = vim.vm.RelocateSpec()
+    reloc_spec.datastore = datastore
+    reloc_spec.pool = cluster.resourcePool
+    if host is not None:
+        reloc_spec.host = host
+    clone_spec.location = reloc_spec
+
+    # Configuration spec (for customizing CPU, memory, etc.)
+    config_spec = vim.vm.ConfigSpec()
+    config_spec.numCPUs = vm_creation_request.cpu
+    config_spec.memoryMB = vm_creation_request.memory * 1024  # Convert GB to MB
+    config_spec.cpuHotAddEnabled = vm_creation_request.enable_cpu_hot_add
+    config_spec.memoryHotAddEnabled = vm_creation_request.enable_memory_hot_add
+
+    # Network configuration
+    nic_spec = vim.vm.device.VirtualDeviceSpec()
+    nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
+    nic_spec.device = vim.vm.device.VirtualVmxnet3()
+    nic_spec.device.backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo()
+    nic_spec.device.backing.network = network
+    nic_spec.device.backing.deviceName = network.name
+    nic_spec.device.connectable = vim.vm.device.VirtualDevice.ConnectInfo()
+    nic_spec.device.connectable.startConnected = True
+
+    # Add the network adapter to the clone spec
+    config_spec.deviceChange = [nic_spec]
+    clone_spec.config = config_spec
+    return clone_spec
+
+
+class InventoryResolver:
+    """
+    Resolves the names in a batch of creation requests against one vCenter.
+
+    load() resolves every distinct name in the batch up front through the
+    shared object cache: one call for the datacenters, clusters, datastores
+    and templates, and one per datacenter for the networks it scopes. A
+    batch of hundreds of VMs then plans without further lookups.
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self._objects = {}    # (vimtype, name) -> object, or None when absent
+        self._networks = {}   # (datacenter moId, name) -> network, or None when absent
+        self._hosts = {}      # cluster moId -> [host, ...]
+        self._folders = {}    # datacenter moId -> VM folder
+
+    def load(self, vm_creation_requests):
+        wanted = list(dict.fromkeys(
+            (vimtype, name) for request in vm_creation_requests
+            for vimtype, name in ((vim.Datacenter, request.datacenter_name), (vim.ComputeResource, request.cluster_name),
+                                  (vim.Datastore, request.datastore_name), (vim.VirtualMachine, request.template_name))))
+        found = object_cache.resolve(self.content, [([vimtype], name) for vimtype, name in wanted])
+        self._objects.update(zip(wanted, found))
+
+        networks = {}   # datacenter moId -> (datacenter, {network name: None})
+        for request in vm_creation_requests:
+            datacenter = self._objects[(vim.Datacenter, request.datacenter_name)]
+            if datacenter is not None:
+                networks.setdefault(datacenter._moId, (datacenter, {}))[1][request.network_name] = None
+        for datacenter_id, (datacenter, names) in networks.items():
+            found = object_cache.resolve(self.content, [([vim.Network], name) for name in names], scope=datacenter)
+            self._networks.update(((datacenter_id, name), network) for name, network in zip(names, found))
+
+    def get(self, vimtype, name):
+        if (vimtype, name) not in self._objects:
+            self._objects[(vimtype, name)] = object_cache.lookup(self.content, [vimtype], name)
+        return self._objects[(vimtype, name)]
+
+    def network(self, datacenter, network_name):
+        key = (datacenter._moId, network_name)
+        if key not in self._networks:
+            self._networks[key] = object_cache.lookup(self.content, [vim.Network], network_name, scope=datacenter)
+        return self._networks[key]
+
+    def hosts(self, cluster):
+        if cluster._moId not in self._hosts:
+            self._hosts[cluster._moId] = list(cluster.host)
+        return self._hosts[cluster._moId]
+
+    def folder(self, datacenter):
+        if datacenter._moId not in self._folders:
+            self._folders[datacenter._moId] = datacenter.vmFolder
+        return self._folders[datacenter._moId]
+
+    def plan(self, vm_creation_request):
+        """
+        Return (plan, error) for one request; plan holds the resolved objects.
+        """
+        datacenter = self.get(vim.Datacenter, vm_creation_request.datacenter_name)
+        if datacenter is None:
+            return None, f"Datacenter {vm_creation_request.datacenter_name} not found"
+        cluster = self.get(vim.ComputeResource, vm_creation_request.cluster_name)
+        if cluster is None:
+            return None, f"Cluster {vm_creation_request.cluster_name} not found"
+        datastore = self.get(vim.Datastore, vm_creation_request.datastore_name)
+        if datastore is None:
+            return None, f"Datastore {vm_creation_request.datastore_name} not found"
+        template_vm = self.get(vim.VirtualMachine, vm_creation_request.template_name)
+        if template_vm is None:
+            return None, f"Template {vm_creation_request.template_name} not found"
+        network = self.network(datacenter, vm_creation_request.network_name)
+        if network is None:
+            return None, f"Network {vm_creation_request.network_name} not found"
+        hosts = self.hosts(cluster)
+        if not hosts:
+            return None, f"Cluster {vm_creation_request.cluster_name} has no hosts"
+        return {'folder': self.folder(datacenter), 'cluster': cluster, 'datastore': datastore,
+                'template': template_vm, 'network': network, 'hosts': hosts}, None
+
+
+class ProvisioningBatch:
+    """
+    Clones a list of VMCreationRequests concurrently.
+
+    Items are started in request order whenever their datastore and at least
+    one host of their cluster are below the caps; an item blocked on a busy
+    datastore does not hold up items placed elsewhere. Each clone then goes
+    through the vCenter's admission controller like a single create-vm, so
+    the batch shares its vCenter's task limit and backs off with it. Each
+    clone is tracked as a regular job, and the batch records per-item status
+    and errors.
+    """
+
+    def __init__(self, vm_creation_requests, vcenters, max_per_datastore=BULK_MAX_PER_DATASTORE,
+                 max_per_host=BULK_MAX_PER_HOST, tracker=task_tracker, controller=admission):
+        self.batch_id = uuid.uuid4().hex
+        self.vcenters = vcenters   # server -> creds (None when creds.json has no entry)
+        self.max_per_datastore = max_per_datastore
+        self.max_per_host = max_per_host
+        self.tracker = tracker
+        self.controller = controller
+        self.requests = list(vm_creation_requests)
+        self.items = [{
+            'index': index,
+            'vm_name': request.vm_name,
+            'vcenter_server': request.vcenter_server,
+            'datastore': request.datastore_name,
+            'host': None,
+            'status': 'queued',
+            'job_id': None,
+            'result': None,
+            'error': None,
+        } for index, request in enumerate(self.requests)]
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._in_flight = Counter()   # (server, datastore or host moId) -> clones running
+        self._running = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f"vc-bulk-{self.batch_id[:8]}", daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.snapshot()
+
+    def snapshot(self):
+        with self._cond:
+            items = [dict(item) for item in self.items]
+            finished_at = self.finished_at
+        return {
+            'batch_id': self.batch_id,
+            'status': 'completed' if finished_at is not None else 'running',
+            'submitted_at': self.submitted_at,
+            'finished_at': finished_at,
+            'max_per_datastore': self.max_per_datastore,
+            'max_per_host': self.max_per_host,
+            'counts': dict(Counter(item['status'] for item in items)),
+            'items': items,
+        }
+
+    def run(self):
+        sessions = {}
+        try:
+            self._schedule(self._resolve(sessions))
+        except Exception as e:
+            print(f"Bulk provisioning batch {self.batch_id} failed with error: {e}")
+            with self._cond:
+                for item in self.items:
+                    if item['status'] == 'queued':
+                        self._fail(item, str(e))
+        finally:
+            # Clones still running keep their jobs; only the lookup sessions go back
+            for service_instance in sessions.values():
+                session_pool.release(service_instance)
+            with self._cond:
+                self.finished_at = time.time()
+
+    def _fail(self, item, error):
+        item['status'] = 'error'
+        item['error'] = error
+
+    def _resolve(self, sessions):
+        by_server = {}   # server -> its requests, in request order
+        for request in self.requests:
+            by_server.setdefault(request.vcenter_server, []).append(request)
+        resolvers = {}
+        for server, requests in by_server.items():
+            creds = self.vcenters.get(server)
+            if creds is None:
+                resolvers[server] = f"No credentials for vCenter {server}"
+                continue
+            try:
+                sessions[server] = session_pool.acquire(creds)
+            except Exception as e:
+                resolvers[server] = f"Failed to connect to vCenter: {str(e)}"
+                continue
+            resolvers[server] = InventoryResolver(session_pool.content(sessions[server]))
+            resolvers[server].load(requests)
+
+        pending = []
+        for item, request in zip(self.items, self.requests):
+            resolver = resolvers[request.vcenter_server]
+            if isinstance(resolver, str):
+                self._fail(item, resolver)
+                continue
+            plan, error = resolver.plan(request)
+            if error:
+                self._fail(item, error)
+                continue
+            pending.append((item, request, self.vcenters[request.vcenter_server], plan))
+        return pending
+
+    def _next_startable(self, pending):
+        for entry in pending:
+            item, request, creds, plan = entry
+            server = creds['server']
+            if self._in_flight[(server, plan['datastore']._moId)] >= self.max_per_datastore:
+                continue
+            # Least busy host with a free slot
+            free_hosts = [host for host in plan['hosts'] if self._in_flight[(server, host._moId)] < self.max_per_host]
+            if free_hosts:
+                return entry, min(free_hosts, key=lambda host: self._in_flight[(server, host._moId)])
+        return None, None
+
+    def _schedule(self, pending):
+        while True:
+            with self._cond:
+                while True:
+                    if not pending and not self._running:
+                        return
+                    entry, host = self._next_startable(pending)
+                    if entry is not None:
+                        break
+                    self._cond.wait()
+                pending.remove(entry)
+                self._reserve(entry, host, 1)
+            self._admit(entry, host)
+
+    def _reserve(self, entry, host, delta):
+        item, request, creds, plan = entry
+        self._in_flight[(creds['server'], plan['datastore']._moId)] += delta
+        self._in_flight[(creds['server'], host._moId)] += delta
+        self._running += delta
+        if delta > 0:
+            item['host'] = host.name
+        else:
+            self._cond.notify_all()
+
+    def _admit(self, entry, host):
+        # The item keeps its datastore and host slots while it waits for admission
+        item, request, creds, plan = entry
+        server = creds['server']
+        ticket = self.controller.try_admit(server, "create-vm")
+        if ticket is not None:
+            self._start(entry, host, ticket)
+            return
+        try:
+            self.controller.enqueue(server, "create-vm", f"{self.batch_id}:{item['index']}",
+                                    partial(self._start, entry, host))
+        except AdmissionRejected as e:
+            with self._cond:
+                self._fail(item, f"{e}; retry in {e.retry_after}s")
+                self._reserve(entry, host, -1)
+
+    def _start(self, entry, host, ticket):
+        item, request, creds, plan = entry
+        with self._cond:
+            item['status'] = 'running'
+        try:
+            clone_spec = build_clone_spec(request, plan['cluster'], plan['datastore'], plan['network'], host)
+            started = time.monotonic()
+            clone_task = plan['template'].Clone(folder=plan['folder'], name=request.vm_name, spec=clone_spec)
+            ticket.submitted(time.monotonic() - started)
+            job = self.tracker.submit(creds, "create-vm", request.vm_name, clone_task,
+                                      {"vm_name": request.vm_name, "status": "VM creation completed"},
+                                      on_finish=partial(self._finished, entry, host, ticket))
+        except Exception as e:
+            ticket.release(failed=isinstance(e, VCENTER_FAILURES))
+            with self._cond:
+                self._fail(item, f"VM creation failed: {str(e)}")
+                self._reserve(entry, host, -1)
+            return
+        ticket.attach(job['job_id'])
+        with self._cond:
+            item['job_id'] = job['job_id']
+
+    def _finished(self, entry, host, ticket, job):
+        item = entry[0]
+        ticket.finished(job)
+        with self._cond:
+            item['status'] = job['status']
+            item['result'] = job['result']
+            item['error'] = job['error']
+            self._reserve(entry, host, -1)
+
+
+_batches = {}   # batch_id -> ProvisioningBatch
+_batches_lock = threading.Lock()
+
+def start_provisioning_batch(vm_creation_requests, vcenters, max_per_datastore=BULK_MAX_PER_DATASTORE,
+                             max_per_host=BULK_MAX_PER_HOST):
+    batch = ProvisioningBatch(vm_creation_requests, vcenters, max_per_datastore, max_per_host)
+    cutoff = time.time() - JOB_RETENTION
+    with _batches_lock:
+        for batch_id in [batch_id for batch_id, old in _batches.items()
+                         if old.finished_at is not None and old.finished_at < cutoff]:
+            del _batches[batch_id]
+        _batches[batch.batch_id] = batch
+    return batch.start()
+
+def get_provisioning_batch(batch_id):
+    with _batches_lock:
+        return _batches.get(batch_id)
@@ -0,0 +1,262 @@
+from typing import Optional
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pyVmomi import vim
+import json
+import threading
+from vc_common import get_vcenters
+from vc_session_pool import session_pool
+from vc_fanout import fan_out, save_json_atomic
+from vc_generations import generation_counter
+from vc_metrics import install_metrics, snapshot_io_seconds
+from vc_property_collector import PropertyCollector, container_object_spec, object_properties, retrieve_properties
+
+CAPACITY_FILE = 'capacity.json'
+
+# Every summary the rollups need, fetched once per object in a single retrieval
+CAPACITY_PROPERTIES = {
+    vim.Datacenter: ['name'],
+    vim.Folder: ['parent'],
+    vim.ComputeResource: ['name', 'parent'],
+    vim.HostSystem: ['name', 'parent', 'datastore', 'network', 'hardware.cpuInfo.hz',
+                     'hardware.cpuInfo.numCpuCores', 'hardware.memorySize', 'summary.quickStats.overallCpuUsage',
+                     'summary.quickStats.overallMemoryUsage'],
+    vim.Datastore: ['name', 'parent', 'summary.capacity', 'summary.freeSpace', 'summary.accessible'],
+    vim.Network: ['name'],
+}
+
+router = APIRouter()
+collect_router = APIRouter()   # talks to vCenter; see vc_collector
+
+
+def collect_capacity(content):
+    """
+    Read every host, datastore and cluster of one vCenter with one paged
+    retrieval and return its inventory as plain dicts for rollup_capacity.
+    """
+    view, object_spec = container_object_spec(content, list(CAPACITY_PROPERTIES))
+    try:
+        filter_spec = PropertyCollector.FilterSpec(
+            objectSet=[object_spec],
+            propSet=[PropertyCollector.PropertySpec(type=vimtype, pathSet=paths)
+                     for vimtype, paths in CAPACITY_PROPERTIES.items()])
+        objects = {obj_content.obj._moId: (obj_content.obj, object_properties(obj_content))
+                   for obj_content in retrieve_properties(content, filter_spec)}
+    finally:
+        view.Destroy()
+
+    def datacenter_of(moId):
+        # Hosts and datastores sit under folders (and clusters) below their datacenter
+        while moId in objects:
+            obj, props = objects[moId]
+            if isinstance(obj, vim.Datacenter):
+                return props.get('name')
+            parent = props.get('parent')
+            moId = parent._moId if parent is not None else None
+        return None
+
+    hosts = []
+    datastores = []
+    for moId, (obj, props) in objects.items():
+        if isinstance(obj, vim.HostSystem):
+            parent = props.get('parent')
+            hz = props.get('hardware.cpuInfo.hz') or 0
+            cores = props.get('hardware.cpuInfo.numCpuCores') or 0
+            hosts.append({
+                'datacenter': datacenter_of(moId),
+                'cluster': objects[parent._moId][1].get('name')
+                           if isinstance(parent, vim.ClusterComputeResource) and parent._moId in objects else None,
+                'cpu_total_mhz': hz * cores / 1e6,
+                'cpu_used_mhz': props.get('summary.quickStats.overallCpuUsage') or 0,
+                'memory_total_bytes': props.get('hardware.memorySize') or 0,
+                'memory_used_bytes': (props.get('summary.quickStats.overallMemoryUsage') or 0) * 1024**2,
+                'datastores': [ds._moId for ds in props.get('datastore') or []],
+                'networks': [objects[net._moId][1].get('name') for net in props.get('network') or []
+                             if net._moId in objects],
+            })
+        elif isinstance(obj, vim.Datastore):
+            datastores.append({
+                'moId': moId,
+                'name': props.get('name'),
+                'datacenter': datacenter_of(moId),
+                'capacity_bytes': props.get('summary.capacity') or 0,
+                'free_bytes': props.get('summary.freeSpace') or 0,
+                'accessible': props.get('summary.accessible') is not False,
+            })
+    return {'hosts': hosts, 'datastores': datastores}
+
+
+class Rollup:
+    # Running totals for one scope; a datastore mounted on several hosts counts once
+    def __init__(self):
+        self.hosts = 0
+        self.cpu_total = self.cpu_used = 0.0
+        self.memory_total = self.memory_used = 0
+        self.datastores = {}   # moId -> (capacity, free)
+        self.networks = set()
+
+    def add_host(self, host, datastores):
+        self.hosts += 1
+        self.cpu_total += host['cpu_total_mhz']
+        self.cpu_used += host['cpu_used_mhz']
+        self.memory_total += host['memory_total_bytes']
+        self.memory_used += host['memory_used_bytes']
+        for moId in host['datastores']:
+            self.add_datastore(moId, datastores.get(moId))
+        self.networks.update(host.get('networks', []))
+
+    def add_datastore(self, key, datastore):
+        if datastore is not None and datastore['accessible']:
+            self.datastores[key] = (datastore['capacity_bytes'], datastore['free_bytes'])
+
+    def merge(self, other, prefix=''):
+        self.hosts += other.hosts
+        self.cpu_total += other.cpu_total
+        self.cpu_used += other.cpu_used
+        self.memory_total += other.memory_total
+        self.memory_used += other.memory_used
+        for key, value in other.datastores.items():
+            self.datastores[prefix + key] = value
+
+    def to_dict(self, **counts):
+        storage_total = sum(capacity for capacity, _ in self.datastores.values())
+        storage_free = sum(free for _, free in self.datastores.values())
+        return dict(counts, hosts=self.hosts, datastores=len(self.datastores),
+                    cpu_ghz=_usage(self.cpu_total / 1000, self.cpu_used / 1000),
+                    memory_gb=_usage(self.memory_total / 1024**3, self.memory_used / 1024**3),
+                    storage_gb=_usage(storage_total / 1024**3, (storage_total - storage_free) / 1024**3))
+
+def _usage(total, used):
+    return {'total': round(total, 2), 'used': round(used, 2), 'free': round(total - used, 2)}
+
+
+def rollup_capacity(all_capacity):
+    """
+    Precompute totals for the whole estate and for every vCenter, datacenter
+    and cluster from {server: collect_capacity(...)}.
+
+    Scopes are flat maps keyed "server", "server/datacenter" and
+    "server/datacenter/cluster", so serving one is a dict lookup. The
+    placement map has each cluster's free CPU and memory with its datastores
+    (most free first) and networks, for vc_placement.
+    """
+    total = Rollup()
+    rollups = {'vcenters': {}, 'datacenters': {}, 'clusters': {}, 'placement': {}}
+    cluster_counts = {}
+    for server, capacity in all_capacity.items():
+        if not isinstance(capacity, dict):
+            continue   # vCenter that failed to collect
+        datastores = {datastore['moId']: datastore for datastore in capacity['datastores']}
+        vcenter = Rollup()
+        datacenters = {}
+        clusters = {}
+        for host in capacity['hosts']:
+            datacenter = datacenters.setdefault(host['datacenter'], Rollup())
+            datacenter.add_host(host, datastores)
+            if host['cluster'] is not None:
+                clusters.setdefault((host['datacenter'], host['cluster']), Rollup()).add_host(host, datastores)
+        # Datastores no host mounts still count towards their datacenter
+        for datastore in capacity['datastores']:
+            datacenters.setdefault(datastore['datacenter'], Rollup()).add_datastore(datastore['moId'], datastore)
+        for (datacenter_name, cluster_name), cluster in clusters.items():
+            key = f"{server}/{datacenter_name}/{cluster_name}"
+            rollups['clusters'][key] = totals = cluster.to_dict()
+            rollups['placement'][key] = {
+                'vcenter_server': server, 'datacenter_name': datacenter_name, 'cluster_name': cluster_name,
+                'cpu_free_ghz': totals['cpu_ghz']['free'], 'memory_free_gb': totals['memory_gb']['free'],
+                'datastores': sorted(({'name': datastores[moId]['name'], 'free_gb': round(free / 1024**3, 2),
+                                       'capacity_gb': round(capacity / 1024**3, 2)}
+                                      for moId, (capacity, free) in cluster.datastores.items()),
+                                     key=lambda datastore: -datastore['free_gb']),
+                'networks': sorted(cluster.networks),
+            }
+            cluster_counts[(server, datacenter_name)] = cluster_counts.get((server, datacenter_name), 0) + 1
+        for datacenter_name, datacenter in datacenters.items():
+            vcenter.merge(datacenter)
+            rollups['datacenters'][f"{server}/{datacenter_name}"] = datacenter.to_dict(
+                clusters=cluster_counts.get((server, datacenter_name), 0))
+        rollups['vcenters'][server] = vcenter.to_dict(clusters=len(clusters), datacenters=len(datacenters))
+        # moIds are only unique within a vCenter
+        total.merge(vcenter, prefix=f"{server}/")
+    rollups['total'] = total.to_dict(vcenters=len(rollups['vcenters']), clusters=len(rollups['clusters']),
+                                     datacenters=len(rollups['datacenters']))
+    return rollups
+
+
+_rollups = None   # (generation, rollups)
+_rollups_lock = threading.Lock()
+
+def load_capacity(file_path=CAPACITY_FILE):
+    try:
+        with snapshot_io_seconds.time(file=file_path, operation='load'):
+            with open(file_path, 'r') as file:
+                return json.load(file)
+    except FileNotFoundError:
+        print(f"{file_path} was not found; capacity is empty until the next /collect-capacity.")
+    except json.JSONDecodeError:
+        print(f"Error decoding JSON from {file_path}; capacity is empty until the next /collect-capacity.")
+    return rollup_capacity({})
+
+def get_capacity():
+    """
+    Return the resident rollups, reloading them when another process published newer ones.
+    """
+    global _rollups
+    generation = generation_counter(CAPACITY_FILE).value()
+    cached = _rollups
+    if cached is None or cached[0] != generation:
+        with _rollups_lock:
+            cached = _rollups
+            if cached is None or cached[0] != generation:
+                cached = _rollups = (generation, load_capacity())
+    return cached[1]
+
+def publish_capacity(rollups):
+    global _rollups
+    save_json_atomic(CAPACITY_FILE, rollups)
+    with _rollups_lock:
+        _rollups = (generation_counter(CAPACITY_FILE).bump(), rollups)
+
+
+@collect_router.get("/collect-capacity", tags=["Clusters"])
+async def collect_capacity_rollups():
+    vcenters = get_vcenters()
+
+    def collect(vcenter):
+        with session_pool.session(vcenter) as service_instance:
+            return collect_capacity(session_pool.content(service_instance))
+
+    all_capacity = await fan_out(vcenters, collect, 'Connection failed')
+    rollups = rollup_capacity(all_capacity)
+    await run_in_threadpool(publish_capacity, rollups)
+    return rollups['total']
+
+@router.get("/capacity", tags=["Clusters"])
+async def capacity(vcenter: Optional[str] = None, datacenter: Optional[str] = None, cluster: Optional[str] = None):
+    """
+    CPU, memory and storage totals, used and free, for the whole estate or
+    one vCenter, datacenter or cluster, as of the last /collect-capacity.
+    Shared datastores are counted once per scope.
+    """
+    rollups = get_capacity()
+    if cluster is not None:
+        if vcenter is None or datacenter is None:
+            raise HTTPException(status_code=400, detail="cluster needs vcenter and datacenter")
+        totals = rollups['clusters'].get(f"{vcenter}/{datacenter}/{cluster}")
+    elif datacenter is not None:
+        if vcenter is None:
+            raise HTTPException(status_code=400, detail="datacenter needs vcenter")
+        totals = rollups['datacenters'].get(f"{vcenter}/{datacenter}")
+    elif vcenter is not None:
+        totals = rollups['vcenters'].get(vcenter)
+    else:
+        totals = rollups['total']
+    if totals is None:
+        raise HTTPException(status_code=404, detail="No capacity recorded for that scope")
+    return {"vcenter": vcenter, "datacenter": datacenter, "cluster": cluster, **totals}
+
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(collect_router)
+app.include_router(router)
+install_metrics(app)
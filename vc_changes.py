@@ -0,0 +1,192 @@
+from typing import Optional
+from fastapi import APIRouter, FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from vc_inventory_store import QUERY_MAX_LIMIT, object_key
+from vc_metrics import install_metrics
+
+CHANGES_DB_FILE = 'changes.db'
+CHANGES_RETENTION = 500000   # Change rows kept; consumers further behind must re-read the full snapshot
+CHANGES_DEFAULT_LIMIT = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS record_hash (
+    source TEXT NOT NULL,
+    vcenter TEXT NOT NULL,
+    key TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    free_gb REAL,
+    PRIMARY KEY (source, vcenter, key)
+);
+CREATE TABLE IF NOT EXISTS change (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    vcenter TEXT NOT NULL,
+    key TEXT NOT NULL,
+    change TEXT NOT NULL,
+    record TEXT,
+    free_gb_delta REAL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS change_source ON change (source, version);
+"""
+
+router = APIRouter()
+
+def record_hash(record):
+    # Key order in a capture is stable, but sort anyway so equal records always hash equal
+    return hashlib.blake2b(json.dumps(record, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+class ChangeLog:
+    """
+    Versioned feed of what changed between inventory captures.
+
+    Every capture is diffed against the hashes of the previous one, so only
+    added, removed and changed records are written; each change gets the
+    next version number. Datastore changes also carry the free-space delta.
+    Hashes and changes live in SQLite so every worker serves the same feed.
+    """
+
+    def __init__(self, path=CHANGES_DB_FILE, retention=CHANGES_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            db = self.connection()
+            db.executescript(SCHEMA)
+            db.commit()
+
+    def connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    # Writes
+
+    def record(self, source, entries, free_gb=None):
+        """
+        Diff a complete capture, given as (vcenter, key, record) triples, against the previous one.
+
+        free_gb(record), if given, is tracked per key so changes carry the delta.
+        Returns the number of changes written.
+        """
+        now = time.time()
+        with self._write_lock:
+            db = self.connection()
+            with db:
+                rows = db.execute("SELECT vcenter, key, hash, free_gb FROM record_hash WHERE source = ?", (source,))
+                previous = {(row['vcenter'], row['key']): (row['hash'], row['free_gb']) for row in rows}
+                changes = []
+                hashes = []
+                for vcenter, key, record in entries:
+                    digest = record_hash(record)
+                    free = free_gb(record) if free_gb is not None else None
+                    hashes.append((source, vcenter, key, digest, free))
+                    old = previous.pop((vcenter, key), None)
+                    if old is None:
+                        changes.append((source, vcenter, key, 'added', json.dumps(record), None, now))
+                    elif old[0] != digest:
+                        delta = free - old[1] if free is not None and old[1] is not None else None
+                        changes.append((source, vcenter, key, 'changed', json.dumps(record), delta, now))
+                for vcenter, key in previous:
+                    changes.append((source, vcenter, key, 'removed', None, None, now))
+                db.executemany("INSERT INTO change (source, vcenter, key, change, record, free_gb_delta, at) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)", changes)
+                db.execute("DELETE FROM record_hash WHERE source = ?", (source,))
+                db.executemany("INSERT OR REPLACE INTO record_hash (source, vcenter, key, hash, free_gb) "
+                               "VALUES (?, ?, ?, ?, ?)", hashes)
+                db.execute("DELETE FROM change WHERE version <= (SELECT MAX(version) FROM change) - ?",
+                           (self.retention,))
+        return len(changes)
+
+    def record_vms(self, source, entries):
+        # VMs are keyed by moId where the capture has one, by name otherwise
+        self.record(source, ((vcenter, vm.get('vm_id') or vm['vm_name'], vm) for vcenter, vm in entries))
+
+    def record_datastores(self, all_cluster_info):
+        """
+        Record datastore changes from a /collect-cluster-info capture; shared datastores count once.
+
+        Datastores are keyed by moId, since datacenters can reuse a name.
+        """
+        datastores = {}
+        for server, clusters in all_cluster_info.items():
+            if not isinstance(clusters, list):
+                continue   # vCenter that failed to collect
+            for cluster in clusters:
+                for datastore in cluster['datastores']:
+                    datastores.setdefault((server, object_key(datastore, 'name')), datastore)
+        self.record('datastores', ((server, key, datastore) for (server, key), datastore in datastores.items()),
+                    free_gb=lambda datastore: datastore['freeSpace_gb'])
+
+    # Reads
+
+    def versions(self):
+        row = self.connection().execute("SELECT MIN(version) AS oldest, MAX(version) AS latest FROM change").fetchone()
+        return row['oldest'] or 0, row['latest'] or 0
+
+    def changes(self, since=0, source=None, limit=CHANGES_DEFAULT_LIMIT):
+        query = "SELECT * FROM change WHERE version > ?"
+        params = [since]
+        if source is not None:
+            query += " AND source = ?"
+            params.append(source)
+        query += " ORDER BY version LIMIT ?"
+        params.append(limit)
+        return [{
+            'version': row['version'],
+            'source': row['source'],
+            'vcenter': row['vcenter'],
+            'key': row['key'],
+            'change': row['change'],
+            'record': json.loads(row['record']) if row['record'] is not None else None,
+            **({'free_gb_delta': row['free_gb_delta']} if row['free_gb_delta'] is not None else {}),
+            'at': row['at'],
+        } for row in self.connection().execute(query, params)]
+
+
+_change_log = None
+_change_log_lock = threading.Lock()
+
+def get_change_log(path=CHANGES_DB_FILE):
+    global _change_log
+    if _change_log is None:
+        with _change_log_lock:
+            if _change_log is None:
+                _change_log = ChangeLog(path)
+    return _change_log
+
+@router.get("/changes", tags=["VM"])
+async def changes(since: int = Query(0, ge=0), source: Optional[str] = None,
+                  limit: int = Query(CHANGES_DEFAULT_LIMIT, ge=1, le=QUERY_MAX_LIMIT)):
+    """
+    Changes after version `since`, oldest first. Pass the returned version back
+    as since for the next call; more is true when the page was full.
+
+    source is the capture: vm_details, vcenters or datastores.
+    """
+    change_log = get_change_log()
+    oldest, latest = await run_in_threadpool(change_log.versions)
+    if since < oldest - 1:
+        raise HTTPException(status_code=410, detail=f"Changes before version {oldest} were discarded; "
+                                                    "re-read the full snapshot and continue from version "
+                                                    f"{latest}")
+    entries = await run_in_threadpool(change_log.changes, since, source, limit)
+    # With nothing newer, jump to latest: no change of this source can be hiding before it
+    version = entries[-1]['version'] if entries else max(since, latest)
+    return {"version": version, "latest": latest, "more": len(entries) == limit, "changes": entries}
+
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(router)
+install_metrics(app)
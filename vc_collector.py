@@ -0,0 +1,63 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import json
+from vc_common import load_credentials, credentials
+from vc_session_pool import session_pool
+from vc_inventory_sync import inventory_sync
+from vc_metrics import install_metrics
+from vc_tasks import jobs_router
+from vc_vm_details import collect_router as vm_details_collect_router
+import vc_capacity
+import vc_heirarichal_data
+import vc_json
+import vc_vm_cluster_details
+import vm
+
+# The one process that owns vCenter sessions and the inventory in a multi-worker
+# deployment: run with `uvicorn vc_collector:app --port 8001` (a single worker).
+# It keeps vm_details.json current through the inventory sync, recaptures the rest
+# every COLLECT_INTERVAL, and publishes snapshots whose generation counters tell the
+# API workers (VC_SERVICE_ROLE=api, see vc_service) to remap them. It also serves
+# the mutation endpoints and /jobs, whose queues and job state live in this process.
+
+COLLECT_INTERVAL = 3600   # Seconds between full cluster, hierarchy, capacity and VM id captures
+
+async def collect_periodically():
+    collections = [vc_json.capture_vms, vc_vm_cluster_details.collect_cluster_info,
+                   vc_heirarichal_data.collect_detailed_hierarchical_info, vc_capacity.collect_capacity_rollups]
+    while True:
+        for collect in collections:
+            try:
+                await collect()
+            except Exception as e:
+                print(f"Scheduled {collect.__name__} failed with error: {e}")
+        await asyncio.sleep(COLLECT_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app):
+    try:
+        vcenters = load_credentials()
+        print(f"Loaded credentials for {len(vcenters)} vCenters from {credentials.source}")
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Failed to load {credentials.source} with error: {e}")
+        vcenters = []
+    inventory_sync.start(vcenters)
+    collector = asyncio.create_task(collect_periodically())
+    yield
+    collector.cancel()
+    await run_in_threadpool(inventory_sync.stop)
+    await run_in_threadpool(session_pool.close_all)
+    credentials.stop_watching()
+
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(vm.router)
+app.include_router(jobs_router)
+app.include_router(vm_details_collect_router)
+app.include_router(vc_heirarichal_data.collect_router)
+app.include_router(vc_vm_cluster_details.collect_router)
+app.include_router(vc_capacity.collect_router)
+app.include_router(vc_json.collect_router, prefix="/vm-ids")
+install_metrics(app)
@@ -0,0 +1,141 @@
+import json
+import os
+import ssl
+import threading
+
+CREDS_FILE = 'creds.json'   # [{"server": ..., "user": ..., "password": ...}, ...]
+CREDS_ENV_VAR = 'VC_CREDS_JSON'        # The same list inline, e.g. injected by the orchestrator
+CREDS_FILE_ENV_VAR = 'VC_CREDS_FILE'   # Path of a mounted secrets file in the creds.json format
+CREDS_POLL_INTERVAL = 5                # Seconds between checks of the credentials file
+
+# Function to create an SSL context that does not verify SSL certificates
+def get_ssl_context():
+    context = None
+    if hasattr(ssl, '_create_unverified_context'):
+        context = ssl._create_unverified_context()
+    return context
+
+def load_vcenters_from_json(file_path):
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+
+class CredentialsRegistry:
+    """
+    vCenter credentials parsed once and kept as a list and a dict by server.
+
+    The source is the VC_CREDS_JSON environment variable if set, otherwise
+    the file named by VC_CREDS_FILE (a secrets mount) or creds.json. A file
+    source is watched and reloaded when it changes; both views are swapped in
+    with one assignment, so readers never see a half-loaded registry and a
+    file that fails to parse leaves the previous credentials in place.
+    """
+
+    def __init__(self, file_path=None, poll_interval=CREDS_POLL_INTERVAL):
+        self.file_path = file_path
+        self.poll_interval = poll_interval
+        self._state = None       # (vcenters in file order, {server: creds}, file signature)
+        self._lock = threading.Lock()
+        self._rejected = None    # signature of the last file that failed to load, not retried until it changes
+        self._watcher = None
+        self._stop = threading.Event()
+
+    @property
+    def source(self):
+        if self.file_path is None and os.environ.get(CREDS_ENV_VAR):
+            return f"${CREDS_ENV_VAR}"
+        return self.file_path or os.environ.get(CREDS_FILE_ENV_VAR) or CREDS_FILE
+
+    def load(self):
+        """
+        (Re)read the credentials now; raises if the source is missing or not valid JSON.
+        """
+        with self._lock:
+            source = self.source
+            if source.startswith('$'):
+                vcenters, signature = json.loads(os.environ[CREDS_ENV_VAR]), None
+            else:
+                signature = self._signature(source)
+                vcenters = load_vcenters_from_json(source)
+            self._state = (list(vcenters), {creds['server']: creds for creds in vcenters}, signature)
+        return self._state[0]
+
+    def vcenters(self):
+        return self._loaded()[0]
+
+    def get(self, server):
+        return self._loaded()[1].get(server)
+
+    def _loaded(self):
+        state = self._state
+        if state is None:
+            # Modules run as standalone apps never call load(); read the source on first use
+            self.load()
+            state = self._state
+        return state
+
+    def _signature(self, file_path):
+        # Secrets mounts are swapped by symlink, so compare the resolved file too
+        stat = os.stat(file_path)
+        return (os.path.realpath(file_path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def reload_if_changed(self):
+        state = self._state
+        source = self.source
+        if state is None or source.startswith('$'):
+            return False
+        try:
+            signature = self._signature(source)
+        except OSError:
+            # Mid-swap or removed; keep serving what we have and look again next time
+            return False
+        if signature == state[2] or signature == self._rejected:
+            return False
+        try:
+            self.load()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self._rejected = signature
+            print(f"Failed to reload {source} with error: {e}; keeping the previous credentials")
+            return False
+        print(f"Reloaded credentials for {len(self._state[0])} vCenters from {source}")
+        return True
+
+    def start_watching(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch_loop, name='vc-creds-watcher', daemon=True)
+            self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            self.reload_if_changed()
+
+
+credentials = CredentialsRegistry()
+
+def load_credentials():
+    """
+    Load the credentials and start watching them; called from the service lifespan.
+    """
+    vcenters = credentials.load()
+    credentials.start_watching()
+    return vcenters
+
+def get_vcenters():
+    """
+    Return the vCenter credentials list, in creds.json order.
+    """
+    return credentials.vcenters()
+
+def load_vcenter_creds_for_server(vcenter_server: str):
+    try:
+        return credentials.get(vcenter_server)
+    except FileNotFoundError:
+        print(f"The {credentials.source} file was not found.")
+    except json.JSONDecodeError:
+        print(f"Error decoding JSON from {credentials.source}.")
+
+    return None
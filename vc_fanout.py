@@ -0,0 +1,254 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from vc_metrics import snapshot_io_seconds, record_error
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+
+FANOUT_MAX_CONCURRENCY = 8   # vCenters collected at the same time
+FANOUT_TIMEOUT = 600         # Seconds allowed for a single vCenter
+STREAM_CHUNK_SIZE = 500      # Items handed from a collector thread to the response at a time
+
+# pyVmomi calls block, so collectors run on a dedicated pool rather than the event loop.
+# Timed-out collectors keep their thread until vCenter answers, hence the headroom.
+_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_CONCURRENCY * 2, thread_name_prefix='vc-fanout')
+
+def run_in_fanout_pool(loop, function, *args):
+    # Carry the request's context (metrics operation label) into the worker thread
+    return loop.run_in_executor(_executor, contextvars.copy_context().run, function, *args)
+
+def save_json_atomic(file_path, data):
+    # Write next to the target and rename, so readers never see a half-written file
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with snapshot_io_seconds.time(file=os.path.basename(file_path), operation='save'):
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file, indent=4)
+        os.replace(tmp_path, file_path)
+
+async def fan_out(vcenters, collect, failed_result, on_progress=None,
+                  max_concurrency=FANOUT_MAX_CONCURRENCY, timeout=FANOUT_TIMEOUT):
+    """
+    Run collect(vcenter) for every vCenter concurrently and return {server: result}.
+
+    Results are always keyed in creds.json order, whatever order the vCenters
+    finish in. A vCenter that fails or exceeds the timeout gets failed_result.
+    on_progress, if given, is called with the ordered partial results each time
+    a vCenter finishes.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    progress_lock = asyncio.Lock()
+    servers = [vcenter['server'] for vcenter in vcenters]
+    results = {}
+
+    def ordered():
+        return {server: results[server] for server in servers if server in results}
+
+    async def run(vcenter):
+        async with semaphore:
+            try:
+                result = await asyncio.wait_for(run_in_fanout_pool(loop, collect, vcenter), timeout)
+            except asyncio.TimeoutError:
+                print(f"Timed out after {timeout}s collecting from vCenter {vcenter['server']}")
+                record_error(vcenter['server'])
+                result = failed_result
+            except Exception as e:
+                print(f"Failed to collect from vCenter {vcenter['server']} with error: {e}")
+                record_error(vcenter['server'])
+                result = failed_result
+        results[vcenter['server']] = result
+        if on_progress is not None:
+            async with progress_lock:
+                await loop.run_in_executor(None, on_progress, ordered())
+
+    await asyncio.gather(*(run(vcenter) for vcenter in vcenters))
+    return ordered()
+
+
+async def fan_out_first(vcenters, search, max_concurrency=FANOUT_MAX_CONCURRENCY, timeout=FANOUT_TIMEOUT):
+    """
+    Run search(vcenter, cancelled) for every vCenter concurrently and return
+    (server, result) for the first one that finds something, or None.
+
+    A search reports a miss by returning None. Once a hit comes back,
+    searches still waiting for a slot never start, and running ones see the
+    cancelled event so they can stop before their next vCenter call. A
+    vCenter that fails or exceeds the timeout counts as a miss.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    cancelled = threading.Event()
+
+    async def run(vcenter):
+        async with semaphore:
+            if cancelled.is_set():
+                return None
+            try:
+                result = await asyncio.wait_for(run_in_fanout_pool(loop, search, vcenter, cancelled), timeout)
+            except asyncio.TimeoutError:
+                print(f"Timed out after {timeout}s searching vCenter {vcenter['server']}")
+                record_error(vcenter['server'])
+                return None
+            except Exception as e:
+                print(f"Failed to search vCenter {vcenter['server']} with error: {e}")
+                record_error(vcenter['server'])
+                return None
+            if result is None:
+                return None
+            # Set before the slot is released, so a search waiting for it does not start
+            cancelled.set()
+        return vcenter['server'], result
+
+    tasks = [asyncio.ensure_future(run(vcenter)) for vcenter in vcenters]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            hit = await next_done
+            if hit is not None:
+                return hit
+        return None
+    finally:
+        # Threads already talking to a vCenter finish on their own; their results are ignored
+        cancelled.set()
+        for task in tasks:
+            task.cancel()
+
+
+class StreamCancelled(Exception):
+    pass
+
+async def fan_out_stream(vcenters, generate, max_concurrency=FANOUT_MAX_CONCURRENCY, timeout=FANOUT_TIMEOUT,
+                         chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Run the generator generate(vcenter) for every vCenter concurrently and
+    yield (server, items, error) chunks as they are produced.
+
+    Collectors block once a few chunks are waiting, so memory stays bounded
+    by the queue rather than the inventory size. A vCenter that fails or runs
+    past the timeout yields a final chunk with the error. If the consumer
+    stops early, the collectors are told to stop at their next item.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    queue = asyncio.Queue(maxsize=max_concurrency * 2)
+    cancelled = threading.Event()
+
+    def put(message):
+        future = asyncio.run_coroutine_threadsafe(queue.put(message), loop)
+        while True:
+            try:
+                return future.result(0.5)
+            except FutureTimeoutError:
+                if cancelled.is_set():
+                    future.cancel()
+                    raise StreamCancelled()
+
+    def produce(vcenter):
+        server = vcenter['server']
+        deadline = time.monotonic() + timeout
+        items = generate(vcenter)
+        chunk = []
+        try:
+            for item in items:
+                if cancelled.is_set():
+                    return
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out after {timeout}s")
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    put((server, chunk, None))
+                    chunk = []
+            if chunk:
+                put((server, chunk, None))
+        except StreamCancelled:
+            pass
+        except Exception as e:
+            print(f"Failed to collect from vCenter {server} with error: {e}")
+            record_error(server)
+            try:
+                put((server, [], str(e)))
+            except StreamCancelled:
+                pass
+        finally:
+            items.close()
+
+    async def run(vcenter):
+        async with semaphore:
+            await run_in_fanout_pool(loop, produce, vcenter)
+
+    async def finish():
+        await asyncio.gather(*(run(vcenter) for vcenter in vcenters))
+        await queue.put(None)
+
+    finisher = asyncio.ensure_future(finish())
+    try:
+        while True:
+            message = await queue.get()
+            if message is None:
+                break
+            yield message
+    finally:
+        cancelled.set()
+        if not finisher.done():
+            finisher.cancel()
+
+
+class SnapshotStreamWriter:
+    """
+    Writes a {server: [item, ...]} snapshot without holding it in memory.
+
+    Items are appended to one part file per server as they arrive, and
+    commit() stitches the parts into the target file in the given server
+    order and swaps it in atomically. Readers keep seeing the previous
+    snapshot until then.
+    """
+
+    def __init__(self, file_path, servers):
+        self.file_path = file_path
+        self.servers = list(servers)
+        self._prefix = f"{file_path}.{os.getpid()}.{threading.get_ident()}"
+        self._parts = {server: open(f"{self._prefix}.{index}.part", 'w+') for index, server in enumerate(self.servers)}
+
+    def add(self, server, items):
+        part = self._parts[server]
+        for item in items:
+            part.write(json.dumps(item) + '\n')
+
+    def reset(self, server):
+        # A vCenter that failed part-way is recorded as empty, as fan_out does
+        part = self._parts[server]
+        part.seek(0)
+        part.truncate()
+
+    def commit(self):
+        with snapshot_io_seconds.time(file=os.path.basename(self.file_path), operation='save'):
+            self._stitch()
+        self.close()
+
+    def _stitch(self):
+        tmp_path = f"{self._prefix}.tmp"
+        with open(tmp_path, 'w') as file:
+            file.write('{\n')
+            for index, server in enumerate(self.servers):
+                part = self._parts[server]
+                part.flush()
+                part.seek(0)
+                file.write(f"    {json.dumps(server)}: [")
+                separator = '\n        '
+                for line in part:
+                    file.write(separator + line.rstrip('\n'))
+                    separator = ',\n        '
+                file.write('\n    ]' if separator != '\n        ' else ']')
+                file.write(',\n' if index < len(self.servers) - 1 else '\n')
+            file.write('}\n')
+        os.replace(tmp_path, self.file_path)
+
+    def close(self):
+        for index, part in enumerate(self._parts.values()):
+            part.close()
+            try:
+                os.remove(f"{self._prefix}.{index}.part")
+            except FileNotFoundError:
+                pass
+        self._parts = {}
@@ -1,51 +1,77 @@
-from fastapi import FastAPI, HTTPException
-from pyVim.connect import SmartConnect, Disconnect
+from fastapi import APIRouter, FastAPI, HTTPException
 from pyVmomi import vim
-import ssl
-import json
+import threading
+import time
+from vc_common import get_vcenters
+from vc_session_pool import session_pool
+from vc_object_cache import object_cache
+from vc_fanout import fan_out_first
+from vc_metrics import install_metrics
 
-app = FastAPI()
+router = APIRouter()
+
+FIND_VM_CACHE_TTL = 30            # Seconds a search result, hit or miss, is reused
+FIND_VM_CACHE_MAX_ENTRIES = 10000
 
-# Function to load vCenters from a JSON file
-def load_vcenters_from_json(file_path):
-    with open(file_path, 'r') as file:
-        return json.load(file)
+_find_cache = {}   # vm_name -> (vCenter server or None, expires)
+_find_cache_lock = threading.Lock()
 
-# Path to the JSON file containing vCenter details
-VCENTER_JSON_FILE = 'creds.json'
+def search_vcenter(vcenter, vm_name, cancelled):
+    """
+    Return the moId of the VM named vm_name on one vCenter, or None.
 
-# Load vCenters into a variable
-VCENTERS = load_vcenters_from_json(VCENTER_JSON_FILE)
+    Only VM names are retrieved, through the shared object cache, instead of
+    walking every VM object.
+    """
+    with session_pool.session(vcenter) as service_instance:
+        if cancelled.is_set():
+            return None
+        vm = object_cache.lookup(session_pool.content(service_instance), [vim.VirtualMachine], vm_name)
+        return vm._moId if vm is not None else None
 
-# Function to create an SSL context that does not verify SSL certificates
-def get_ssl_context():
-    context = None
-    if hasattr(ssl, '_create_unverified_context'):
-        context = ssl._create_unverified_context()
-    return context
+def cached_search(vm_name):
+    # Returns (found, server); found is False when there is no fresh entry
+    with _find_cache_lock:
+        entry = _find_cache.get(vm_name)
+    if entry is not None and entry[1] > time.monotonic():
+        return True, entry[0]
+    return False, None
+
+def remember_search(vm_name, server):
+    now = time.monotonic()
+    with _find_cache_lock:
+        if len(_find_cache) >= FIND_VM_CACHE_MAX_ENTRIES:
+            for name in [name for name, (_, expires) in _find_cache.items() if expires <= now]:
+                del _find_cache[name]
+            if len(_find_cache) >= FIND_VM_CACHE_MAX_ENTRIES:
+                _find_cache.clear()
+        _find_cache[vm_name] = (server, now + FIND_VM_CACHE_TTL)
 
 # Function to search for a VM across multiple vCenters
-def find_vm_across_vcenters(vm_name):
-    for vcenter in VCENTERS:
-        ssl_context = get_ssl_context()
-        try:
-            service_instance = SmartConnect(host=vcenter['server'], user=vcenter['user'], pwd=vcenter['password'], sslContext=ssl_context)
-            content = service_instance.RetrieveContent()
-            container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-            vms = container.view
-            for vm in vms:
-                if vm.name == vm_name:
-                    Disconnect(service_instance)
-                    return vcenter['server']
-            Disconnect(service_instance)
-        except Exception as e:
-            print(f"Error connecting to vCenter {vcenter['server']}: {e}")
-    return None
-
-@app.get("/find-vm/{vm_name}")
+async def find_vm_across_vcenters(vm_name):
+    """
+    Search every vCenter at once and return the server of the first one that has the VM.
+
+    The remaining searches are cancelled on the first hit. If several
+    vCenters have a VM with the same name, whichever answers first wins.
+    """
+    found, server = cached_search(vm_name)
+    if found:
+        return server
+    hit = await fan_out_first(get_vcenters(), lambda vcenter, cancelled: search_vcenter(vcenter, vm_name, cancelled))
+    server = hit[0] if hit else None
+    remember_search(vm_name, server)
+    return server
+
+@router.get("/find-vm/{vm_name}")
 async def find_vm(vm_name: str):
-    vcenter = find_vm_across_vcenters(vm_name)
+    vcenter = await find_vm_across_vcenters(vm_name)
     if vcenter:
         return {"vm_name": vm_name, "vcenter": vcenter}
     else:
         raise HTTPException(status_code=404, detail="VM not found across the specified vCenters")
+
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(router)
+install_metrics(app)
@@ -0,0 +1,64 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+
+GENERATION_SUFFIX = '.gen'   # vm_details.json -> vm_details.gen
+_SLOT = struct.Struct('<Q')
+
+def generation_path(file_path):
+    return os.path.splitext(file_path)[0] + GENERATION_SUFFIX
+
+
+class GenerationCounter:
+    """
+    Generation number of a snapshot, kept in an 8-byte file every process maps.
+
+    The process that publishes a snapshot bumps it after the new file is in
+    place; readers compare it with the generation they loaded, which costs
+    one read from shared memory, and reload when it moved. Bumps take an
+    flock so several publishers never hand out the same number.
+    """
+
+    def __init__(self, file_path):
+        self.path = generation_path(file_path)
+        self._fd = None
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _mapped(self):
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    if os.fstat(fd).st_size < _SLOT.size:
+                        os.ftruncate(fd, _SLOT.size)
+                    self._fd = fd
+                    self._map = mmap.mmap(fd, _SLOT.size)
+        return self._map
+
+    def value(self):
+        return _SLOT.unpack_from(self._mapped(), 0)[0]
+
+    def bump(self):
+        shared = self._mapped()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                generation = _SLOT.unpack_from(shared, 0)[0] + 1
+                _SLOT.pack_into(shared, 0, generation)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return generation
+
+
+_counters = {}   # snapshot file path -> GenerationCounter
+_counters_lock = threading.Lock()
+
+def generation_counter(file_path):
+    counter = _counters.get(file_path)
+    if counter is None:
+        with _counters_lock:
+            counter = _counters.setdefault(file_path, GenerationCounter(file_path))
+    return counter
@@ -1,228 +1,179 @@
 from typing import Optional
-from fastapi import FastAPI, HTTPException, Query
-from pyVim.connect import SmartConnect, Disconnect
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from pyVmomi import vim
-import ssl
-import json
-
-app = FastAPI()
-
-def get_ssl_context():
-    context = ssl._create_unverified_context()
-    return context
-
-def get_vm_details(vcenter):
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter['server'], user=vcenter['user'], pwd=vcenter['password'], sslContext=ssl_context)
-        content = service_instance.RetrieveContent()
-        container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-        vms = container.view
-        vm_details_list = []
-
-        for vm in vms:
-            vm_detail = {
-                'vm_name': vm.summary.config.name,
-                'networks': [],
-                'storage': [],
-                'datastores': [],
-                'ip_addresses': []
-            }
-
-            # Network information
-            for net in vm.network:
-                if isinstance(net, vim.Network):
-                    vm_detail['networks'].append(net.name)
-
-            # Collecting all IP addresses
-            ip_addresses = []
-            for net_info in vm.guest.net:
-                if net_info.ipConfig is not None and net_info.ipConfig.ipAddress:
-                    for ip in net_info.ipConfig.ipAddress:
-                        ip_addresses.append(ip.ipAddress)
-            vm_detail['ip_addresses'] = ip_addresses
-
-            # Storage information (Virtual Disks)
-            for device in vm.config.hardware.device:
-                if isinstance(device, vim.vm.device.VirtualDisk):
-                    disk_detail = {
-                        'label': device.deviceInfo.label,
-                        'size_GB': device.capacityInKB / 1024 / 1024
-                    }
-                    vm_detail['storage'].append(disk_detail)
-
-            # Datastore information
-            for ds in vm.datastore:
-                vm_detail['datastores'].append(ds.name)
-
-            vm_details_list.append(vm_detail)
-
-        Disconnect(service_instance)
-        return vm_details_list
-    except Exception as e:
-        print(f"Failed to connect to vCenter {vcenter['server']} with error: {e}")
-        return []
-
-
+from vc_common import get_vcenters
+from vc_session_pool import session_pool
+from vc_fanout import fan_out, save_json_atomic
+from vc_inventory_sync import inventory_sync
+from vc_inventory_store import get_inventory_store, strip_moids, QUERY_DEFAULT_LIMIT, QUERY_MAX_LIMIT
+from vc_metrics import install_metrics
+from vc_property_collector import PropertyCollector, hierarchy_traversals, object_properties, retrieve_properties
+from vc_vm_details import router as vm_details_router, collect_router as vm_details_collect_router
+
+router = APIRouter()
+collect_router = APIRouter()   # talks to vCenter; see vc_collector
 
 def save_data_to_json(file_path, data):
-    with open(file_path, 'w') as file:
-        json.dump(data, file, indent=4)
-
-def load_data_from_json(file_path):
-    with open(file_path, 'r') as file:
-        return json.load(file)
-    
-@app.get("/capture-vm-details", tags=["VM"])
-async def capture_vm_details():
-    vcenters_json_file = 'creds.json'  # Update this path to your vCenters credentials file
-    output_json_file = 'vm_details.json'  # The output file where VM details will be saved
-    vcenters = json.load(open(vcenters_json_file))
-    all_vm_details = {}
-
-    for vcenter in vcenters:
-        vm_details = get_vm_details(vcenter)
-        all_vm_details[vcenter['server']] = vm_details
-
-    save_data_to_json(output_json_file, all_vm_details)
-    return {"message": "VM details captured successfully", "data": all_vm_details}
-
-@app.get("/find-vcenter/{vm_name}", tags=["VM"])
-async def find_vcenter(vm_name: str):
-    output_json_file = 'vm_details.json'  # Specify the path to your JSON file
-    all_vms = load_data_from_json(output_json_file)
-    
-    vm_name_lower = vm_name.lower()  # Convert the input VM name to lowercase
-    for vcenter, vms in all_vms.items():
-        for vm in vms:
-            if vm['vm_name'].lower() == vm_name_lower:  # Compare lowercased versions
-                return vm
-    
-    raise HTTPException(status_code=404, detail="VM not found")
-
+    save_json_atomic(file_path, data)
+
+@collect_router.post("/start-inventory-sync", tags=["VM"])
+async def start_inventory_sync():
+    # Keeps vm_details.json current from vCenter change updates instead of hourly full captures
+    vcenters = get_vcenters()
+    inventory_sync.start(vcenters)
+    return {"message": "Inventory sync started", "vcenters": [vcenter['server'] for vcenter in vcenters]}
+
+@collect_router.post("/stop-inventory-sync", tags=["VM"])
+async def stop_inventory_sync():
+    inventory_sync.stop()
+    return {"message": "Inventory sync stopped"}
+
+@collect_router.get("/inventory-sync-status", tags=["VM"])
+async def inventory_sync_status():
+    return inventory_sync.status()
+
+
+# Everything collect_detailed_info reports, fetched in one traversal from the root folder
+HIERARCHY_PROPERTIES = {
+    vim.Folder: ['childEntity'],
+    vim.Datacenter: ['name', 'hostFolder'],
+    vim.ClusterComputeResource: ['name', 'host', 'datastore', 'network'],
+    vim.HostSystem: ['name', 'hardware.cpuInfo.hz', 'hardware.cpuInfo.numCpuCores', 'hardware.memorySize'],
+    vim.Datastore: ['name', 'summary.capacity', 'summary.freeSpace', 'summary.type'],
+    vim.Network: ['name'],
+}
+
+def collect_detailed_info(service_instance, with_moids=False):
+    """
+    Datacenters with their clusters' datastores, networks and hosts.
+
+    with_moids adds each cluster's, datastore's and network's moId under
+    'moId', as get_cluster_info does.
+    """
+    # Content retrieved at login, so the traversal is the only round trip
+    content = session_pool.content(service_instance)
+    filter_spec = PropertyCollector.FilterSpec(
+        objectSet=[PropertyCollector.ObjectSpec(obj=content.rootFolder, skip=False, selectSet=hierarchy_traversals())],
+        propSet=[PropertyCollector.PropertySpec(type=vimtype, pathSet=paths)
+                 for vimtype, paths in HIERARCHY_PROPERTIES.items()])
+    props = {obj_content.obj._moId: object_properties(obj_content)
+             for obj_content in retrieve_properties(content, filter_spec)}
+
+    # Datastores and networks are shared between clusters; build each entry once
+    datastores = {}
+    networks = {}
+
+    def datastore_info(ds):
+        if ds._moId not in datastores:
+            summary = props[ds._moId]
+            datastores[ds._moId] = {
+                'name': summary['name'],
+                'capacity_gb': summary['summary.capacity'] / (1024**3),
+                'freeSpace_gb': summary['summary.freeSpace'] / (1024**3),
+                'type': summary['summary.type']
+            }
+            if with_moids:
+                datastores[ds._moId]['moId'] = ds._moId
+        return datastores[ds._moId]
+
+    def network_info(network):
+        if network._moId not in networks:
+            networks[network._moId] = {
+                'name': props[network._moId]['name'],
+                'type': type(network).__name__
+            }
+            if with_moids:
+                networks[network._moId]['moId'] = network._moId
+        return networks[network._moId]
+
+    def host_info(host):
+        hardware = props[host._moId]
+        return {
+            'host_name': hardware['name'],
+            'cpu_capacity_ghz': hardware['hardware.cpuInfo.hz'] * hardware['hardware.cpuInfo.numCpuCores'] / 1e9,
+            'memory_capacity_gb': hardware['hardware.memorySize'] / (1024**3),
+        }
 
-def collect_detailed_info(service_instance):
-    content = service_instance.RetrieveContent()
     vcenter_info = []
-
-    for datacenter in content.rootFolder.childEntity:
-        if not hasattr(datacenter, 'hostFolder'):
+    for datacenter in props[content.rootFolder._moId].get('childEntity', []):
+        if not isinstance(datacenter, vim.Datacenter):
             continue
         datacenter_info = {
-            'datacenter_name': datacenter.name,
+            'datacenter_name': props[datacenter._moId]['name'],
             'clusters': []
         }
 
+        # Same depth-first, childEntity order as walking the folders one call at a time
         def traverse_folder(folder):
-            for child in folder.childEntity:
+            for child in props[folder._moId].get('childEntity', []):
                 if isinstance(child, vim.ClusterComputeResource):
+                    cluster = props[child._moId]
                     cluster_info = {
-                        'cluster_name': child.name,
-                        'datastores': [],
-                        'networks': [],
-                        'hosts': []
+                        'cluster_name': cluster['name'],
+                        'datastores': [datastore_info(ds) for ds in cluster.get('datastore', [])],
+                        'networks': [network_info(network) for network in cluster.get('network', [])],
+                        'hosts': [host_info(host) for host in cluster.get('host', [])]
                     }
-
-                    # Collect datastore information
-                    for ds in child.datastore:
-                        ds_info = {
-                            'name': ds.name,
-                            'capacity_gb': ds.summary.capacity / (1024**3),
-                            'freeSpace_gb': ds.summary.freeSpace / (1024**3),
-                            'type': ds.summary.type
-                        }
-                        cluster_info['datastores'].append(ds_info)
-
-                    # Collect network information
-                    for network in child.network:
-                        net_info = {
-                            'name': network.name,
-                            'type': type(network).__name__
-                        }
-                        cluster_info['networks'].append(net_info)
-
-                    # Collect host information
-                    for host in child.host:
-                        host_info = {
-                            'host_name': host.name,
-                            'cpu_capacity_ghz': host.hardware.cpuInfo.hz * host.hardware.cpuInfo.numCpuCores / 1e9,
-                            'memory_capacity_gb': host.hardware.memorySize / (1024**3),
-                            # Additional host details can be added here
-                        }
-                        cluster_info['hosts'].append(host_info)
-
+                    if with_moids:
+                        cluster_info['moId'] = child._moId
                     datacenter_info['clusters'].append(cluster_info)
                 elif isinstance(child, vim.Folder):
                     traverse_folder(child)
 
-        traverse_folder(datacenter.hostFolder)
+        traverse_folder(props[datacenter._moId]['hostFolder'])
         vcenter_info.append(datacenter_info)
 
     return vcenter_info
 
-@app.get("/collect-detailed-hierarchical-info")
+@collect_router.get("/collect-detailed-hierarchical-info")
 async def collect_detailed_hierarchical_info():
-    vcenters_json_file = 'creds.json'
-    vcenters = json.load(open(vcenters_json_file))
-    all_vcenter_info = {}
-
-    for vcenter in vcenters:
-        ssl_context = get_ssl_context()
-        try:
-            service_instance = SmartConnect(host=vcenter['server'], user=vcenter['user'], pwd=vcenter['password'], sslContext=ssl_context)
-            vcenter_info = collect_detailed_info(service_instance)
-            all_vcenter_info[vcenter['server']] = vcenter_info
-            Disconnect(service_instance)
-        except Exception as e:
-            print(f"Failed to connect to vCenter {vcenter['server']} with error: {e}")
-            all_vcenter_info[vcenter['server']] = 'Connection failed'
-
-    # Optionally, save the collected data to a JSON file
+    vcenters = get_vcenters()
     output_json_file = 'detailed_hierarchical_clusters.json'
-    with open(output_json_file, 'w') as file:
-        json.dump(all_vcenter_info, file, indent=4)
 
-    return all_vcenter_info
+    def collect(vcenter):
+        with session_pool.session(vcenter) as service_instance:
+            return collect_detailed_info(service_instance, with_moids=True)
 
-@app.get("/query-hierarchical-info/")
-async def query_hierarchical_info(datacenter_name: Optional[str] = None, 
+    all_vcenter_info = await fan_out(vcenters, collect, 'Connection failed',
+                                     on_progress=lambda partial: save_data_to_json(output_json_file, strip_moids(partial)))
+
+    # The store keys objects by moId; the saved and returned capture keeps its shape
+    public_vcenter_info = strip_moids(all_vcenter_info)
+    save_data_to_json(output_json_file, public_vcenter_info)
+    await run_in_threadpool(get_inventory_store().replace_hierarchy, all_vcenter_info)
+
+    return public_vcenter_info
+
+@router.get("/query-hierarchical-info/")
+async def query_hierarchical_info(response: Response,
+                                  datacenter_name: Optional[str] = None, 
                                   cluster_name: Optional[str] = None, 
                                   datastore_name: Optional[str] = None, 
                                   network_name: Optional[str] = None,
-                                  host_name: Optional[str] = None):
-    output_json_file = 'detailed_hierarchical_clusters.json'
-    all_data = json.load(open(output_json_file))
-    
-    filtered_data = []
-
-    for vcenter_data in all_data.values():
-        for datacenter in vcenter_data:
-            if datacenter_name and datacenter_name.lower() != datacenter['datacenter_name'].lower():
-                continue
-            
-            filtered_datacenter = {"datacenter_name": datacenter['datacenter_name'], "clusters": []}
-            for cluster in datacenter['clusters']:
-                if cluster_name and cluster_name.lower() != cluster['cluster_name'].lower():
-                    continue
-                
-                filtered_cluster = {key: value for key, value in cluster.items() if key in ['cluster_name', 'datastores', 'networks', 'hosts']}
-                filtered_cluster['datastores'] = [ds for ds in cluster['datastores'] if not datastore_name or datastore_name.lower() in ds['name'].lower()]
-                filtered_cluster['networks'] = [net for net in cluster['networks'] if not network_name or network_name.lower() in net['name'].lower()]
-                filtered_cluster['hosts'] = [host for host in cluster['hosts'] if not host_name or host_name.lower() in host['host_name'].lower()]
-                
-                if not filtered_cluster['datastores'] and datastore_name:
-                    continue
-                if not filtered_cluster['networks'] and network_name:
-                    continue
-                if not filtered_cluster['hosts'] and host_name:
-                    continue
-                
-                filtered_datacenter['clusters'].append(filtered_cluster)
-            
-            if filtered_datacenter['clusters']:
-                filtered_data.append(filtered_datacenter)
+                                  host_name: Optional[str] = None,
+                                  limit: int = Query(QUERY_DEFAULT_LIMIT, ge=1, le=QUERY_MAX_LIMIT),
+                                  offset: int = Query(0, ge=0)):
+    # Pages count clusters; X-Total-Count has the number of matching clusters
+    def lookup():
+        # Seeding and querying SQLite block, so keep them off the event loop
+        store = get_inventory_store()
+        store.bootstrap('hierarchy', 'detailed_hierarchical_clusters.json')
+        return store.query_hierarchy(datacenter_name, cluster_name, datastore_name, network_name, host_name,
+                                     limit, offset)
+
+    total, filtered_data = await run_in_threadpool(lookup)
+    response.headers["X-Total-Count"] = str(total)
     
     if not filtered_data:
         raise HTTPException(status_code=404, detail="No matching information found")
     
-    return filtered_data
\ No newline at end of file
+    return filtered_data
+
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(vm_details_collect_router)
+app.include_router(vm_details_router)
+app.include_router(collect_router)
+app.include_router(router)
+install_metrics(app)
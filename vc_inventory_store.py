@@ -0,0 +1,496 @@
+import json
+import os
+import sqlite3
+import threading
+from vc_generations import generation_counter
+
+INVENTORY_DB_FILE = 'inventory.db'
+QUERY_DEFAULT_LIMIT = 100
+QUERY_MAX_LIMIT = 1000
+FTS_MIN_TERM = 3   # The trigram tokenizer cannot match shorter terms; those fall back to LIKE
+SCHEMA_VERSION = 3   # PRAGMA user_version; bump whenever a table changes shape
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vcenter (
+    id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS datacenter (
+    id INTEGER PRIMARY KEY,
+    vcenter_id INTEGER NOT NULL REFERENCES vcenter(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (vcenter_id, name)
+);
+CREATE TABLE IF NOT EXISTS cluster (
+    id INTEGER PRIMARY KEY,
+    vcenter_id INTEGER NOT NULL REFERENCES vcenter(id) ON DELETE CASCADE,
+    datacenter_id INTEGER REFERENCES datacenter(id) ON DELETE SET NULL,
+    -- Clusters, datastores and networks are keyed by managed object id, since names repeat across datacenters
+    moid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    total_cpu REAL,
+    total_memory REAL,
+    available_cpu REAL,
+    available_memory REAL,
+    -- Which capture last reported the cluster, and where it sat in that capture
+    info_position INTEGER,
+    hierarchy_position INTEGER,
+    UNIQUE (vcenter_id, moid)
+);
+CREATE INDEX IF NOT EXISTS cluster_name ON cluster (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS cluster_datacenter ON cluster (datacenter_id);
+CREATE TABLE IF NOT EXISTS host (
+    id INTEGER PRIMARY KEY,
+    cluster_id INTEGER NOT NULL REFERENCES cluster(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    cpu_capacity REAL,
+    memory_capacity REAL,
+    storage_capacity REAL,
+    storage_free REAL,
+    UNIQUE (cluster_id, name)
+);
+CREATE TABLE IF NOT EXISTS datastore (
+    id INTEGER PRIMARY KEY,
+    vcenter_id INTEGER NOT NULL REFERENCES vcenter(id) ON DELETE CASCADE,
+    moid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    capacity_gb REAL,
+    free_space_gb REAL,
+    type TEXT,
+    accessible INTEGER,
+    UNIQUE (vcenter_id, moid)
+);
+CREATE TABLE IF NOT EXISTS network (
+    id INTEGER PRIMARY KEY,
+    vcenter_id INTEGER NOT NULL REFERENCES vcenter(id) ON DELETE CASCADE,
+    moid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT,
+    UNIQUE (vcenter_id, moid)
+);
+CREATE TABLE IF NOT EXISTS cluster_datastore (
+    cluster_id INTEGER NOT NULL REFERENCES cluster(id) ON DELETE CASCADE,
+    datastore_id INTEGER NOT NULL REFERENCES datastore(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (cluster_id, datastore_id)
+);
+CREATE INDEX IF NOT EXISTS cluster_datastore_datastore ON cluster_datastore (datastore_id);
+CREATE TABLE IF NOT EXISTS cluster_network (
+    cluster_id INTEGER NOT NULL REFERENCES cluster(id) ON DELETE CASCADE,
+    network_id INTEGER NOT NULL REFERENCES network(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (cluster_id, network_id)
+);
+CREATE INDEX IF NOT EXISTS cluster_network_network ON cluster_network (network_id);
+"""
+
+# Every name filter is served from this table; kind is one of the table names above
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS name_fts USING fts5(kind UNINDEXED, ref_id UNINDEXED, name, tokenize='trigram')"
+
+def like_pattern(term):
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def object_key(obj, name_key):
+    # Captures saved to JSON carry no moIds and only have the name to go on
+    return obj.get('moId') or obj[name_key]
+
+def strip_moids(capture):
+    """
+    Copy of a capture taken with_moids without the 'moId' keys, in the shape it is saved and returned in.
+    """
+    if isinstance(capture, dict):
+        return {key: strip_moids(value) for key, value in capture.items() if key != 'moId'}
+    if isinstance(capture, list):
+        return [strip_moids(value) for value in capture]
+    return capture
+
+
+class InventoryStore:
+    """
+    SQLite copy of the captured cluster inventory.
+
+    Captures write into a normalized vcenter/datacenter/cluster/host/
+    datastore/network schema; the query endpoints read it with indexed
+    lookups and page through results instead of re-reading the JSON files.
+    Substring name filters go through an FTS5 trigram index when SQLite
+    supports it, and fall back to LIKE otherwise.
+
+    The cluster-info and hierarchical captures describe the same objects with
+    different fields, so each one updates its own columns and leaves the
+    other's alone. Cluster datastore and network membership is shared: both
+    captures rewrite it, and the one that ran last wins.
+    """
+
+    def __init__(self, path=INVENTORY_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._bootstrapped = set()
+        self.generation = generation_counter(path)   # bumped by every replace_*; see vc_search
+        with self._write_lock:
+            db = self.connection()
+            self._upgrade(db)
+            db.executescript(SCHEMA)
+            try:
+                db.execute(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                print("SQLite has no FTS5 trigram tokenizer; name filters will use LIKE scans.")
+                self.fts = False
+            db.commit()
+
+    def connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA foreign_keys=ON")
+        return db
+
+    def _upgrade(self, db):
+        # The store only mirrors the JSON captures, so an older layout is dropped and bootstrap() reseeds it.
+        # Foreign keys are off meanwhile, so tables can go in any order.
+        db.execute("PRAGMA foreign_keys=OFF")
+        db.execute("BEGIN IMMEDIATE")
+        if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            tables = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                                   "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'name_fts_%'")]
+            for table in tables:
+                db.execute(f"DROP TABLE IF EXISTS {table}")
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        db.commit()
+        db.execute("PRAGMA foreign_keys=ON")
+
+    # Writes
+
+    def _vcenter_id(self, db, server, position):
+        # Position follows creds.json order in the captures
+        db.execute("INSERT INTO vcenter (server, position) VALUES (?, ?) "
+                   "ON CONFLICT (server) DO UPDATE SET position = excluded.position", (server, position))
+        return db.execute("SELECT id FROM vcenter WHERE server = ?", (server,)).fetchone()[0]
+
+    def _upsert_datastore(self, db, vcenter_id, ds, accessible=None):
+        moid = object_key(ds, 'name')
+        db.execute("INSERT INTO datastore (vcenter_id, moid, name, capacity_gb, free_space_gb, type, accessible) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (vcenter_id, moid) DO UPDATE SET name = excluded.name, "
+                   "capacity_gb = COALESCE(excluded.capacity_gb, datastore.capacity_gb), "
+                   "free_space_gb = COALESCE(excluded.free_space_gb, datastore.free_space_gb), "
+                   "type = COALESCE(excluded.type, datastore.type), "
+                   "accessible = COALESCE(excluded.accessible, datastore.accessible)",
+                   (vcenter_id, moid, ds['name'], ds.get('capacity_gb'), ds.get('freeSpace_gb'), ds.get('type'), accessible))
+        return db.execute("SELECT id FROM datastore WHERE vcenter_id = ? AND moid = ?", (vcenter_id, moid)).fetchone()[0]
+
+    def _upsert_network(self, db, vcenter_id, net):
+        moid = object_key(net, 'name')
+        db.execute("INSERT INTO network (vcenter_id, moid, name, type) VALUES (?, ?, ?, ?) "
+                   "ON CONFLICT (vcenter_id, moid) DO UPDATE SET name = excluded.name, "
+                   "type = COALESCE(excluded.type, network.type)",
+                   (vcenter_id, moid, net['name'], net.get('type')))
+        return db.execute("SELECT id FROM network WHERE vcenter_id = ? AND moid = ?", (vcenter_id, moid)).fetchone()[0]
+
+    def _replace_members(self, db, cluster_id, vcenter_id, cluster, accessible_key=None):
+        db.execute("DELETE FROM cluster_datastore WHERE cluster_id = ?", (cluster_id,))
+        for position, ds in enumerate(cluster.get('datastores', [])):
+            datastore_id = self._upsert_datastore(db, vcenter_id, ds, ds.get(accessible_key) if accessible_key else None)
+            db.execute("INSERT OR IGNORE INTO cluster_datastore (cluster_id, datastore_id, position) VALUES (?, ?, ?)",
+                       (cluster_id, datastore_id, position))
+        db.execute("DELETE FROM cluster_network WHERE cluster_id = ?", (cluster_id,))
+        for position, net in enumerate(cluster.get('networks', [])):
+            network_id = self._upsert_network(db, vcenter_id, net)
+            db.execute("INSERT OR IGNORE INTO cluster_network (cluster_id, network_id, position) VALUES (?, ?, ?)",
+                       (cluster_id, network_id, position))
+
+    def _replace_hosts(self, db, cluster_id, hosts, storage):
+        names = []
+        for position, host in enumerate(hosts):
+            names.append(host['host_name'])
+            cpu = host.get('cpu_capacity', host.get('cpu_capacity_ghz'))
+            memory = host.get('memory_capacity', host.get('memory_capacity_gb'))
+            if storage:
+                db.execute("INSERT INTO host (cluster_id, name, position, cpu_capacity, memory_capacity, storage_capacity, storage_free) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (cluster_id, name) DO UPDATE SET position = excluded.position, "
+                           "cpu_capacity = excluded.cpu_capacity, memory_capacity = excluded.memory_capacity, "
+                           "storage_capacity = excluded.storage_capacity, storage_free = excluded.storage_free",
+                           (cluster_id, host['host_name'], position, cpu, memory, host.get('storage_capacity'), host.get('storage_free')))
+            else:
+                db.execute("INSERT INTO host (cluster_id, name, position, cpu_capacity, memory_capacity) VALUES (?, ?, ?, ?, ?) "
+                           "ON CONFLICT (cluster_id, name) DO UPDATE SET position = excluded.position, "
+                           "cpu_capacity = excluded.cpu_capacity, memory_capacity = excluded.memory_capacity",
+                           (cluster_id, host['host_name'], position, cpu, memory))
+        db.execute(f"DELETE FROM host WHERE cluster_id = ? AND name NOT IN ({','.join('?' * len(names))})",
+                   [cluster_id] + names)
+
+    def _upsert_cluster(self, db, vcenter_id, cluster, columns):
+        moid = object_key(cluster, 'cluster_name')
+        db.execute("INSERT INTO cluster (vcenter_id, moid, name) VALUES (?, ?, ?) "
+                   "ON CONFLICT (vcenter_id, moid) DO UPDATE SET name = excluded.name",
+                   (vcenter_id, moid, cluster['cluster_name']))
+        cluster_id = db.execute("SELECT id FROM cluster WHERE vcenter_id = ? AND moid = ?", (vcenter_id, moid)).fetchone()[0]
+        db.execute(f"UPDATE cluster SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                   list(columns.values()) + [cluster_id])
+        return cluster_id
+
+    def _drop_unreported(self, db, vcenter_id):
+        # Clusters neither capture reports any more, and objects nothing refers to
+        db.execute("DELETE FROM cluster WHERE vcenter_id = ? AND info_position IS NULL AND hierarchy_position IS NULL",
+                   (vcenter_id,))
+        db.execute("DELETE FROM datastore WHERE vcenter_id = ? AND id NOT IN (SELECT datastore_id FROM cluster_datastore)",
+                   (vcenter_id,))
+        db.execute("DELETE FROM network WHERE vcenter_id = ? AND id NOT IN (SELECT network_id FROM cluster_network)",
+                   (vcenter_id,))
+
+    def replace_cluster_info(self, all_cluster_info):
+        """
+        Store a /collect-cluster-info result. vCenters that failed keep their previous data.
+        """
+        with self._write_lock:
+            db = self.connection()
+            with db:
+                for position, (server, clusters) in enumerate(all_cluster_info.items()):
+                    if not isinstance(clusters, list):
+                        continue
+                    vcenter_id = self._vcenter_id(db, server, position)
+                    db.execute("UPDATE cluster SET info_position = NULL WHERE vcenter_id = ?", (vcenter_id,))
+                    for cluster_position, cluster in enumerate(clusters):
+                        cluster_id = self._upsert_cluster(db, vcenter_id, cluster, {
+                            'total_cpu': cluster.get('total_cpu'), 'total_memory': cluster.get('total_memory'),
+                            'available_cpu': cluster.get('available_cpu'), 'available_memory': cluster.get('available_memory'),
+                            'info_position': cluster_position})
+                        self._replace_hosts(db, cluster_id, cluster.get('hosts', []), storage=True)
+                        self._replace_members(db, cluster_id, vcenter_id, cluster, accessible_key='accessible')
+                    self._drop_unreported(db, vcenter_id)
+                self._rebuild_fts(db)
+            # After the commit, so a reader that sees the new generation also sees the new rows
+            self.generation.bump()
+
+    def replace_hierarchy(self, all_vcenter_info):
+        """
+        Store a /collect-detailed-hierarchical-info result. vCenters that failed keep their previous data.
+        """
+        with self._write_lock:
+            db = self.connection()
+            with db:
+                for position, (server, datacenters) in enumerate(all_vcenter_info.items()):
+                    if not isinstance(datacenters, list):
+                        continue
+                    vcenter_id = self._vcenter_id(db, server, position)
+                    db.execute("UPDATE cluster SET hierarchy_position = NULL WHERE vcenter_id = ?", (vcenter_id,))
+                    names = []
+                    cluster_position = 0
+                    for datacenter_position, datacenter in enumerate(datacenters):
+                        names.append(datacenter['datacenter_name'])
+                        db.execute("INSERT INTO datacenter (vcenter_id, name, position) VALUES (?, ?, ?) "
+                                   "ON CONFLICT (vcenter_id, name) DO UPDATE SET position = excluded.position",
+                                   (vcenter_id, datacenter['datacenter_name'], datacenter_position))
+                        datacenter_id = db.execute("SELECT id FROM datacenter WHERE vcenter_id = ? AND name = ?",
+                                                   (vcenter_id, datacenter['datacenter_name'])).fetchone()[0]
+                        for cluster in datacenter['clusters']:
+                            cluster_id = self._upsert_cluster(db, vcenter_id, cluster, {
+                                'datacenter_id': datacenter_id, 'hierarchy_position': cluster_position})
+                            cluster_position += 1
+                            self._replace_hosts(db, cluster_id, cluster.get('hosts', []), storage=False)
+                            self._replace_members(db, cluster_id, vcenter_id, cluster)
+                    db.execute(f"DELETE FROM datacenter WHERE vcenter_id = ? AND name NOT IN ({','.join('?' * len(names))})",
+                               [vcenter_id] + names)
+                    self._drop_unreported(db, vcenter_id)
+                self._rebuild_fts(db)
+            self.generation.bump()
+
+    def _rebuild_fts(self, db):
+        if not self.fts:
+            return
+        db.execute("DELETE FROM name_fts")
+        for kind in ('cluster', 'host', 'datastore', 'network'):
+            db.execute(f"INSERT INTO name_fts (kind, ref_id, name) SELECT '{kind}', id, name FROM {kind}")
+
+    def bootstrap(self, kind, file_path):
+        """
+        Seed the store from an existing JSON capture the first time a query needs it.
+        """
+        if kind in self._bootstrapped:
+            return
+        self._bootstrapped.add(kind)
+        column = 'info_position' if kind == 'cluster_info' else 'hierarchy_position'
+        if self.connection().execute(f"SELECT 1 FROM cluster WHERE {column} IS NOT NULL LIMIT 1").fetchone():
+            return
+        if not os.path.exists(file_path):
+            return
+        try:
+            with open(file_path, 'r') as file:
+                data = json.load(file)
+        except json.JSONDecodeError:
+            print(f"Error decoding JSON from {file_path}; inventory store not seeded.")
+            return
+        if kind == 'cluster_info':
+            self.replace_cluster_info(data)
+        else:
+            self.replace_hierarchy(data)
+
+    # Reads
+
+    def object_names(self):
+        """
+        Yield (kind, vCenter server, name) for every stored host, datastore and network.
+        """
+        db = self.connection()
+        yield from db.execute("SELECT DISTINCT 'host', vcenter.server, host.name FROM host "
+                              "JOIN cluster ON cluster.id = host.cluster_id "
+                              "JOIN vcenter ON vcenter.id = cluster.vcenter_id")
+        for kind in ('datastore', 'network'):
+            yield from db.execute(f"SELECT '{kind}', vcenter.server, {kind}.name FROM {kind} "
+                                  f"JOIN vcenter ON vcenter.id = {kind}.vcenter_id")
+
+    def _name_predicate(self, kind, term, alias):
+        """
+        Return (sql, params, indexed): a condition on alias that its name contains term, ignoring case.
+        """
+        if self.fts and len(term) >= FTS_MIN_TERM:
+            return (f"{alias}.id IN (SELECT ref_id FROM name_fts WHERE name_fts MATCH ? AND kind = ?)",
+                    [fts_phrase(term), kind], True)
+        return f"{alias}.name LIKE ? ESCAPE '\\'", [like_pattern(term)], False
+
+    def _cluster_filters(self, cluster_name, datastore_name, host_name, network_name):
+        where = []
+        params = []
+        filters = {}
+        if cluster_name:
+            where.append("c.name = ? COLLATE NOCASE")
+            params.append(cluster_name)
+        members = {
+            'datastore': (datastore_name, 'd', "cluster_datastore m JOIN datastore d ON d.id = m.datastore_id"),
+            'host': (host_name, 'h', "host h"),
+            'network': (network_name, 'n', "cluster_network m JOIN network n ON n.id = m.network_id"),
+        }
+        for kind, (term, alias, tables) in members.items():
+            if not term:
+                continue
+            sql, filter_params, indexed = self._name_predicate(kind, term, alias)
+            filters[kind] = (sql, filter_params)
+            cluster_column = 'h.cluster_id' if kind == 'host' else 'm.cluster_id'
+            if indexed:
+                # Index hits are usually few, so start from them instead of checking every cluster
+                where.append(f"c.id IN (SELECT {cluster_column} FROM {tables} WHERE {sql})")
+            else:
+                # Short terms match most names anyway; check them per candidate cluster
+                where.append(f"EXISTS (SELECT 1 FROM {tables} WHERE {cluster_column} = c.id AND {sql})")
+            params.extend(filter_params)
+        return where, params, filters
+
+    def _members(self, db, cluster_ids, filters):
+        """
+        Fetch datastores, networks and hosts for a page of clusters, keeping only filter matches.
+        """
+        marks = ','.join('?' * len(cluster_ids))
+        members = {cluster_id: {'datastores': [], 'networks': [], 'hosts': []} for cluster_id in cluster_ids}
+
+        def matching(kind):
+            if kind not in filters:
+                return "", []
+            sql, params = filters[kind]
+            return f" AND {sql}", params
+
+        extra, params = matching('datastore')
+        for row in db.execute(f"SELECT m.cluster_id, d.* FROM cluster_datastore m JOIN datastore d ON d.id = m.datastore_id "
+                              f"WHERE m.cluster_id IN ({marks}){extra} ORDER BY m.cluster_id, m.position",
+                              list(cluster_ids) + params):
+            members[row['cluster_id']]['datastores'].append(row)
+        extra, params = matching('network')
+        for row in db.execute(f"SELECT m.cluster_id, n.* FROM cluster_network m JOIN network n ON n.id = m.network_id "
+                              f"WHERE m.cluster_id IN ({marks}){extra} ORDER BY m.cluster_id, m.position",
+                              list(cluster_ids) + params):
+            members[row['cluster_id']]['networks'].append(row)
+        extra, params = matching('host')
+        for row in db.execute(f"SELECT * FROM host h WHERE h.cluster_id IN ({marks}){extra} ORDER BY h.cluster_id, h.position",
+                              list(cluster_ids) + params):
+            members[row['cluster_id']]['hosts'].append(row)
+        return members
+
+    def query_cluster_info(self, cluster_name=None, datastore_name=None, host_name=None, network_name=None,
+                           limit=QUERY_DEFAULT_LIMIT, offset=0):
+        """
+        Return (total, [{"vcenter", "cluster_info"}, ...]) in the shape /query-cluster-info always had.
+        """
+        db = self.connection()
+        where, params, filters = self._cluster_filters(cluster_name, datastore_name, host_name, network_name)
+        where.insert(0, "c.info_position IS NOT NULL")
+        clause = " AND ".join(where)
+        total = db.execute(f"SELECT COUNT(*) FROM cluster c WHERE {clause}", params).fetchone()[0]
+        rows = db.execute(f"SELECT c.*, v.server FROM cluster c JOIN vcenter v ON v.id = c.vcenter_id WHERE {clause} "
+                          f"ORDER BY v.position, c.info_position LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+        members = self._members(db, [row['id'] for row in rows], filters) if rows else {}
+        results = []
+        for row in rows:
+            member = members[row['id']]
+            results.append({"vcenter": row['server'], "cluster_info": {
+                'cluster_name': row['name'],
+                'total_cpu': row['total_cpu'],
+                'total_memory': row['total_memory'],
+                'available_cpu': row['available_cpu'],
+                'available_memory': row['available_memory'],
+                'hosts': [{'host_name': host['name'], 'cpu_capacity': host['cpu_capacity'],
+                           'memory_capacity': host['memory_capacity'], 'storage_capacity': host['storage_capacity'],
+                           'storage_free': host['storage_free']} for host in member['hosts']],
+                'datastores': [{'name': ds['name'], 'capacity_gb': ds['capacity_gb'], 'freeSpace_gb': ds['free_space_gb'],
+                                'type': ds['type'], 'accessible': None if ds['accessible'] is None else bool(ds['accessible'])}
+                               for ds in member['datastores']],
+                'networks': [{'name': net['name'], 'type': net['type']} for net in member['networks']],
+            }})
+        return total, results
+
+    def query_hierarchy(self, datacenter_name=None, cluster_name=None, datastore_name=None, network_name=None,
+                        host_name=None, limit=QUERY_DEFAULT_LIMIT, offset=0):
+        """
+        Return (total clusters, [{"datacenter_name", "clusters"}, ...]) as /query-hierarchical-info did.
+
+        Pagination counts clusters; a page groups its clusters by datacenter.
+        """
+        db = self.connection()
+        where, params, filters = self._cluster_filters(cluster_name, datastore_name, host_name, network_name)
+        where.insert(0, "c.hierarchy_position IS NOT NULL")
+        if datacenter_name:
+            where.append("dc.name = ? COLLATE NOCASE")
+            params.append(datacenter_name)
+        clause = " AND ".join(where)
+        tables = "cluster c JOIN datacenter dc ON dc.id = c.datacenter_id JOIN vcenter v ON v.id = c.vcenter_id"
+        total = db.execute(f"SELECT COUNT(*) FROM {tables} WHERE {clause}", params).fetchone()[0]
+        rows = db.execute(f"SELECT c.id, c.name, dc.id AS datacenter_id, dc.name AS datacenter_name FROM {tables} "
+                          f"WHERE {clause} ORDER BY v.position, dc.position, c.hierarchy_position LIMIT ? OFFSET ?",
+                          params + [limit, offset]).fetchall()
+        members = self._members(db, [row['id'] for row in rows], filters) if rows else {}
+        datacenters = []
+        for row in rows:
+            if not datacenters or datacenters[-1][0] != row['datacenter_id']:
+                datacenters.append((row['datacenter_id'], {"datacenter_name": row['datacenter_name'], "clusters": []}))
+            member = members[row['id']]
+            datacenters[-1][1]['clusters'].append({
+                'cluster_name': row['name'],
+                'datastores': [{'name': ds['name'], 'capacity_gb': ds['capacity_gb'], 'freeSpace_gb': ds['free_space_gb'],
+                                'type': ds['type']} for ds in member['datastores']],
+                'networks': [{'name': net['name'], 'type': net['type']} for net in member['networks']],
+                'hosts': [{'host_name': host['name'], 'cpu_capacity_ghz': host['cpu_capacity'],
+                           'memory_capacity_gb': host['memory_capacity']} for host in member['hosts']],
+            })
+        return total, [datacenter for _, datacenter in datacenters]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_inventory_store(path=INVENTORY_DB_FILE):
+    """
+    Return the process-wide store, creating the database on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = InventoryStore(path)
+    return _store
@@ -0,0 +1,253 @@
+from pyVmomi import vim, vmodl
+from vc_fanout import save_json_atomic
+from vc_object_cache import object_cache, vcenter_key
+from vc_property_collector import (PropertyCollector, container_object_spec, vm_filter_spec, vm_traversals,
+                                   new_vm_record, update_vm_record, build_vm_detail)
+from vc_session_pool import session_pool
+from vc_vm_index import publish_vm_snapshot
+import json
+import os
+import threading
+import time
+
+SYNC_OUTPUT_FILE = 'vm_details.json'
+SYNC_CHECKPOINT_DIR = 'sync_checkpoints'
+SYNC_WAIT_SECONDS = 30           # maxWaitSeconds for each WaitForUpdatesEx call
+SYNC_PUBLISH_INTERVAL = 5        # Seconds between snapshot rewrites while changes keep arriving
+SYNC_CHECKPOINT_INTERVAL = 60    # Seconds between checkpoints per vCenter
+SYNC_RETRY_DELAY = 30            # Seconds before reconnecting after a failure
+
+def checkpoint_path(server, checkpoint_dir=SYNC_CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, f"{server}.json")
+
+
+class VMInventorySync:
+    """
+    Keeps the VM model of one vCenter current from PropertyCollector updates.
+
+    The model is seeded by the first WaitForUpdatesEx call on a dedicated
+    collector and then patched with enter/modify/leave updates: VMs created,
+    destroyed, renamed or reconfigured. Transient errors retry with the same
+    collector version. A fresh session needs a new collector, and that is
+    reseeded in one call.
+    """
+
+    def __init__(self, vcenter, on_change=None, checkpoint_dir=SYNC_CHECKPOINT_DIR):
+        self.vcenter = vcenter
+        self.server = vcenter['server']
+        self.on_change = on_change
+        self.checkpoint_dir = checkpoint_dir
+        self.version = ''
+        self.vms = {}      # VM moId -> record (see vc_property_collector.update_vm_record)
+        self.names = {}    # network/datastore moId -> name
+        self.cache_key = None   # object_cache key of this vCenter, known once connected
+        self.status = {
+            'state': 'stopped',
+            'version': '',
+            'seeded_from': None,
+            'updates': 0,
+            'enter': 0,
+            'modify': 0,
+            'leave': 0,
+            'errors': 0,
+            'last_error': None,
+            'last_update': None,
+            'last_checkpoint': None,
+        }
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_checkpoint = 0.0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"vc-sync-{self.server}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(SYNC_WAIT_SECONDS + 5)
+        self.save_checkpoint()
+        self.status['state'] = 'stopped'
+
+    def vm_details(self):
+        with self._lock:
+            return [build_vm_detail(record, self.names) for record in self.vms.values()]
+
+    def load_checkpoint(self):
+        try:
+            with open(checkpoint_path(self.server, self.checkpoint_dir), 'r') as file:
+                checkpoint = json.load(file)
+        except FileNotFoundError:
+            return False
+        except json.JSONDecodeError:
+            print(f"Ignoring unreadable sync checkpoint for vCenter {self.server}")
+            return False
+        with self._lock:
+            self.version = checkpoint['version']
+            self.vms = checkpoint['vms']
+            self.names = checkpoint['names']
+        self.status['seeded_from'] = 'checkpoint'
+        self.status['version'] = self.version
+        return True
+
+    def save_checkpoint(self):
+        with self._lock:
+            checkpoint = {'server': self.server, 'version': self.version, 'saved_at': time.time(),
+                          'vms': self.vms, 'names': self.names}
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            save_json_atomic(checkpoint_path(self.server, self.checkpoint_dir), checkpoint)
+        self._last_checkpoint = time.monotonic()
+        self.status['last_checkpoint'] = checkpoint['saved_at']
+
+    def _run(self):
+        if self.load_checkpoint() and self.on_change:
+            # Serve the last known model straight away while the collector catches up
+            self.on_change()
+        while not self._stop.is_set():
+            try:
+                with session_pool.session(self.vcenter) as service_instance:
+                    self._sync(session_pool.content(service_instance))
+            except Exception as e:
+                self.status['errors'] += 1
+                self.status['last_error'] = str(e)
+                self.status['state'] = 'retrying'
+                print(f"Inventory sync for vCenter {self.server} failed with error: {e}")
+                self._stop.wait(SYNC_RETRY_DELAY)
+
+    def _sync(self, content):
+        self.cache_key = vcenter_key(content)
+        collector = content.propertyCollector.CreatePropertyCollector()
+        view, object_spec = container_object_spec(content, vim.VirtualMachine, vm_traversals())
+        try:
+            collector.CreateFilter(vm_filter_spec(object_spec), partialUpdates=False)
+            options = PropertyCollector.WaitOptions(maxWaitSeconds=SYNC_WAIT_SECONDS)
+            # Versions belong to a collector, so a version from a checkpoint is
+            # normally rejected and we fall back to a full seed
+            version = self.version
+            seed = None
+            self.status['state'] = 'running'
+            while not self._stop.is_set():
+                try:
+                    update_set = collector.WaitForUpdatesEx(version=version, options=options)
+                except vmodl.query.InvalidCollectorVersion:
+                    version = ''
+                    continue
+
+                if update_set is not None:
+                    if not version:
+                        # Build the seed separately so VMs destroyed while we were away disappear
+                        seed = seed or ({}, {})
+                        self._apply(update_set, *seed)
+                        if not update_set.truncated:
+                            with self._lock:
+                                self.vms, self.names = seed
+                            self.status['seeded_from'] = 'vcenter'
+                            seed = None
+                    else:
+                        with self._lock:
+                            self._apply(update_set, self.vms, self.names)
+                    version = update_set.version
+                    if seed is None:
+                        with self._lock:
+                            self.version = version
+                        self.status['version'] = version
+                        self.status['last_update'] = time.time()
+                        if self.on_change:
+                            self.on_change()
+
+                if seed is None and time.monotonic() - self._last_checkpoint >= SYNC_CHECKPOINT_INTERVAL:
+                    self.save_checkpoint()
+        finally:
+            for mo in (collector, view):
+                try:
+                    mo.Destroy()
+                except Exception:
+                    pass
+
+    def _apply(self, update_set, vms, names):
+        self.status['updates'] += 1
+        for filter_update in update_set.filterSet or []:
+            for object_update in filter_update.objectSet or []:
+                moId = object_update.obj._moId
+                kind = str(object_update.kind)
+                self.status[kind] = self.status.get(kind, 0) + 1
+                if kind == 'leave':
+                    vms.pop(moId, None)
+                    names.pop(moId, None)
+                    # Destroyed objects must not be served from the name cache
+                    object_cache.invalidate_object(self.cache_key, moId)
+                    continue
+                if isinstance(object_update.obj, vim.VirtualMachine):
+                    record = vms.setdefault(moId, new_vm_record())
+                    for change in object_update.changeSet or []:
+                        update_vm_record(record, change.name, None if change.op == 'remove' else change.val)
+                        if change.name == 'summary.config.name':
+                            self._renamed(kind, moId, change.val)
+                else:
+                    for change in object_update.changeSet or []:
+                        if change.name == 'name':
+                            names[moId] = change.val
+                            self._renamed(kind, moId, change.val)
+
+    def _renamed(self, kind, moId, name):
+        # The old name no longer leads here, and a lookup that just missed the new one must look again
+        if kind == 'modify':
+            object_cache.invalidate_object(self.cache_key, moId)
+        if name:
+            object_cache.invalidate_name(self.cache_key, name)
+
+
+class InventorySyncManager:
+    """
+    Runs one VMInventorySync per vCenter and republishes vm_details.json
+    (and its resident index) when any of them reports a change.
+    """
+
+    def __init__(self, output_file=SYNC_OUTPUT_FILE, checkpoint_dir=SYNC_CHECKPOINT_DIR):
+        self.output_file = output_file
+        self.checkpoint_dir = checkpoint_dir
+        self.syncs = {}
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._publisher = None
+
+    def start(self, vcenters):
+        for vcenter in vcenters:
+            sync = self.syncs.get(vcenter['server'])
+            if sync is None:
+                sync = self.syncs[vcenter['server']] = VMInventorySync(vcenter, self._dirty.set, self.checkpoint_dir)
+            sync.start()
+        if self._publisher is None or not self._publisher.is_alive():
+            self._stop.clear()
+            self._publisher = threading.Thread(target=self._publish_loop, name='vc-sync-publisher', daemon=True)
+            self._publisher.start()
+
+    def stop(self):
+        self._stop.set()
+        for sync in self.syncs.values():
+            sync.stop()
+        if self.syncs:
+            # A process that never synced must not publish an empty snapshot over the collector's
+            self.publish()
+
+    def status(self):
+        return {server: dict(sync.status, vm_count=len(sync.vms)) for server, sync in self.syncs.items()}
+
+    def publish(self):
+        self._dirty.clear()
+        all_vm_details = {server: sync.vm_details() for server, sync in self.syncs.items()}
+        publish_vm_snapshot(self.output_file, all_vm_details)
+
+    def _publish_loop(self):
+        while not self._stop.is_set():
+            if self._dirty.wait(1):
+                self.publish()
+                # Coalesce bursts of updates into one rewrite per interval
+                self._stop.wait(SYNC_PUBLISH_INTERVAL)
+
+
+inventory_sync = InventorySyncManager()
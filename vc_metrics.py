@@ -0,0 +1,227 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from fastapi.responses import PlainTextResponse
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds; vCenter calls range from milliseconds to multi-minute clones
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# Set per request by MetricsMiddleware and inherited by the threads working for it
+_request_scope = ContextVar('vc_request_scope', default=None)
+_request_round_trips = ContextVar('vc_request_round_trips', default=None)
+
+def current_operation():
+    """
+    Route template of the request being served (e.g. /jobs/{job_id}), or 'background'.
+
+    The router records the matched route in the ASGI scope before the endpoint
+    runs, so this is read lazily rather than resolved up front.
+    """
+    scope = _request_scope.get()
+    if scope is None:
+        return 'background'
+    route = scope.get('route')
+    return getattr(route, 'path', None) or 'unmatched'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(labelnames, labelvalues)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}   # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus text format.
+
+    An observation is a bisect and a few additions under a lock, cheap
+    enough to leave on around every vCenter call.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {values[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+http_request_seconds = Histogram('vc_http_request_seconds', "API request duration, including streamed bodies",
+                                 ['method', 'route', 'status'])
+request_round_trips = Histogram('vc_request_soap_round_trips', "vCenter SOAP round trips made while serving one request",
+                                ['operation'], buckets=ROUND_TRIP_BUCKETS)
+soap_calls = Counter('vc_soap_calls_total', "vCenter SOAP round trips", ['vcenter', 'operation'])
+login_seconds = Histogram('vc_login_seconds', "vCenter login (SmartConnect) duration", ['vcenter', 'result'])
+lookup_seconds = Histogram('vc_inventory_lookup_seconds', "Name to object resolution time; source is cache or vcenter",
+                           ['vcenter', 'operation', 'source'])
+task_seconds = Histogram('vc_task_seconds', "vSphere task duration from submission to completion",
+                         ['vcenter', 'operation', 'status'])
+snapshot_io_seconds = Histogram('vc_snapshot_io_seconds', "Snapshot and JSON file load/save duration", ['file', 'operation'])
+errors = Counter('vc_errors_total', "Failures talking to vCenter, by where they happened", ['vcenter', 'operation'])
+admission_wait_seconds = Histogram('vc_admission_wait_seconds', "Time a mutation request queued before it was admitted",
+                                   ['vcenter', 'operation'])
+admission_rejections = Counter('vc_admission_rejections_total', "Mutation requests turned away because the queue was full",
+                               ['vcenter', 'operation'])
+
+REGISTRY = [http_request_seconds, request_round_trips, soap_calls, login_seconds, lookup_seconds,
+            task_seconds, snapshot_io_seconds, errors, admission_wait_seconds, admission_rejections]
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+def record_error(vcenter, operation=None):
+    errors.inc(vcenter=vcenter, operation=operation or current_operation())
+
+def stub_server(stub):
+    # SoapStubAdapter keeps host:port; the fake vCenter's stub knows its server
+    host = getattr(stub, 'host', None)
+    if host is None:
+        host = getattr(getattr(stub, 'vcenter', None), 'server', 'unknown')
+    return host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+
+def instrument_stub_class(stub_class, methods=('InvokeMethod',)):
+    """
+    Count every SOAP round trip made through a stub class, per vCenter and per request.
+    """
+    for method_name in methods:
+        method = getattr(stub_class, method_name)
+        if getattr(method, '_vc_instrumented', False):
+            continue
+
+        def make_wrapper(method):
+            @wraps(method)
+            def wrapper(stub, *args, **kwargs):
+                counter = _request_round_trips.get()
+                if counter is not None:
+                    counter[0] += 1
+                soap_calls.inc(vcenter=stub_server(stub), operation=current_operation())
+                return method(stub, *args, **kwargs)
+            wrapper._vc_instrumented = True
+            return wrapper
+
+        setattr(stub_class, method_name, make_wrapper(method))
+
+try:
+    # Property reads go through InvokeMethod on the real stub, so that one method sees every round trip
+    from pyVmomi.SoapAdapter import SoapStubAdapter
+    instrument_stub_class(SoapStubAdapter)
+except ImportError:
+    pass
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each request until its last body chunk is sent.
+
+    It also sets the operation label used by the vCenter-side metrics and
+    counts the SOAP round trips made on the request's behalf, including from
+    fan-out and threadpool workers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        scope_token = _request_scope.set(scope)
+        counter = [0]
+        counter_token = _request_round_trips.set(counter)
+        status = [500]
+        started = time.perf_counter()
+        recorded = []
+
+        def record():
+            if not recorded:
+                recorded.append(True)
+                route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+                http_request_seconds.observe(time.perf_counter() - started, method=scope['method'],
+                                             route=route, status=status[0])
+                request_round_trips.observe(counter[0], operation=route)
+
+        async def send_and_time(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_and_time)
+        finally:
+            record()
+            _request_scope.reset(scope_token)
+            _request_round_trips.reset(counter_token)
+
+
+def install_metrics(app):
+    """
+    Add request instrumentation and a /metrics endpoint to a FastAPI app.
+    """
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,240 @@
+from pyVmomi import vim, vmodl
+from vc_property_collector import PropertyCollector, retrieve_properties, object_properties
+from vc_metrics import lookup_seconds, current_operation, stub_server
+from collections import OrderedDict
+import threading
+import time
+
+OBJECT_CACHE_TTL = 300              # Seconds a name -> moref entry is trusted
+OBJECT_CACHE_MISS_TTL = 5           # Seconds a name that was not found is answered as absent without a reload
+OBJECT_CACHE_MAX_ENTRIES = 100000   # Least recently used entries are evicted past this
+
+def vcenter_key(content):
+    """
+    Identify the vCenter behind a ServiceInstanceContent, whichever pooled session it came from.
+    """
+    about = getattr(content, 'about', None)
+    if about is not None and about.instanceUuid:
+        return about.instanceUuid
+    return id(content.rootFolder._stub)
+
+def retrieve_names(content, vimtype_groups, scope=None):
+    """
+    Fetch the names of every object of several type groups with one retrieval.
+
+    Returns {group: [(name, object), ...]}, where each group is a tuple of vim
+    types such as (vim.ComputeResource,). A scope (e.g. a datacenter) limits
+    the search to objects below it.
+    """
+    all_types = []
+    for vimtypes in vimtype_groups:
+        all_types.extend(vimtype for vimtype in vimtypes if vimtype not in all_types)
+    view = content.viewManager.CreateContainerView(scope or content.rootFolder, all_types, True)
+    try:
+        view_traversal = PropertyCollector.TraversalSpec(name='traverseView', type=vim.view.ContainerView,
+                                                         path='view', skip=False)
+        filter_spec = PropertyCollector.FilterSpec(
+            objectSet=[PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[view_traversal])],
+            propSet=[PropertyCollector.PropertySpec(type=vimtype, pathSet=['name']) for vimtype in all_types])
+        found = {vimtypes: [] for vimtypes in vimtype_groups}
+        for obj_content in retrieve_properties(content, filter_spec):
+            name = object_properties(obj_content).get('name')
+            for vimtypes in vimtype_groups:
+                if isinstance(obj_content.obj, vimtypes):
+                    found[vimtypes].append((name, obj_content.obj))
+    finally:
+        view.Destroy()
+    return found
+
+
+class ObjectCache:
+    """
+    Per-vCenter name -> moref cache with a TTL and LRU eviction.
+
+    A miss reloads every name of the requested type in one PropertyCollector
+    call, so the scan that used to run on every lookup runs at most once per
+    TTL. Only the type and moId are kept; hits are rebound to the caller's
+    session. Entries are dropped when the inventory sync reports a rename or
+    removal, or when a caller hits a stale moref (see retry_stale).
+
+    Names a reload did not find are remembered for miss_ttl, so repeated
+    lookups of a missing name do not reload the whole type each time; the
+    inventory sync forgets them as soon as an object takes the name.
+    """
+
+    def __init__(self, ttl=OBJECT_CACHE_TTL, max_entries=OBJECT_CACHE_MAX_ENTRIES, miss_ttl=OBJECT_CACHE_MISS_TTL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.miss_ttl = miss_ttl
+        self._entries = OrderedDict()   # (vcenter, types, scope moId, name) -> (type, moId, expires)
+        self._by_moid = {}              # (vcenter, moId) -> set of entry keys
+        self._groups = {}               # (vcenter, types, scope moId) -> set of entry keys, replaced by a reload
+        self._misses = OrderedDict()    # entry key -> expires, for names a reload did not find
+        self._miss_names = {}           # (vcenter, name) -> set of miss keys
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0, 'invalidations': 0}
+
+    def lookup(self, content, vimtypes, name, scope=None):
+        return self.resolve(content, [(vimtypes, name)], scope)[0]
+
+    def resolve(self, content, wanted, scope=None):
+        """
+        Resolve [(vimtypes, name), ...] to objects (None when absent), in order.
+
+        All misses are loaded together with a single retrieval, whatever mix
+        of types they are.
+        """
+        vcenter = vcenter_key(content)
+        scope_id = scope._moId if scope is not None else None
+        stub = content.rootFolder._stub
+        results = [None] * len(wanted)
+        missing = []
+        started = now = time.monotonic()
+        with self._lock:
+            for index, (vimtypes, name) in enumerate(wanted):
+                key = (vcenter, tuple(vimtypes), scope_id, name)
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] > now:
+                    self._entries.move_to_end(key)
+                    results[index] = entry[0](entry[1], stub)
+                    self._metrics['hits'] += 1
+                elif self._misses.get(key, 0) > now:
+                    # Not there a moment ago; answer None without another reload
+                    self._metrics['hits'] += 1
+                    self._metrics['negative_hits'] += 1
+                else:
+                    missing.append(index)
+                    self._metrics['misses'] += 1
+        if not missing:
+            self._observe(stub, 'cache', started)
+            return results
+
+        groups = list(dict.fromkeys(tuple(wanted[index][0]) for index in missing))
+        found = retrieve_names(content, groups, scope)
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._metrics['loads'] += 1
+            for vimtypes, objects in found.items():
+                # A reload replaces the group, so names that moved or vanished do not linger
+                for key in list(self._groups.get((vcenter, vimtypes, scope_id), ())):
+                    self._drop(key)
+                seen = set()
+                for name, obj in objects:
+                    # First object with a name wins, as in a linear scan
+                    if name in seen:
+                        continue
+                    seen.add(name)
+                    self._store((vcenter, vimtypes, scope_id, name), obj, expires)
+            self._evict()
+        unresolved = []
+        for index in missing:
+            vimtypes, name = wanted[index]
+            for found_name, obj in found[tuple(vimtypes)]:
+                if found_name == name:
+                    results[index] = obj
+                    break
+            else:
+                unresolved.append((vcenter, tuple(vimtypes), scope_id, name))
+        if unresolved and self.miss_ttl > 0:
+            misses_expire = time.monotonic() + self.miss_ttl
+            with self._lock:
+                for key in unresolved:
+                    self._remember_miss(key, misses_expire)
+        self._observe(stub, 'vcenter', started)
+        return results
+
+    def _observe(self, stub, source, started):
+        lookup_seconds.observe(time.monotonic() - started, vcenter=stub_server(stub),
+                               operation=current_operation(), source=source)
+
+    def _store(self, key, obj, expires):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._unlink(key, old)
+        self._forget_miss(key)
+        self._entries[key] = (type(obj), obj._moId, expires)
+        self._by_moid.setdefault((key[0], obj._moId), set()).add(key)
+        self._groups.setdefault(key[:3], set()).add(key)
+
+    def _unlink(self, key, entry):
+        for index, index_key in ((self._by_moid, (key[0], entry[1])), (self._groups, key[:3])):
+            keys = index.get(index_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[index_key]
+
+    def _drop(self, key):
+        # Remove an entry from the entries and from both indexes
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._unlink(key, entry)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, entry = self._entries.popitem(last=False)
+            self._unlink(key, entry)
+            self._metrics['evictions'] += 1
+
+    def _remember_miss(self, key, expires):
+        self._misses[key] = expires
+        self._misses.move_to_end(key)
+        self._miss_names.setdefault((key[0], key[3]), set()).add(key)
+        while len(self._misses) > self.max_entries:
+            self._forget_miss(next(iter(self._misses)))
+
+    def _forget_miss(self, key):
+        if self._misses.pop(key, None) is not None:
+            keys = self._miss_names[(key[0], key[3])]
+            keys.discard(key)
+            if not keys:
+                del self._miss_names[(key[0], key[3])]
+
+    def invalidate_object(self, vcenter, moId):
+        """
+        Forget every name that resolved to an object, e.g. after it was renamed or destroyed.
+        """
+        with self._lock:
+            for key in list(self._by_moid.get((vcenter, moId), ())):
+                self._drop(key)
+                self._metrics['invalidations'] += 1
+
+    def invalidate_name(self, vcenter, name):
+        """
+        Forget that a name was not found, e.g. once an object was created or renamed to it.
+        """
+        with self._lock:
+            for key in list(self._miss_names.get((vcenter, name), ())):
+                self._forget_miss(key)
+
+    def clear(self, vcenter=None):
+        with self._lock:
+            for group in [group for group in self._groups if vcenter is None or group[0] == vcenter]:
+                for key in list(self._groups.get(group, ())):
+                    self._drop(key)
+                    self._metrics['invalidations'] += 1
+            for key in [key for key in self._misses if vcenter is None or key[0] == vcenter]:
+                self._forget_miss(key)
+
+    def retry_stale(self, content, call):
+        """
+        Run call(); if it trips over a moref vCenter no longer knows, drop it and run call() once more.
+        """
+        try:
+            return call()
+        except vmodl.fault.ManagedObjectNotFound as e:
+            if e.obj is None:
+                raise
+            self.invalidate_object(vcenter_key(content), e.obj._moId)
+            return call()
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics, entries=len(self._entries), negative_entries=len(self._misses))
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_ratio'] = round(metrics['hits'] / lookups, 3) if lookups else None
+        return metrics
+
+
+# Shared by every module that looks objects up by name
+object_cache = ObjectCache()
@@ -0,0 +1,159 @@
+from typing import Optional
+from fastapi import APIRouter, FastAPI, HTTPException
+from pydantic import BaseModel
+import bisect
+import threading
+from vc_capacity import CAPACITY_FILE, get_capacity
+from vc_generations import generation_counter
+from vc_metrics import install_metrics
+
+PLACEMENT_GHZ_PER_VCPU = 1.0         # CPU demand assumed per vCPU when comparing against free GHz
+PLACEMENT_DATASTORE_HEADROOM = 0.1   # Fraction of a datastore's capacity left free after placing a disk
+PLACEMENT_DEFAULT_CANDIDATES = 5
+PLACEMENT_FIELDS = ('vcenter_server', 'datacenter_name', 'cluster_name', 'datastore_name')
+
+router = APIRouter()
+
+class PlacementRequest(BaseModel):
+    cpu: int
+    memory: int  # In GB
+    disk_size_gb: int
+    network_name: Optional[str] = None
+    # Optional constraints; candidates are only taken from what matches
+    vcenter_server: Optional[str] = None
+    datacenter_name: Optional[str] = None
+    cluster_name: Optional[str] = None
+    datastore_name: Optional[str] = None
+    limit: int = PLACEMENT_DEFAULT_CANDIDATES
+
+
+class PlacementIndex:
+    """
+    Clusters ordered by free memory, each with its datastores ordered by free space.
+
+    Built from the capacity rollups and rebuilt whenever /collect-capacity
+    publishes new ones. A recommendation walks clusters from the most free
+    memory down and stops at the first that cannot fit the VM, so it never
+    touches vCenter. Auto-placements reserve their share until the next
+    refresh, so a burst of creates spreads out instead of piling onto one cluster.
+    """
+
+    def __init__(self, placement=None):
+        self._clusters = {key: dict(entry, datastores=[dict(datastore) for datastore in entry['datastores']])
+                          for key, entry in (placement or {}).items()}
+        self._order = sorted((-entry['memory_free_gb'], key) for key, entry in self._clusters.items())
+        self._lock = threading.Lock()
+
+    def recommend(self, request, limit=None):
+        with self._lock:
+            return self._candidates(request, limit or request.limit)
+
+    def place(self, request):
+        """
+        Pick the best candidate for a VM and reserve its capacity; None if nothing fits.
+        """
+        with self._lock:
+            candidates = self._candidates(request, 1)
+            if not candidates:
+                return None
+            candidate = candidates[0]
+            key = f"{candidate['vcenter_server']}/{candidate['datacenter_name']}/{candidate['cluster_name']}"
+            entry = self._clusters[key]
+            self._order.remove((-entry['memory_free_gb'], key))
+            entry['memory_free_gb'] = round(entry['memory_free_gb'] - request.memory, 2)
+            entry['cpu_free_ghz'] = round(entry['cpu_free_ghz'] - request.cpu * PLACEMENT_GHZ_PER_VCPU, 2)
+            bisect.insort(self._order, (-entry['memory_free_gb'], key))
+            for datastore in entry['datastores']:
+                if datastore['name'] == candidate['datastore_name']:
+                    datastore['free_gb'] = round(datastore['free_gb'] - request.disk_size_gb, 2)
+            entry['datastores'].sort(key=lambda datastore: -datastore['free_gb'])
+            return candidate
+
+    def _candidates(self, request, limit):
+        cpu_ghz = request.cpu * PLACEMENT_GHZ_PER_VCPU
+        candidates = []
+        for negative_free, key in self._order:
+            if -negative_free < request.memory:
+                break   # Every cluster after this one has even less free memory
+            entry = self._clusters[key]
+            if (request.vcenter_server is not None and entry['vcenter_server'] != request.vcenter_server
+                    or request.datacenter_name is not None and entry['datacenter_name'] != request.datacenter_name
+                    or request.cluster_name is not None and entry['cluster_name'] != request.cluster_name
+                    or entry['cpu_free_ghz'] < cpu_ghz
+                    or request.network_name is not None and request.network_name not in entry['networks']):
+                continue
+            datastore = next((datastore for datastore in entry['datastores']
+                              if (request.datastore_name is None or datastore['name'] == request.datastore_name)
+                              and datastore['free_gb'] - request.disk_size_gb
+                              >= datastore['capacity_gb'] * PLACEMENT_DATASTORE_HEADROOM), None)
+            if datastore is None:
+                continue
+            candidates.append({
+                'vcenter_server': entry['vcenter_server'],
+                'datacenter_name': entry['datacenter_name'],
+                'cluster_name': entry['cluster_name'],
+                'datastore_name': datastore['name'],
+                'network_name': request.network_name,
+                # What the cluster and datastore would have left with this VM on them
+                'memory_free_gb': round(entry['memory_free_gb'] - request.memory, 2),
+                'cpu_free_ghz': round(entry['cpu_free_ghz'] - cpu_ghz, 2),
+                'datastore_free_gb': round(datastore['free_gb'] - request.disk_size_gb, 2),
+            })
+            if len(candidates) >= limit:
+                break
+        return candidates
+
+
+_index = None   # (capacity generation, PlacementIndex)
+_index_lock = threading.Lock()
+
+def get_placement_index():
+    global _index
+    generation = generation_counter(CAPACITY_FILE).value()
+    cached = _index
+    if cached is None or cached[0] != generation:
+        with _index_lock:
+            cached = _index
+            if cached is None or cached[0] != generation:
+                cached = _index = (generation, PlacementIndex(get_capacity().get('placement')))
+    return cached[1]
+
+def apply_placement(vm_creation_request):
+    """
+    Fill in a create request's vCenter, datacenter, cluster and datastore from
+    the placement index when auto_place is set; fields already given are kept
+    as constraints. Returns the chosen candidate, or None when not auto-placing.
+    """
+    if not getattr(vm_creation_request, 'auto_place', False):
+        missing = [field for field in PLACEMENT_FIELDS if getattr(vm_creation_request, field) is None]
+        if missing:
+            raise HTTPException(status_code=400,
+                                detail=f"Missing {', '.join(missing)}; set auto_place to have them chosen")
+        return None
+    candidate = get_placement_index().place(PlacementRequest(
+        cpu=vm_creation_request.cpu, memory=vm_creation_request.memory,
+        disk_size_gb=vm_creation_request.disk_size_gb, network_name=vm_creation_request.network_name,
+        **{field: getattr(vm_creation_request, field) for field in PLACEMENT_FIELDS}))
+    if candidate is None:
+        raise HTTPException(status_code=409, detail="No cluster has room for this VM")
+    for field in PLACEMENT_FIELDS:
+        setattr(vm_creation_request, field, candidate[field])
+    return candidate
+
+@router.post("/recommend-placement", tags=["VM"])
+async def recommend_placement(request: PlacementRequest):
+    """
+    Best clusters and datastores for a VM across every vCenter, from the last
+    /collect-capacity; answered from memory without contacting vCenter.
+    """
+    if request.limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    candidates = get_placement_index().recommend(request)
+    if not candidates:
+        raise HTTPException(status_code=404, detail="No cluster has room for this VM")
+    return {"candidates": candidates}
+
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(router)
+install_metrics(app)
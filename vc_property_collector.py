@@ -0,0 +1,315 @@
+from pyVmomi import vim, vmodl
+
+# Only these paths are fetched for each VM; everything in vm_details.json is built from them
+VM_PROPERTIES = ['summary.config.name', 'network', 'guest.net', 'config.hardware.device', 'datastore']
+
+# /vms field -> the VM property paths needed to fill it; vm_id is the moId and costs nothing
+VM_FIELD_PATHS = {
+    'vm_name': ['summary.config.name'],
+    'networks': ['network'],
+    'datastores': ['datastore'],
+    'ip_addresses': ['guest.net'],
+    'storage': ['config.hardware.device'],
+    'power_state': ['runtime.powerState'],
+    'cluster': ['runtime.host'],
+}
+
+# Objects returned per RetrievePropertiesEx/ContinueRetrievePropertiesEx page
+PAGE_SIZE = 1000
+
+PropertyCollector = vmodl.query.PropertyCollector
+
+
+def container_object_spec(content, vimtype, traversals=None):
+    """
+    Build an ObjectSpec that walks a ContainerView of vimtype (or a list of types) from the root folder.
+
+    The view itself is skipped; traversals are followed from every object in it.
+    The caller is responsible for destroying the returned view.
+    """
+    vimtypes = vimtype if isinstance(vimtype, list) else [vimtype]
+    view = content.viewManager.CreateContainerView(content.rootFolder, vimtypes, True)
+    view_traversal = PropertyCollector.TraversalSpec(
+        name='traverseView', type=vim.view.ContainerView, path='view', skip=False,
+        selectSet=traversals or [])
+    return view, PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[view_traversal])
+
+
+def retrieve_properties(content, filter_spec, page_size=PAGE_SIZE):
+    """
+    Yield ObjectContent for a filter spec, following ContinueRetrievePropertiesEx pages.
+    """
+    collector = content.propertyCollector
+    options = PropertyCollector.RetrieveOptions(maxObjects=page_size)
+    result = collector.RetrievePropertiesEx(specSet=[filter_spec], options=options)
+    while result is not None:
+        for obj_content in result.objects:
+            yield obj_content
+        if not result.token:
+            break
+        result = collector.ContinueRetrievePropertiesEx(token=result.token)
+
+
+def object_properties(obj_content):
+    return {prop.name: prop.val for prop in obj_content.propSet}
+
+
+def vm_filter_spec(object_spec, vm_properties=VM_PROPERTIES):
+    return PropertyCollector.FilterSpec(
+        objectSet=[object_spec],
+        propSet=[
+            PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=vm_properties),
+            PropertyCollector.PropertySpec(type=vim.Network, pathSet=['name']),
+            PropertyCollector.PropertySpec(type=vim.Datastore, pathSet=['name']),
+        ])
+
+
+def vm_traversals():
+    # Follow each VM to its networks and datastores so their names come back in the same call
+    return [
+        PropertyCollector.TraversalSpec(name='vmToNetwork', type=vim.VirtualMachine, path='network', skip=False),
+        PropertyCollector.TraversalSpec(name='vmToDatastore', type=vim.VirtualMachine, path='datastore', skip=False),
+    ]
+
+
+def hierarchy_traversals():
+    """
+    Walk root folder -> datacenters -> host folders -> clusters -> their hosts, datastores and networks.
+    """
+    select = PropertyCollector.SelectionSpec
+    return [
+        PropertyCollector.TraversalSpec(name='folderToChild', type=vim.Folder, path='childEntity', skip=False,
+                                        selectSet=[select(name='folderToChild'), select(name='datacenterToHostFolder'),
+                                                   select(name='clusterToHost'), select(name='clusterToDatastore'),
+                                                   select(name='clusterToNetwork')]),
+        PropertyCollector.TraversalSpec(name='datacenterToHostFolder', type=vim.Datacenter, path='hostFolder',
+                                        skip=False, selectSet=[select(name='folderToChild')]),
+        PropertyCollector.TraversalSpec(name='clusterToHost', type=vim.ClusterComputeResource, path='host', skip=False),
+        PropertyCollector.TraversalSpec(name='clusterToDatastore', type=vim.ClusterComputeResource, path='datastore',
+                                        skip=False),
+        PropertyCollector.TraversalSpec(name='clusterToNetwork', type=vim.ClusterComputeResource, path='network',
+                                        skip=False),
+    ]
+
+
+def ip_addresses(guest_net):
+    addresses = []
+    for net_info in guest_net or []:
+        if net_info.ipConfig is not None and net_info.ipConfig.ipAddress:
+            for ip in net_info.ipConfig.ipAddress:
+                addresses.append(ip.ipAddress)
+    return addresses
+
+def disk_details(devices):
+    disks = []
+    for device in devices or []:
+        if isinstance(device, vim.vm.device.VirtualDisk):
+            disks.append({
+                'label': device.deviceInfo.label,
+                'size_GB': device.capacityInKB / 1024 / 1024
+            })
+    return disks
+
+def new_vm_record():
+    return {'vm_name': None, 'network': [], 'datastore': [], 'ip_addresses': [], 'storage': [],
+            'power_state': None, 'host': None}
+
+def update_vm_record(record, path, value):
+    """
+    Fold one retrieved VM property into a JSON-serialisable record.
+
+    Networks and datastores are kept as moIds so renames only touch the names table.
+    """
+    if path == 'summary.config.name':
+        record['vm_name'] = value
+    elif path == 'network':
+        record['network'] = [net._moId for net in value or [] if isinstance(net, vim.Network)]
+    elif path == 'datastore':
+        record['datastore'] = [ds._moId for ds in value or []]
+    elif path == 'guest.net':
+        record['ip_addresses'] = ip_addresses(value)
+    elif path == 'config.hardware.device':
+        record['storage'] = disk_details(value)
+    elif path == 'runtime.powerState':
+        record['power_state'] = str(value) if value is not None else None
+    elif path == 'runtime.host':
+        record['host'] = value._moId if value is not None else None
+    return record
+
+def build_vm_detail(record, names):
+    return {
+        'vm_name': record['vm_name'],
+        'networks': [names[moId] for moId in record['network'] if moId in names],
+        'storage': list(record['storage']),
+        'datastores': [names[moId] for moId in record['datastore'] if moId in names],
+        'ip_addresses': list(record['ip_addresses'])
+    }
+
+
+def collect_vm_details(content, page_size=PAGE_SIZE):
+    """
+    Collect the vm_details.json entries for one vCenter with a single paged
+    PropertyCollector retrieval instead of one SOAP call per property read.
+    """
+    view, object_spec = container_object_spec(content, vim.VirtualMachine, vm_traversals())
+    try:
+        records = []
+        names = {}
+        for obj_content in retrieve_properties(content, vm_filter_spec(object_spec), page_size):
+            if isinstance(obj_content.obj, vim.VirtualMachine):
+                record = new_vm_record()
+                for prop in obj_content.propSet:
+                    update_vm_record(record, prop.name, prop.val)
+                records.append(record)
+            else:
+                names[obj_content.obj._moId] = object_properties(obj_content).get('name')
+    finally:
+        view.Destroy()
+
+    return [build_vm_detail(record, names) for record in records]
+
+
+def names_by_moid(content, vimtypes):
+    """
+    Map moId -> name for every object of the given types, in one retrieval.
+    """
+    view, object_spec = container_object_spec(content, list(vimtypes))
+    try:
+        filter_spec = PropertyCollector.FilterSpec(
+            objectSet=[object_spec],
+            propSet=[PropertyCollector.PropertySpec(type=vimtype, pathSet=['name']) for vimtype in vimtypes])
+        return {obj_content.obj._moId: object_properties(obj_content).get('name')
+                for obj_content in retrieve_properties(content, filter_spec)}
+    finally:
+        view.Destroy()
+
+
+def iter_vm_details(content, page_size=PAGE_SIZE):
+    """
+    Yield the vm_details.json entries for one vCenter one VM at a time.
+
+    Network and datastore names are fetched up front (there are few of them),
+    so each VM can be emitted as soon as its page arrives and at most one page
+    of VMs is held in memory.
+    """
+    names = names_by_moid(content, [vim.Network, vim.Datastore])
+    view, object_spec = container_object_spec(content, vim.VirtualMachine)
+    try:
+        filter_spec = PropertyCollector.FilterSpec(
+            objectSet=[object_spec],
+            propSet=[PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=VM_PROPERTIES)])
+        for obj_content in retrieve_properties(content, filter_spec, page_size):
+            record = new_vm_record()
+            for prop in obj_content.propSet:
+                update_vm_record(record, prop.name, prop.val)
+            yield build_vm_detail(record, names)
+    finally:
+        view.Destroy()
+
+
+def moid_key(moId):
+    # vm-9 sorts before vm-10; the order /vms pages in
+    prefix, _, number = moId.rpartition('-')
+    return (prefix, int(number)) if number.isdigit() else (moId, -1)
+
+
+def cluster_names_by_host(content):
+    """
+    Map host moId -> name of the cluster it belongs to, in one retrieval.
+    """
+    view, object_spec = container_object_spec(content, [vim.HostSystem, vim.ClusterComputeResource])
+    try:
+        filter_spec = PropertyCollector.FilterSpec(
+            objectSet=[object_spec],
+            propSet=[PropertyCollector.PropertySpec(type=vim.HostSystem, pathSet=['parent']),
+                     PropertyCollector.PropertySpec(type=vim.ClusterComputeResource, pathSet=['name'])])
+        parents = {}
+        clusters = {}
+        for obj_content in retrieve_properties(content, filter_spec):
+            props = object_properties(obj_content)
+            if isinstance(obj_content.obj, vim.HostSystem):
+                parent = props.get('parent')
+                parents[obj_content.obj._moId] = parent._moId if parent is not None else None
+            else:
+                clusters[obj_content.obj._moId] = props.get('name')
+        # Standalone hosts sit under a plain ComputeResource and have no cluster
+        return {host: clusters.get(parent) for host, parent in parents.items()}
+    finally:
+        view.Destroy()
+
+
+def page_vm_fields(content, fields, limit, after=None, name_prefix=None, power_state=None, cluster=None,
+                   page_size=PAGE_SIZE):
+    """
+    Return (VMs, more) for one page of /vms: up to limit VMs in moId order
+    after the moId `after`, each a {'vm_id': ..., field: value} dict.
+
+    Only the property paths the fields and filters need are fetched. The
+    first retrieval walks every VM with just the filter paths (none at all
+    when unfiltered); the requested fields are then retrieved for the page's
+    VMs only, with their network and datastore names in the same call.
+    """
+    filter_paths = []
+    if name_prefix:
+        filter_paths.append('summary.config.name')
+    if power_state:
+        filter_paths.append('runtime.powerState')
+    if cluster or 'cluster' in fields:
+        filter_paths.append('runtime.host')
+    clusters = cluster_names_by_host(content) if 'runtime.host' in filter_paths else {}
+
+    view, object_spec = container_object_spec(content, vim.VirtualMachine)
+    try:
+        filter_spec = PropertyCollector.FilterSpec(
+            objectSet=[object_spec],
+            propSet=[PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=filter_paths)])
+        candidates = []
+        prefix = name_prefix.casefold() if name_prefix else None
+        after_key = moid_key(after) if after else None
+        for obj_content in retrieve_properties(content, filter_spec, page_size):
+            if after_key is not None and moid_key(obj_content.obj._moId) <= after_key:
+                continue
+            record = new_vm_record()
+            for prop in obj_content.propSet:
+                update_vm_record(record, prop.name, prop.val)
+            if prefix and not (record['vm_name'] or '').casefold().startswith(prefix):
+                continue
+            if power_state and record['power_state'] != power_state:
+                continue
+            if cluster and (clusters.get(record['host']) or '').casefold() != cluster.casefold():
+                continue
+            candidates.append((obj_content.obj, record))
+    finally:
+        view.Destroy()
+
+    candidates.sort(key=lambda candidate: moid_key(candidate[0]._moId))
+    more = len(candidates) > limit
+    candidates = candidates[:limit]
+
+    paths = [path for field in fields for path in VM_FIELD_PATHS.get(field, []) if path not in filter_paths]
+    names = {}
+    if candidates and paths:
+        wants_names = 'networks' in fields or 'datastores' in fields
+        records = {vm._moId: record for vm, record in candidates}
+        prop_set = [PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=list(dict.fromkeys(paths)))]
+        if wants_names:
+            prop_set += [PropertyCollector.PropertySpec(type=vim.Network, pathSet=['name']),
+                         PropertyCollector.PropertySpec(type=vim.Datastore, pathSet=['name'])]
+        filter_spec = PropertyCollector.FilterSpec(
+            objectSet=[PropertyCollector.ObjectSpec(obj=vm, skip=False, selectSet=vm_traversals() if wants_names else [])
+                       for vm, _ in candidates],
+            propSet=prop_set)
+        for obj_content in retrieve_properties(content, filter_spec, page_size):
+            if isinstance(obj_content.obj, vim.VirtualMachine):
+                record = records[obj_content.obj._moId]
+                for prop in obj_content.propSet:
+                    update_vm_record(record, prop.name, prop.val)
+            else:
+                names[obj_content.obj._moId] = object_properties(obj_content).get('name')
+
+    vms = []
+    for vm, record in candidates:
+        detail = dict(build_vm_detail(record, names), power_state=record['power_state'],
+                      cluster=clusters.get(record['host']))
+        vms.append({'vm_id': vm._moId, **{field: detail[field] for field in fields}})
+    return vms, more
@@ -0,0 +1,210 @@
+from typing import Optional
+from fastapi import APIRouter, FastAPI, Query
+from fastapi.concurrency import run_in_threadpool
+from array import array
+from collections import Counter
+import bisect
+import re
+import threading
+from vc_inventory_store import get_inventory_store
+from vc_metrics import install_metrics
+from vc_vm_details import VM_DETAILS_FILE
+from vc_vm_index import get_vm_index
+from vc_generations import generation_counter
+
+SEARCH_KINDS = ('vm', 'host', 'datastore', 'network')
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 200
+SEARCH_SCAN_LIMIT = 1000          # Prefix and substring matches ranked per query; the rest are never looked at
+SEARCH_FUZZY_POSTINGS = 20000     # Trigram postings counted when looking for typo candidates
+SEARCH_FUZZY_CANDIDATES = 200     # Candidates scored exactly after counting
+SEARCH_FUZZY_THRESHOLD = 0.3      # Least trigram similarity a typo match needs
+
+# Separators are ignored when matching trigrams, so "webprod01" finds "web-prod-01"
+_SEPARATORS = re.compile(r'[\W_]+')
+
+# Match kinds, best first; a better match always outranks a worse one
+MATCHES = ('exact', 'prefix', 'substring', 'fuzzy')
+
+router = APIRouter()
+
+def trigrams(text):
+    """
+    Trigrams of a name with separators removed, padded like pg_trgm so the
+    start and end of a name count as well.
+    """
+    padded = f"  {_SEPARATORS.sub('', text.casefold())} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    Name search over VMs, hosts, datastores and networks.
+
+    Names are kept casefolded in sorted order, so a prefix is one bisect and
+    a walk along the matching run (what a trie gives, without a node per
+    character). A trigram inverted index narrows substring matches to the
+    names that hold every trigram of the query, and finds names sharing the
+    most trigrams with it when nothing matches literally, which is what makes
+    typos tolerable. Results rank exact, then prefix, then substring, then
+    similar names; shorter and earlier matches first within a tier.
+    """
+
+    def __init__(self, objects=()):
+        self._objects = []   # (kind, vcenter, name)
+        self._folded = []
+        seen = set()
+        for obj in objects:
+            obj = tuple(obj)
+            if obj[2] and obj not in seen:
+                seen.add(obj)
+                self._objects.append(obj)
+                self._folded.append(obj[2].casefold())
+        order = sorted(range(len(self._folded)), key=self._folded.__getitem__)
+        self._sorted = [self._folded[i] for i in order]
+        self._sorted_ids = array('I', order)
+        self._postings = {}   # trigram -> ids in ascending order
+        self._gram_counts = array('H')
+        for i, name in enumerate(self._folded):
+            grams = trigrams(name)
+            self._gram_counts.append(min(len(grams), 0xFFFF))
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings is None:
+                    postings = self._postings[gram] = array('I')
+                postings.append(i)
+
+    def __len__(self):
+        return len(self._objects)
+
+    def search(self, query, kinds=None, vcenter=None, limit=SEARCH_DEFAULT_LIMIT, fuzzy=True):
+        folded = query.strip().casefold()
+        if not folded:
+            return []
+
+        def wanted(i):
+            kind, server, _ = self._objects[i]
+            return (kinds is None or kind in kinds) and (vcenter is None or server == vcenter)
+
+        scores = {}   # id -> (match, rank within the match), lowest first
+        # Exact and prefix: one run of the sorted names
+        start = bisect.bisect_left(self._sorted, folded)
+        for position in range(start, min(start + SEARCH_SCAN_LIMIT, len(self._sorted))):
+            name = self._sorted[position]
+            if not name.startswith(folded):
+                break
+            i = self._sorted_ids[position]
+            if wanted(i):
+                scores[i] = (0 if name == folded else 1, len(name))
+        if len(scores) < limit:
+            for i in self._containing(folded):
+                if i not in scores and wanted(i):
+                    name = self._folded[i]
+                    scores[i] = (2, name.index(folded) + len(name))
+        if fuzzy and len(scores) < limit:
+            for i, similarity in self._similar(folded):
+                if i not in scores and wanted(i):
+                    scores[i] = (3, -similarity)
+        ranked = sorted(scores, key=lambda i: (scores[i], self._folded[i], i))[:limit]
+        return [self._result(i, *scores[i]) for i in ranked]
+
+    def _result(self, i, match, rank):
+        kind, server, name = self._objects[i]
+        result = {'kind': kind, 'name': name, 'vcenter': server, 'match': MATCHES[match]}
+        if MATCHES[match] == 'fuzzy':
+            result['similarity'] = round(-rank, 3)
+        return result
+
+    def _containing(self, folded):
+        # Ids of names that contain folded, at most SEARCH_SCAN_LIMIT of them
+        grams = {gram for gram in trigrams(folded) if ' ' not in gram}
+        if grams:
+            # Every match holds every trigram, so checking the rarest trigram's names is enough;
+            # a containment check is cheaper than intersecting the longer lists
+            candidates = min((self._postings.get(gram, ()) for gram in grams), key=len)
+        else:
+            # Too short to have a trigram: scan the names
+            candidates = range(len(self._folded))
+        found = []
+        for i in candidates:
+            if folded in self._folded[i]:
+                found.append(i)
+                if len(found) >= SEARCH_SCAN_LIMIT:
+                    break
+        return found
+
+    def _similar(self, folded):
+        """
+        (id, similarity) of names sharing enough trigrams with folded.
+
+        Candidates are counted from the rarest trigrams of the query first, so
+        a trigram half the estate shares does not dominate the cost; the best
+        candidates are then scored exactly with the Dice coefficient.
+        """
+        grams = trigrams(folded)
+        lists = sorted((self._postings[gram] for gram in grams if gram in self._postings), key=len)
+        counts = Counter()
+        counted = 0
+        for postings in lists:
+            if counted and counted + len(postings) > SEARCH_FUZZY_POSTINGS:
+                break
+            counts.update(postings)
+            counted += len(postings)
+        similar = []
+        for i, _ in counts.most_common(SEARCH_FUZZY_CANDIDATES):
+            shared = len(grams & trigrams(self._folded[i]))
+            similarity = 2 * shared / (len(grams) + self._gram_counts[i])
+            if similarity >= SEARCH_FUZZY_THRESHOLD:
+                similar.append((i, similarity))
+        return similar
+
+
+_index = None   # ((VM snapshot generation, store generation), SearchIndex)
+_index_lock = threading.Lock()
+
+def build_search_index():
+    store = get_inventory_store()
+    # Seed the store from existing captures first, so seeding does not invalidate the index built below
+    store.bootstrap('cluster_info', 'clusters.json')
+    store.bootstrap('hierarchy', 'detailed_hierarchical_clusters.json')
+    generations = (generation_counter(VM_DETAILS_FILE).value(), store.generation.value())
+    vms = (('vm', server, name) for server, name in get_vm_index(VM_DETAILS_FILE).iter_names())
+    return generations, SearchIndex(list(vms) + list(store.object_names()))
+
+def get_search_index():
+    """
+    Return the resident search index, rebuilding it when a new VM snapshot or
+    inventory capture has been published by this or any other process.
+    """
+    global _index
+    store = get_inventory_store()
+    generations = (generation_counter(VM_DETAILS_FILE).value(), store.generation.value())
+    cached = _index
+    if cached is None or cached[0] != generations:
+        with _index_lock:
+            cached = _index
+            if cached is None or cached[0] != generations:
+                cached = _index = build_search_index()
+    return cached[1]
+
+@router.get("/search", tags=["VM"])
+async def search(q: str = Query(..., min_length=1), kind: Optional[str] = Query(None, pattern=f"^({'|'.join(SEARCH_KINDS)})$"),
+                 vcenter: Optional[str] = None, fuzzy: bool = True,
+                 limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT)):
+    """
+    VMs, hosts, datastores and networks whose names match q: exact, prefix,
+    substring, then (with fuzzy) names close enough to allow for typos.
+    Served from memory; the index follows the last captures.
+    """
+    def lookup():
+        # The first search after a capture rebuilds the index, so keep it off the event loop
+        index = get_search_index()
+        return len(index), index.search(q, (kind,) if kind else None, vcenter, limit, fuzzy)
+
+    objects, results = await run_in_threadpool(lookup)
+    return {"query": q, "objects": objects, "results": results}
+
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(router)
+install_metrics(app)
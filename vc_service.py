@@ -0,0 +1,82 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+import json
+import os
+from vc_common import load_credentials, credentials
+from vc_session_pool import session_pool
+from vc_inventory_sync import inventory_sync
+from vc_inventory_store import get_inventory_store
+from vc_vm_index import get_vm_index
+from vc_metrics import install_metrics
+from vc_tasks import jobs_router
+from vc_vm_details import router as vm_details_router, collect_router as vm_details_collect_router, VM_DETAILS_FILE
+import vc_capacity
+import vc_changes
+import vc_for_vm
+import vc_heirarichal_data
+import vc_json
+import vc_placement
+import vc_search
+import vc_vm_cluster_details
+import vm
+
+# One process serving every feature: run with `uvicorn vc_service:app`.
+# Sessions, the object cache, the VM indexes, the inventory store and the task
+# tracker are module-level singletons, so every router below shares them.
+#
+# Under several workers, set VC_SERVICE_ROLE=api and run vc_collector alongside:
+#   uvicorn vc_collector:app --port 8001
+#   VC_SERVICE_ROLE=api gunicorn -k uvicorn.workers.UvicornWorker -w 8 vc_service:app
+# API workers then leave the capture and sync routes to the collector, map its
+# binary snapshots (page cache shared by every worker) and the SQLite store,
+# and remap whenever it bumps a snapshot's generation counter.
+#
+# Mutations (vm.router) and /jobs stay with the collector too: the task tracker,
+# admission controller, bulk batches and placement reservations live in process
+# memory, so the proxy must send those paths to the collector. Their caps then
+# hold once per deployment (ADMISSION_MAX_TASKS in flight and ADMISSION_MAX_QUEUE
+# queued per vCenter) instead of once per worker. Session pools stay per process:
+# a vCenter sees at most POOL_MAX_SIZE sessions from the collector plus
+# POOL_MAX_SIZE from each API worker serving live lookups (/find-vm/{vm_name}).
+SERVICE_ROLE = os.environ.get('VC_SERVICE_ROLE', 'all')   # 'all' or 'api'
+
+@asynccontextmanager
+async def lifespan(app):
+    try:
+        vcenters = load_credentials()
+        print(f"Loaded credentials for {len(vcenters)} vCenters from {credentials.source}")
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Failed to load {credentials.source} with error: {e}")
+    # Map the last snapshots and open the store before the first request needs them
+    await run_in_threadpool(get_vm_index, VM_DETAILS_FILE)
+    await run_in_threadpool(get_vm_index, 'vcenters.json')
+    await run_in_threadpool(get_inventory_store)
+    await run_in_threadpool(vc_search.get_search_index)
+    yield
+    await run_in_threadpool(inventory_sync.stop)
+    await run_in_threadpool(session_pool.close_all)
+    credentials.stop_watching()
+
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(vm_details_router)
+app.include_router(vc_heirarichal_data.router)
+app.include_router(vc_vm_cluster_details.router)
+app.include_router(vc_for_vm.router)
+app.include_router(vc_capacity.router)
+app.include_router(vc_placement.router)
+app.include_router(vc_changes.router)
+app.include_router(vc_search.router)
+# vcenters.json has its own /find-vcenter/{vm_name}; keep it apart from the vm_details.json one
+app.include_router(vc_json.router, prefix="/vm-ids")
+if SERVICE_ROLE != 'api':
+    app.include_router(vm.router)
+    app.include_router(jobs_router)
+    app.include_router(vm_details_collect_router)
+    app.include_router(vc_heirarichal_data.collect_router)
+    app.include_router(vc_vm_cluster_details.collect_router)
+    app.include_router(vc_capacity.collect_router)
+    app.include_router(vc_json.collect_router, prefix="/vm-ids")
+# vm_from_vc_with_details is not mounted: vm.router serves the same /create-vm/ endpoint
+install_metrics(app)
@@ -0,0 +1,257 @@
+from collections import deque
+from contextlib import contextmanager
+from pyVim.connect import SmartConnect, Disconnect
+from vc_common import get_ssl_context
+from vc_metrics import login_seconds, record_error
+import threading
+import time
+
+# Defaults for the shared pool, tuned for a handful of API workers per vCenter
+POOL_MAX_SIZE = 4               # Sessions (idle + in use) kept per vCenter
+POOL_IDLE_TIMEOUT = 900         # Seconds an idle session is kept before logout
+POOL_KEEPALIVE_INTERVAL = 120   # Seconds between keepalive sweeps
+POOL_HEALTH_CHECK_AFTER = 60    # Re-validate sessions idle for longer than this
+POOL_ACQUIRE_TIMEOUT = 60       # Seconds to wait for a free slot when the pool is full
+
+def smart_connect(creds):
+    return SmartConnect(host=creds['server'], user=creds['user'], pwd=creds['password'], sslContext=get_ssl_context())
+
+
+class PooledSession:
+    def __init__(self, service_instance):
+        self.service_instance = service_instance
+        self.content = service_instance.RetrieveContent()
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class SessionPool:
+    """
+    Per-vCenter pool of logged-in service instances.
+
+    Sessions are handed out with acquire() and returned with release(). Idle
+    sessions are health checked before reuse, kept alive in the background and
+    logged out once they have been idle for longer than idle_timeout.
+    """
+
+    def __init__(self, max_size=POOL_MAX_SIZE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 keepalive_interval=POOL_KEEPALIVE_INTERVAL, health_check_after=POOL_HEALTH_CHECK_AFTER,
+                 acquire_timeout=POOL_ACQUIRE_TIMEOUT, connect=smart_connect, disconnect=Disconnect):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self.connect = connect
+        self.disconnect = disconnect
+
+        self._lock = threading.Condition()
+        self._idle = {}      # server -> deque of PooledSession
+        self._in_use = {}    # id(service_instance) -> (server, PooledSession)
+        self._sizes = {}     # server -> number of open sessions
+        self._keepalive_thread = None
+        self._closed = False
+
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'logins': 0,
+            'login_failures': 0,
+            'relogins': 0,
+            'evictions': 0,
+            'waits': 0,
+            'login_seconds_total': 0.0,
+            'login_seconds_max': 0.0,
+        }
+
+    def acquire(self, creds):
+        server = creds['server']
+        deadline = time.monotonic() + self.acquire_timeout
+        self._start_keepalive()
+
+        with self._lock:
+            while True:
+                idle = self._idle.get(server)
+                if idle:
+                    pooled = idle.pop()
+                    break
+                if self._sizes.get(server, 0) < self.max_size:
+                    pooled = None
+                    self._sizes[server] = self._sizes.get(server, 0) + 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No free session for vCenter {server} after {self.acquire_timeout}s")
+                self._metrics['waits'] += 1
+                self._lock.wait(remaining)
+
+        if pooled is not None:
+            if time.monotonic() - pooled.last_used < self.health_check_after or self._is_alive(pooled):
+                self._record('hits')
+                return self._check_out(server, pooled)
+            # Session expired on the server side: drop it and log in again in its slot
+            self._close(pooled)
+            self._record('relogins')
+
+        self._record('misses')
+        try:
+            pooled = self._login(creds)
+        except Exception:
+            with self._lock:
+                self._sizes[server] -= 1
+                self._lock.notify()
+            raise
+        return self._check_out(server, pooled)
+
+    def release(self, service_instance, discard=False):
+        with self._lock:
+            server, pooled = self._in_use.pop(id(service_instance), (None, None))
+            if pooled is None:
+                return
+            if discard or self._closed:
+                self._sizes[server] -= 1
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.setdefault(server, deque()).append(pooled)
+            self._lock.notify()
+        if discard or self._closed:
+            self._close(pooled)
+
+    @contextmanager
+    def session(self, creds):
+        service_instance = self.acquire(creds)
+        discard = False
+        try:
+            yield service_instance
+        except Exception as e:
+            # A NotAuthenticated fault means the session died while in use
+            discard = type(e).__name__ == 'NotAuthenticated'
+            raise
+        finally:
+            self.release(service_instance, discard=discard)
+
+    def content(self, service_instance):
+        """
+        Return the ServiceInstanceContent retrieved at login for a pooled session.
+        """
+        with self._lock:
+            entry = self._in_use.get(id(service_instance))
+        if entry is None:
+            return service_instance.RetrieveContent()
+        return entry[1].content
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            servers = {
+                server: {'open': size, 'idle': len(self._idle.get(server, ()))}
+                for server, size in self._sizes.items()
+            }
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_ratio'] = metrics['hits'] / lookups if lookups else 0.0
+        metrics['login_seconds_avg'] = metrics['login_seconds_total'] / metrics['logins'] if metrics['logins'] else 0.0
+        metrics['servers'] = servers
+        return metrics
+
+    def close_all(self):
+        with self._lock:
+            self._closed = True
+            idle = [pooled for sessions in self._idle.values() for pooled in sessions]
+            for server, sessions in self._idle.items():
+                self._sizes[server] -= len(sessions)
+            self._idle.clear()
+            self._lock.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def _check_out(self, server, pooled):
+        with self._lock:
+            self._in_use[id(pooled.service_instance)] = (server, pooled)
+        return pooled.service_instance
+
+    def _login(self, creds):
+        started = time.monotonic()
+        try:
+            pooled = PooledSession(self.connect(creds))
+        except Exception:
+            self._record('login_failures')
+            login_seconds.observe(time.monotonic() - started, vcenter=creds['server'], result='error')
+            record_error(creds['server'], 'login')
+            raise
+        elapsed = time.monotonic() - started
+        login_seconds.observe(elapsed, vcenter=creds['server'], result='ok')
+        with self._lock:
+            self._metrics['logins'] += 1
+            self._metrics['login_seconds_total'] += elapsed
+            self._metrics['login_seconds_max'] = max(self._metrics['login_seconds_max'], elapsed)
+        return pooled
+
+    def _is_alive(self, pooled):
+        try:
+            return pooled.content.sessionManager.currentSession is not None
+        except Exception:
+            return False
+
+    def _close(self, pooled):
+        try:
+            self.disconnect(pooled.service_instance)
+        except Exception as e:
+            print(f"Failed to disconnect pooled vCenter session: {e}")
+
+    def _record(self, metric):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def _start_keepalive(self):
+        if self._keepalive_thread is not None or not self.keepalive_interval:
+            return
+        with self._lock:
+            if self._keepalive_thread is None:
+                self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name='vc-session-keepalive', daemon=True)
+                self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        while not self._closed:
+            time.sleep(self.keepalive_interval)
+            self.sweep()
+
+    def sweep(self):
+        """
+        Log out sessions idle past idle_timeout and ping the rest so vCenter keeps them.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for server, sessions in self._idle.items():
+                while sessions:
+                    candidates.append((server, sessions.popleft()))
+            # Keep the slots reserved while we talk to vCenter outside the lock
+            for server, pooled in candidates:
+                self._in_use[id(pooled.service_instance)] = (server, pooled)
+
+        expired = []
+        for server, pooled in candidates:
+            alive = now - pooled.last_used <= self.idle_timeout
+            if alive:
+                try:
+                    pooled.service_instance.CurrentTime()
+                except Exception:
+                    alive = False
+            if not alive:
+                expired.append((server, pooled))
+
+        with self._lock:
+            # Put survivors back oldest-first, keeping their last_used so idle expiry still applies
+            for server, pooled in reversed(candidates):
+                self._in_use.pop(id(pooled.service_instance), None)
+                if (server, pooled) in expired:
+                    self._sizes[server] -= 1
+                    self._metrics['evictions'] += 1
+                else:
+                    self._idle.setdefault(server, deque()).appendleft(pooled)
+            self._lock.notify_all()
+        for server, pooled in expired:
+            self._close(pooled)
+
+# Shared pool used by all endpoint modules
+session_pool = SessionPool()
@@ -0,0 +1,379 @@
+from array import array
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from vc_metrics import snapshot_io_seconds
+
+SNAPSHOT_MAGIC = b'VCSNAP01'
+SNAPSHOT_SUFFIX = '.snap'   # vm_details.json -> vm_details.snap
+_HEADER = struct.Struct('<8sQQ')   # magic, directory offset, directory length
+
+# Every VM record is split into these columns; any other keys are kept as JSON in 'extra'
+STRING_COLUMNS = ('vm_name', 'vm_id', 'extra')
+LIST_COLUMNS = ('networks', 'datastores', 'ip_addresses', 'storage')   # storage holds the disk labels
+RECORD_FIELDS = ('vm_name', 'vm_id', 'networks', 'datastores', 'ip_addresses', 'storage')
+
+class SnapshotError(ValueError):
+    pass
+
+def snapshot_path(file_path):
+    return os.path.splitext(file_path)[0] + SNAPSHOT_SUFFIX
+
+def snapshot_is_current(file_path):
+    """
+    True when the binary snapshot next to a JSON snapshot exists and is not older than it.
+    """
+    try:
+        binary_mtime = os.stat(snapshot_path(file_path)).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return binary_mtime >= os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        return True
+
+
+class _Strings:
+    # UTF-8 bytes plus the end offset of every string
+    def __init__(self):
+        self.ends = array('Q')
+        self.data = bytearray()
+
+    def append(self, text):
+        self.data += text.encode('utf-8')
+        self.ends.append(len(self.data))
+
+
+class _ServerRows:
+    # Column buffers for the VMs of one vCenter, concatenated in server order on write
+    def __init__(self):
+        self.count = 0
+        self.strings = {name: _Strings() for name in STRING_COLUMNS}
+        self.lists = {name: (array('Q'), array('I')) for name in LIST_COLUMNS}   # row ends, dictionary codes
+        self.sizes = array('d')   # one per storage label
+
+
+def _join_ends(parts):
+    # Rebase per-server end offsets into one offsets buffer with a leading 0
+    offsets = array('Q', [0])
+    base = 0
+    for ends, span in parts:
+        offsets.extend(end + base for end in ends)
+        base += span
+    return offsets
+
+
+class SnapshotBuilder:
+    """
+    Builds a columnar VM snapshot from {server: [vm, ...]} data.
+
+    VMs can be added per server in any order and in chunks, as the streaming
+    capture does; rows are written grouped by server in the order servers
+    were first seen, like the JSON snapshot. Network, datastore, IP and disk
+    label strings are dictionary-encoded.
+    """
+
+    def __init__(self, servers=()):
+        self._servers = {server: _ServerRows() for server in servers}
+        self._values = {}    # server -> non-list value (e.g. an error), stored as-is
+        self._fields = {}    # record keys in first-seen order
+        self._dictionaries = {name: ({}, _Strings()) for name in LIST_COLUMNS}
+
+    def add(self, server, vms):
+        rows = self._servers.setdefault(server, _ServerRows())
+        if not isinstance(vms, list):
+            self._values[server] = vms
+            return
+        for vm in vms:
+            self._add_vm(rows, vm)
+
+    def reset(self, server):
+        self._servers[server] = _ServerRows()
+        self._values.pop(server, None)
+
+    def _add_vm(self, rows, vm):
+        for key in vm:
+            self._fields.setdefault(key)
+        rows.count += 1
+        rows.strings['vm_name'].append(vm.get('vm_name') or '')
+        rows.strings['vm_id'].append(vm.get('vm_id') or '')
+        extra = {key: value for key, value in vm.items() if key not in RECORD_FIELDS}
+        rows.strings['extra'].append(json.dumps(extra) if extra else '')
+        for name in ('networks', 'datastores', 'ip_addresses'):
+            self._add_list(rows, name, vm.get(name) or [])
+        disks = vm.get('storage') or []
+        self._add_list(rows, 'storage', [disk.get('label') or '' for disk in disks])
+        rows.sizes.extend(float(disk.get('size_GB') or 0) for disk in disks)
+
+    def _add_list(self, rows, name, values):
+        codes, table = self._dictionaries[name]
+        ends, row_codes = rows.lists[name]
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+                table.append(value)
+            row_codes.append(code)
+        ends.append(len(row_codes))
+
+    def _buffers(self):
+        parts = list(self._servers.values())
+        for name in STRING_COLUMNS:
+            strings = [rows.strings[name] for rows in parts]
+            yield name, 'offsets', 'Q', _join_ends((part.ends, len(part.data)) for part in strings)
+            yield name, 'data', 'B', b''.join(part.data for part in strings)
+        for name in LIST_COLUMNS:
+            lists = [rows.lists[name] for rows in parts]
+            codes = array('I')
+            for _, row_codes in lists:
+                codes.extend(row_codes)
+            yield name, 'ends', 'Q', _join_ends((ends, len(row_codes)) for ends, row_codes in lists)
+            yield name, 'codes', 'I', codes
+            table = self._dictionaries[name][1]
+            yield name, 'dictionary_offsets', 'Q', array('Q', [0]) + table.ends
+            yield name, 'dictionary_data', 'B', table.data
+        sizes = array('d')
+        for rows in parts:
+            sizes.extend(rows.sizes)
+        yield 'storage', 'sizes', 'd', sizes
+
+    def write(self, file_path):
+        """
+        Write the snapshot next to its target and rename it into place.
+        """
+        vcenters = []
+        start = 0
+        for server, rows in self._servers.items():
+            vcenter = {'server': server, 'start': start, 'count': rows.count}
+            if server in self._values:
+                vcenter['value'] = self._values[server]
+            vcenters.append(vcenter)
+            start += rows.count
+        directory = {'version': 1, 'byteorder': sys.byteorder, 'rows': start,
+                     'fields': list(self._fields), 'vcenters': vcenters, 'columns': {}}
+
+        with snapshot_io_seconds.time(file=os.path.basename(file_path), operation='save'):
+            tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(b'\0' * _HEADER.size)
+                for column, name, typecode, buffer in self._buffers():
+                    # Keep every buffer 8-byte aligned so it can be cast in place
+                    file.write(b'\0' * (-file.tell() % 8))
+                    directory['columns'].setdefault(column, {})[name] = [file.tell(), memoryview(buffer).nbytes, typecode]
+                    file.write(buffer)
+                offset = file.tell()
+                encoded = json.dumps(directory).encode('utf-8')
+                file.write(encoded)
+                file.seek(0)
+                file.write(_HEADER.pack(SNAPSHOT_MAGIC, offset, len(encoded)))
+            os.replace(tmp_path, file_path)
+
+
+def write_snapshot(file_path, all_vms):
+    builder = SnapshotBuilder()
+    for server, vms in all_vms.items():
+        builder.add(server, vms)
+    builder.write(file_path)
+
+
+class StringColumn:
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        return str(self._data[self._offsets[row]:self._offsets[row + 1]], 'utf-8')
+
+    def __iter__(self):
+        offsets, data = self._offsets, self._data
+        text = str(data, 'utf-8')
+        if len(text) == len(data):
+            # All ASCII: byte offsets are character offsets, so slice the decoded text
+            data = text
+            for row in range(len(self)):
+                yield data[offsets[row]:offsets[row + 1]]
+            return
+        for row in range(len(self)):
+            yield str(data[offsets[row]:offsets[row + 1]], 'utf-8')
+
+
+class ListColumn:
+    """
+    A dictionary-encoded list-of-strings column; only the dictionary is ever decoded in full.
+    """
+
+    def __init__(self, ends, codes, dictionary):
+        self._ends = ends
+        self._codes = codes
+        self._dictionary = dictionary
+        self._values = None
+
+    def __len__(self):
+        return len(self._ends) - 1
+
+    def values(self):
+        if self._values is None:
+            self._values = list(self._dictionary)
+        return self._values
+
+    def span(self, row):
+        return self._ends[row], self._ends[row + 1]
+
+    def __getitem__(self, row):
+        values = self.values()
+        return [values[code] for code in self._codes[self._ends[row]:self._ends[row + 1]]]
+
+    def __iter__(self):
+        values, ends, codes = self.values(), self._ends, self._codes
+        for row in range(len(self)):
+            yield [values[code] for code in codes[ends[row]:ends[row + 1]]]
+
+
+class Snapshot:
+    """
+    A memory-mapped columnar VM snapshot.
+
+    Opening one reads only the header and directory; a column is touched the
+    first time something asks for it, and a record is decoded only when it is
+    returned. The mapping stays valid after the file is replaced, so a
+    resident snapshot keeps serving until its index is swapped out.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f"{file_path} is corrupt: {e}")
+        try:
+            magic, offset, length = _HEADER.unpack_from(self._map, 0)
+            if magic != SNAPSHOT_MAGIC:
+                raise SnapshotError(f"{file_path} is not a VM snapshot")
+            directory = json.loads(self._map[offset:offset + length])
+            if directory['byteorder'] != sys.byteorder:
+                raise SnapshotError(f"{file_path} was written on a {directory['byteorder']}-endian machine")
+        except (struct.error, ValueError, KeyError) as e:
+            self._map.close()
+            raise e if isinstance(e, SnapshotError) else SnapshotError(f"{file_path} is corrupt: {e}")
+        self.fields = directory['fields']
+        self.vcenters = directory['vcenters']
+        self.rows = directory['rows']
+        self._layout = directory['columns']
+        self._starts = [vcenter['start'] for vcenter in self.vcenters]
+        self._columns = {}
+
+    def __len__(self):
+        return self.rows
+
+    def _buffer(self, column, name):
+        offset, length, typecode = self._layout[column][name]
+        return memoryview(self._map)[offset:offset + length].cast(typecode)
+
+    def column(self, name):
+        accessor = self._columns.get(name)
+        if accessor is None:
+            if name in STRING_COLUMNS:
+                accessor = StringColumn(self._buffer(name, 'offsets'), self._buffer(name, 'data'))
+            elif name in LIST_COLUMNS:
+                accessor = ListColumn(self._buffer(name, 'ends'), self._buffer(name, 'codes'),
+                                      StringColumn(self._buffer(name, 'dictionary_offsets'),
+                                                   self._buffer(name, 'dictionary_data')))
+            elif name == 'storage_sizes':
+                accessor = self._buffer('storage', 'sizes')
+            else:
+                raise KeyError(name)
+            self._columns[name] = accessor
+        return accessor
+
+    def vcenter_of(self, row):
+        # Empty vCenters share their start with the next one, so take the last match
+        return self.vcenters[bisect.bisect_right(self._starts, row) - 1]['server']
+
+    def record(self, row):
+        record = {}
+        extra = None
+        for field in self.fields:
+            if field in ('vm_name', 'vm_id'):
+                record[field] = self.column(field)[row]
+            elif field == 'storage':
+                labels = self.column('storage')
+                sizes = self.column('storage_sizes')
+                start, end = labels.span(row)
+                record[field] = [{'label': label, 'size_GB': sizes[position]}
+                                 for position, label in zip(range(start, end), labels[row])]
+            elif field in LIST_COLUMNS:
+                record[field] = self.column(field)[row]
+            else:
+                if extra is None:
+                    extra = json.loads(self.column('extra')[row] or '{}')
+                if field in extra:
+                    record[field] = extra[field]
+        return record
+
+    def entry(self, row):
+        return self.vcenter_of(row), self.record(row)
+
+    def entries(self):
+        for vcenter in self.vcenters:
+            for row in range(vcenter['start'], vcenter['start'] + vcenter['count']):
+                yield vcenter['server'], self.record(row)
+
+    def iter_column(self, field):
+        """
+        Yield one value per row of a record field without decoding anything else.
+        """
+        if field == 'vm_id' and field not in self.fields:
+            return iter([''] * self.rows)
+        return iter(self.column(field))
+
+    def to_dict(self):
+        return {vcenter['server']: vcenter['value'] if 'value' in vcenter else
+                [self.record(row) for row in range(vcenter['start'], vcenter['start'] + vcenter['count'])]
+                for vcenter in self.vcenters}
+
+    def close(self):
+        self._columns = {}
+        try:
+            self._map.close()
+        except BufferError:
+            # Records handed out earlier still reference the mapping; it is released with them
+            pass
+
+
+def convert_json_snapshot(file_path, output_path=None):
+    """
+    Write the binary snapshot for an existing JSON snapshot file; returns its path.
+    """
+    output_path = output_path or snapshot_path(file_path)
+    with open(file_path, 'r') as file:
+        write_snapshot(output_path, json.load(file))
+    return output_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSON VM snapshots (vm_details.json, vcenters.json) to the binary format")
+    parser.add_argument('files', nargs='+', help="JSON snapshot files; each is written next to itself as .snap")
+    parser.add_argument('--check', action='store_true', help="Read every converted file back and compare it with the JSON")
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        output_path = convert_json_snapshot(file_path)
+        print(f"{file_path} ({os.path.getsize(file_path)} bytes) -> {output_path} ({os.path.getsize(output_path)} bytes)")
+        if args.check:
+            with open(file_path, 'r') as file:
+                expected = json.load(file)
+            snapshot = Snapshot(output_path)
+            if snapshot.to_dict() != expected:
+                raise SystemExit(f"{output_path} does not match {file_path}")
+            snapshot.close()
+
+if __name__ == '__main__':
+    main()
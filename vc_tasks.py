@@ -0,0 +1,244 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from pyVmomi import vim, vmodl
+from vc_property_collector import PropertyCollector, retrieve_properties
+from vc_session_pool import session_pool
+from vc_admission import admission
+from vc_metrics import task_seconds, record_error
+import threading
+import time
+import uuid
+
+TASK_POLL_INTERVAL = 2     # Seconds between TaskInfo sweeps
+JOB_RETENTION = 3600       # Seconds finished jobs stay visible under /jobs
+
+TASK_PROPERTIES = ['info.state', 'info.progress', 'info.result', 'info.error']
+
+def describe_result(result):
+    # Task results are usually managed objects (e.g. the cloned VM); report their moId
+    if isinstance(result, vim.ManagedEntity):
+        return {'type': type(result).__name__.split('.')[-1], 'moId': result._moId}
+    if result is None or isinstance(result, (str, int, float, bool)):
+        return result
+    return str(result)
+
+def describe_error(error):
+    # Faults such as DuplicateName often carry no msg; fall back to the fault type
+    if isinstance(error, vmodl.MethodFault) and not error.msg:
+        return type(error).__name__.split('.')[-1]
+    return getattr(error, 'msg', None) or str(error)
+
+
+class TaskTracker:
+    """
+    Tracks submitted vSphere tasks as jobs.
+
+    Mutation endpoints hand their task to submit() and return the job right
+    away. A background poller reads TaskInfo for every running task on a
+    vCenter with a single PropertyCollector call per sweep.
+    """
+
+    def __init__(self, poll_interval=TASK_POLL_INTERVAL, retention=JOB_RETENTION):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._jobs = {}       # job_id -> job dict (the public view)
+        self._running = {}    # job_id -> (vcenter creds, task, success result)
+        self._listeners = {}  # job_id -> callables run when the job finishes
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._poller = None
+
+    def _new_job(self, vcenter_creds, operation, target, status):
+        return {
+            'job_id': uuid.uuid4().hex,
+            'operation': operation,
+            'vcenter_server': vcenter_creds['server'],
+            'target': target,
+            'task_id': None,
+            'status': status,
+            'progress': 0,
+            'result': None,
+            'error': None,
+            'submitted_at': time.time(),
+            'finished_at': None,
+        }
+
+    def queue(self, vcenter_creds, operation, target):
+        """
+        Record a job that is waiting for admission; submit(job_id=...) starts it and fail() ends it.
+        """
+        job = self._new_job(vcenter_creds, operation, target, 'queued')
+        with self._lock:
+            self._jobs[job['job_id']] = job
+        return dict(job)
+
+    def submit(self, vcenter_creds, operation, target, task, success_result=None, on_finish=None, job_id=None):
+        with self._lock:
+            job = self._jobs.get(job_id) if job_id is not None else None
+            if job is None:
+                job = self._new_job(vcenter_creds, operation, target, 'running')
+                job_id = job['job_id']
+                self._jobs[job_id] = job
+            else:
+                # A queued job starts now; its task duration runs from here
+                job.update(status='running', queued_at=job['submitted_at'], submitted_at=time.time())
+            job['task_id'] = task._moId
+            self._running[job_id] = (vcenter_creds, task, success_result)
+            if on_finish is not None:
+                self._listeners[job_id] = [on_finish]
+        self._start_poller()
+        self._wakeup.set()
+        return dict(job)
+
+    def fail(self, job_id, error):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(status='error', error=error, finished_at=time.time())
+
+    def discard(self, job_id):
+        # For a queued job that was turned away before it was accepted
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, status=None):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values() if status is None or job['status'] == status]
+
+    def wait(self, job_id, timeout=None):
+        """
+        Block until a job finishes; for callers that still need synchronous behaviour.
+        """
+        done = threading.Event()
+        with self._lock:
+            if job_id in self._running:
+                self._listeners.setdefault(job_id, []).append(lambda job: done.set())
+            else:
+                done.set()
+        done.wait(timeout)
+        return self.get(job_id)
+
+    def poll(self):
+        with self._lock:
+            by_server = {}
+            for job_id, (creds, task, success_result) in self._running.items():
+                by_server.setdefault(creds['server'], (creds, []))[1].append((job_id, task, success_result))
+
+        for server, (creds, jobs) in by_server.items():
+            try:
+                with session_pool.session(creds) as service_instance:
+                    infos = self._read_task_infos(session_pool.content(service_instance), [task for _, task, _ in jobs])
+            except Exception as e:
+                print(f"Failed to poll tasks on vCenter {server} with error: {e}")
+                record_error(server, 'task-poll')
+                continue
+            for job_id, task, success_result in jobs:
+                self._update(job_id, infos.get(task._moId), success_result)
+
+        self._expire()
+
+    def _read_task_infos(self, content, tasks):
+        spec = PropertyCollector.FilterSpec(
+            objectSet=[PropertyCollector.ObjectSpec(obj=task) for task in tasks],
+            propSet=[PropertyCollector.PropertySpec(type=vim.Task, pathSet=TASK_PROPERTIES)])
+        try:
+            return {obj_content.obj._moId: {prop.name: prop.val for prop in obj_content.propSet}
+                    for obj_content in retrieve_properties(content, spec)}
+        except vmodl.fault.ManagedObjectNotFound:
+            # One task aged out of vCenter; fall back to reading the rest one by one
+            if len(tasks) == 1:
+                return {tasks[0]._moId: {'info.state': 'error', 'info.error': 'Task no longer exists on vCenter'}}
+            infos = {}
+            for task in tasks:
+                infos.update(self._read_task_infos(content, [task]))
+            return infos
+
+    def _update(self, job_id, info, success_result):
+        if info is None:
+            return
+        state = str(info.get('info.state'))
+        listeners = []
+        finished = False
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['status'] = state
+            if info.get('info.progress') is not None:
+                job['progress'] = info['info.progress']
+            if state in ('success', 'error'):
+                job['progress'] = 100 if state == 'success' else job['progress']
+                job['finished_at'] = time.time()
+                if state == 'success':
+                    job['result'] = success_result if success_result is not None else describe_result(info.get('info.result'))
+                else:
+                    job['error'] = describe_error(info.get('info.error'))
+                finished = self._running.pop(job_id, None) is not None
+                listeners = self._listeners.pop(job_id, [])
+            snapshot = dict(job)
+        if finished:
+            task_seconds.observe(snapshot['finished_at'] - snapshot['submitted_at'], vcenter=snapshot['vcenter_server'],
+                                 operation=snapshot['operation'], status=state)
+            if state == 'error':
+                record_error(snapshot['vcenter_server'], snapshot['operation'])
+        for listener in listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Job {job_id} completion callback failed with error: {e}")
+
+    def _expire(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job['finished_at'] is not None and job['finished_at'] < cutoff]:
+                del self._jobs[job_id]
+
+    def _start_poller(self):
+        if self._poller is not None and self._poller.is_alive():
+            return
+        with self._lock:
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll_loop, name='vc-task-poller', daemon=True)
+                self._poller.start()
+
+    def _poll_loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Task poller failed with error: {e}")
+
+
+# Shared tracker used by all mutation endpoints
+task_tracker = TaskTracker()
+
+# /jobs endpoints, mounted by every app that submits tasks
+jobs_router = APIRouter()
+
+def with_queue_position(job):
+    # Queued jobs report where they stand and when they are expected to start
+    if job['status'] == 'queued':
+        queued = admission.queue_position(job['job_id'])
+        if queued is not None:
+            job['queue_position'], job['retry_after'] = queued
+    return job
+
+@jobs_router.get("/jobs")
+async def list_jobs(status: Optional[str] = None):
+    return [with_queue_position(job) for job in task_tracker.list(status)]
+
+@jobs_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = task_tracker.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return with_queue_position(job)
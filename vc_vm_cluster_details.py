@@ -1,74 +1,39 @@
 from typing import Optional
-from fastapi import FastAPI, HTTPException, Query
-from pyVim.connect import SmartConnect, Disconnect
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from pyVmomi import vim
-import ssl
-import json
-
-app = FastAPI()
-
-def get_ssl_context():
-    context = ssl._create_unverified_context()
-    return context
-
-def get_vm_details(vcenter):
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter['server'], user=vcenter['user'], pwd=vcenter['password'], sslContext=ssl_context)
-        content = service_instance.RetrieveContent()
-        container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-        vms = container.view
-        vm_details_list = []
-
-        for vm in vms:
-            vm_detail = {
-                'vm_name': vm.summary.config.name,
-                'networks': [],
-                'storage': [],
-                'datastores': [],
-                'ip_addresses': []
-            }
-
-            # Network information
-            for net in vm.network:
-                if isinstance(net, vim.Network):
-                    vm_detail['networks'].append(net.name)
-
-            # Collecting all IP addresses
-            ip_addresses = []
-            for net_info in vm.guest.net:
-                if net_info.ipConfig is not None and net_info.ipConfig.ipAddress:
-                    for ip in net_info.ipConfig.ipAddress:
-                        ip_addresses.append(ip.ipAddress)
-            vm_detail['ip_addresses'] = ip_addresses
-
-            # Storage information (Virtual Disks)
-            for device in vm.config.hardware.device:
-                if isinstance(device, vim.vm.device.VirtualDisk):
-                    disk_detail = {
-                        'label': device.deviceInfo.label,
-                        'size_GB': device.capacityInKB / 1024 / 1024
-                    }
-                    vm_detail['storage'].append(disk_detail)
-
-            # Datastore information
-            for ds in vm.datastore:
-                vm_detail['datastores'].append(ds.name)
-
-            vm_details_list.append(vm_detail)
-
-        Disconnect(service_instance)
-        return vm_details_list
-    except Exception as e:
-        print(f"Failed to connect to vCenter {vcenter['server']} with error: {e}")
-        return []
-
-def get_cluster_info(service_instance):
+from vc_common import get_vcenters
+from vc_session_pool import session_pool
+from vc_changes import get_change_log
+from vc_fanout import fan_out, save_json_atomic
+from vc_inventory_store import get_inventory_store, strip_moids, QUERY_DEFAULT_LIMIT, QUERY_MAX_LIMIT
+from vc_metrics import install_metrics
+from vc_vm_details import router as vm_details_router, collect_router as vm_details_collect_router
+
+router = APIRouter()
+collect_router = APIRouter()   # talks to vCenter; see vc_collector
+
+def get_cluster_info(service_instance, with_moids=False):
+    """
+    Capacity, hosts, datastores and networks of every cluster.
+
+    with_moids adds each cluster's, datastore's and network's moId under
+    'moId' for the inventory store; strip_moids removes them again before
+    the capture is saved or returned.
+    """
     content = service_instance.RetrieveContent()
     cluster_info_list = []
 
     container = content.viewManager.CreateContainerView(content.rootFolder, [vim.ClusterComputeResource], True)
     clusters = container.view
+    container.Destroy()
+
+    # Clusters and hosts share datastores; read each datastore's summary once
+    summaries = {}
+    def summary_of(datastore):
+        if datastore._moId not in summaries:
+            summaries[datastore._moId] = datastore.summary
+        return summaries[datastore._moId]
 
     for cluster in clusters:
         # Initialize the cluster detail dictionary
@@ -82,16 +47,20 @@ def get_cluster_info(service_instance):
             'datastores': [],
             'networks': []
         }
+        if with_moids:
+            cluster_detail['moId'] = cluster._moId
 
         # Collect datastore information
         for datastore in cluster.datastore:
             ds_detail = {
                 'name': datastore.name,
-                'capacity_gb': datastore.summary.capacity / (1024**3),  # Convert Bytes to GB
-                'freeSpace_gb': datastore.summary.freeSpace / (1024**3),  # Convert Bytes to GB
-                'type': datastore.summary.type,
-                'accessible': datastore.summary.accessible
+                'capacity_gb': summary_of(datastore).capacity / (1024**3),  # Convert Bytes to GB
+                'freeSpace_gb': summary_of(datastore).freeSpace / (1024**3),  # Convert Bytes to GB
+                'type': summary_of(datastore).type,
+                'accessible': summary_of(datastore).accessible
             }
+            if with_moids:
+                ds_detail['moId'] = datastore._moId
             cluster_detail['datastores'].append(ds_detail)
 
         # Collect network information
@@ -100,6 +69,8 @@ def get_cluster_info(service_instance):
                 'name': network.name,
                 'type': type(network).__name__
             }
+            if with_moids:
+                net_detail['moId'] = network._moId
             cluster_detail['networks'].append(net_detail)
 
         # Collect host information (simplified for brevity)
@@ -107,7 +78,7 @@ def get_cluster_info(service_instance):
             datastore_capacity = 0
             datastore_free = 0
             for ds in host.datastore:
-                datastore_info = ds.summary
+                datastore_info = summary_of(ds)
                 datastore_capacity += datastore_info.capacity
                 datastore_free += datastore_info.freeSpace
 
@@ -125,105 +96,55 @@ def get_cluster_info(service_instance):
     return cluster_info_list
 
 def save_data_to_json(file_path, data):
-    with open(file_path, 'w') as file:
-        json.dump(data, file, indent=4)
-
-def load_data_from_json(file_path):
-    with open(file_path, 'r') as file:
-        return json.load(file)
-    
-@app.get("/capture-vm-details", tags=["VM"])
-async def capture_vm_details():
-    vcenters_json_file = 'creds.json'  # Update this path to your vCenters credentials file
-    output_json_file = 'vm_details.json'  # The output file where VM details will be saved
-    vcenters = json.load(open(vcenters_json_file))
-    all_vm_details = {}
-
-    for vcenter in vcenters:
-        vm_details = get_vm_details(vcenter)
-        all_vm_details[vcenter['server']] = vm_details
-
-    save_data_to_json(output_json_file, all_vm_details)
-    return {"message": "VM details captured successfully", "data": all_vm_details}
-
-@app.get("/find-vcenter/{vm_name}", tags=["VM"])
-async def find_vcenter(vm_name: str):
-    output_json_file = 'vm_details.json'  # Specify the path to your JSON file
-    all_vms = load_data_from_json(output_json_file)
-    
-    vm_name_lower = vm_name.lower()  # Convert the input VM name to lowercase
-    for vcenter, vms in all_vms.items():
-        for vm in vms:
-            if vm['vm_name'].lower() == vm_name_lower:  # Compare lowercased versions
-                return vm
-    
-    raise HTTPException(status_code=404, detail="VM not found")
+    save_json_atomic(file_path, data)
 
-@app.get("/collect-cluster-info", tags=["Clusters"])
+@collect_router.get("/collect-cluster-info", tags=["Clusters"])
 async def collect_cluster_info():
-    vcenters_json_file = 'creds.json'  # Path to your vCenters credentials file
     output_json_file = 'clusters.json'
-    vcenters = json.load(open(vcenters_json_file))
-    all_cluster_info = {}
-
-    for vcenter in vcenters:
-        ssl_context = get_ssl_context()
-        try:
-            service_instance = SmartConnect(host=vcenter['server'], user=vcenter['user'], pwd=vcenter['password'], sslContext=ssl_context)
-            all_cluster_info[vcenter['server']] = get_cluster_info(service_instance)
-            Disconnect(service_instance)
-        except Exception as e:
-            print(f"Failed to connect to vCenter {vcenter['server']} with error: {e}")
-            all_cluster_info[vcenter['server']] = 'Connection failed'
-
-        save_data_to_json(output_json_file, all_cluster_info)
-    return all_cluster_info
+    vcenters = get_vcenters()
+
+    def collect(vcenter):
+        with session_pool.session(vcenter) as service_instance:
+            return get_cluster_info(service_instance, with_moids=True)
+
+    all_cluster_info = await fan_out(vcenters, collect, 'Connection failed',
+                                     on_progress=lambda partial: save_data_to_json(output_json_file, strip_moids(partial)))
+
+    # The store and the change feed key objects by moId; the saved and returned capture keeps its shape
+    public_cluster_info = strip_moids(all_cluster_info)
+    save_data_to_json(output_json_file, public_cluster_info)
+    await run_in_threadpool(get_inventory_store().replace_cluster_info, all_cluster_info)
+    await run_in_threadpool(get_change_log().record_datastores, all_cluster_info)
+    return public_cluster_info
 
 # Endpoint to find the details of a given cluster by its name
-@app.get("/query-cluster-info/")
-async def query_cluster_info(cluster_name: Optional[str] = None, 
+@router.get("/query-cluster-info/")
+async def query_cluster_info(response: Response,
+                             cluster_name: Optional[str] = None, 
                              datastore_name: Optional[str] = None, 
                              host_name: Optional[str] = None, 
-                             network_name: Optional[str] = None):
-    output_json_file = 'clusters.json'
-    all_clusters_info = json.load(open(output_json_file))
-    
-    filtered_clusters = []
-
-    for vcenter, clusters in all_clusters_info.items():
-        for cluster in clusters:
-            # Filter by cluster name if specified
-            if cluster_name and cluster_name.lower() != cluster['cluster_name'].lower():
-                continue
-            
-            # Filter by datastore name if specified
-            if datastore_name:
-                datastores = [ds for ds in cluster['datastores'] if datastore_name.lower() in ds['name'].lower()]
-                if not datastores:
-                    continue
-                else:
-                    cluster['datastores'] = datastores
-            
-            # Filter by host name if specified
-            if host_name:
-                hosts = [host for host in cluster['hosts'] if host_name.lower() in host['host_name'].lower()]
-                if not hosts:
-                    continue
-                else:
-                    cluster['hosts'] = hosts
-            
-            # Filter by network name if specified
-            if network_name:
-                networks = [net for net in cluster['networks'] if network_name.lower() in net['name'].lower()]
-                if not networks:
-                    continue
-                else:
-                    cluster['networks'] = networks
-            
-            filtered_clusters.append({"vcenter": vcenter, "cluster_info": cluster})
-    
+                             network_name: Optional[str] = None,
+                             limit: int = Query(QUERY_DEFAULT_LIMIT, ge=1, le=QUERY_MAX_LIMIT),
+                             offset: int = Query(0, ge=0)):
+    # Indexed SQLite lookup over the last /collect-cluster-info capture; X-Total-Count has the unpaged count
+    def lookup():
+        # Seeding and querying SQLite block, so keep them off the event loop
+        store = get_inventory_store()
+        store.bootstrap('cluster_info', 'clusters.json')
+        return store.query_cluster_info(cluster_name, datastore_name, host_name, network_name, limit, offset)
+
+    total, filtered_clusters = await run_in_threadpool(lookup)
+    response.headers["X-Total-Count"] = str(total)
+
     if not filtered_clusters:
         raise HTTPException(status_code=404, detail="No matching clusters found")
     
     return filtered_clusters
 
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(vm_details_collect_router)
+app.include_router(vm_details_router)
+app.include_router(collect_router)
+app.include_router(router)
+install_metrics(app)
@@ -0,0 +1,198 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+import anyio
+import base64
+import binascii
+import json
+from vc_common import get_vcenters
+from vc_session_pool import session_pool
+from vc_fanout import fan_out, fan_out_stream, save_json_atomic, SnapshotStreamWriter
+from vc_vm_index import get_vm_index, publish_vm_snapshot, refresh_vm_index
+from vc_snapshot import SnapshotBuilder, snapshot_path
+from vc_property_collector import collect_vm_details, iter_vm_details, page_vm_fields, VM_FIELD_PATHS
+
+VM_DETAILS_FILE = 'vm_details.json'
+VMS_DEFAULT_FIELDS = ['vm_name', 'networks', 'storage', 'datastores', 'ip_addresses']   # vm_details.json's fields
+VMS_DEFAULT_LIMIT = 100
+VMS_MAX_LIMIT = 1000
+
+# VM detail lookups, shared by vc_heirarichal_data and vc_vm_cluster_details; capture
+# routes are on collect_router so a multi-worker deployment can run them in one process
+router = APIRouter()
+collect_router = APIRouter()
+
+def get_vm_details(vcenter):
+    try:
+        with session_pool.session(vcenter) as service_instance:
+            # One paged PropertyCollector retrieval instead of a SOAP call per VM property
+            return collect_vm_details(session_pool.content(service_instance))
+    except Exception as e:
+        print(f"Failed to connect to vCenter {vcenter['server']} with error: {e}")
+        return []
+
+def stream_vm_details(vcenter):
+    # Holds the session while the caller consumes the VMs page by page
+    with session_pool.session(vcenter) as service_instance:
+        yield from iter_vm_details(session_pool.content(service_instance))
+
+def save_data_to_json(file_path, data):
+    save_json_atomic(file_path, data)
+
+@collect_router.get("/capture-vm-details", tags=["VM"])
+async def capture_vm_details():
+    output_json_file = VM_DETAILS_FILE  # The output file where VM details will be saved
+    vcenters = get_vcenters()
+    # vCenters are collected concurrently; the file is rewritten in creds.json order as each one finishes
+    all_vm_details = await fan_out(vcenters, get_vm_details, [],
+                                   on_progress=lambda partial: save_data_to_json(output_json_file, partial))
+
+    publish_vm_snapshot(output_json_file, all_vm_details)
+    return {"message": "VM details captured successfully", "data": all_vm_details}
+
+@collect_router.get("/capture-vm-details/stream", tags=["VM"])
+async def capture_vm_details_stream():
+    """
+    Same capture as /capture-vm-details, streamed as NDJSON: one {"vcenter": ..., VM fields} line per VM.
+
+    A vCenter that fails gets an {"vcenter": ..., "error": ...} line. The
+    snapshot file is written incrementally and replaces the old one once
+    every vCenter has finished.
+    """
+    output_json_file = VM_DETAILS_FILE  # The output file where VM details will be saved
+    vcenters = get_vcenters()
+    # File writes, column building and the index refresh run in the threadpool, off the event loop
+    writer = await run_in_threadpool(SnapshotStreamWriter, output_json_file, [vcenter['server'] for vcenter in vcenters])
+    # The binary snapshot is built alongside from compact column buffers
+    builder = SnapshotBuilder([vcenter['server'] for vcenter in vcenters])
+
+    def reset(server):
+        writer.reset(server)
+        builder.reset(server)
+
+    def add(server, vm_details):
+        writer.add(server, vm_details)
+        builder.add(server, vm_details)
+
+    def commit():
+        writer.commit()
+        builder.write(snapshot_path(output_json_file))
+        refresh_vm_index(output_json_file)
+
+    async def lines():
+        committed = False
+        try:
+            async for server, vm_details, error in fan_out_stream(vcenters, stream_vm_details):
+                if error:
+                    await run_in_threadpool(reset, server)
+                    yield json.dumps({"vcenter": server, "error": error}) + "\n"
+                    continue
+                await run_in_threadpool(add, server, vm_details)
+                yield "".join(json.dumps({"vcenter": server, **vm_detail}) + "\n" for vm_detail in vm_details)
+            await run_in_threadpool(commit)
+            committed = True
+        finally:
+            if not committed:
+                # Client went away or collection broke; keep the previous snapshot. Shielded so a
+                # cancelled response still removes its part files.
+                with anyio.CancelScope(shield=True):
+                    await run_in_threadpool(writer.close)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def encode_cursor(server, vm_id):
+    return base64.urlsafe_b64encode(json.dumps([server, vm_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        server, vm_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(server, str) and isinstance(vm_id, str):
+            return server, vm_id
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def page_vms(vcenters, fields, limit, cursor_server=None, after=None, **filters):
+    # vCenters are paged in creds.json order and VMs in moId order within each
+    vms = []
+    for index, vcenter in enumerate(vcenters):
+        server = vcenter['server']
+        try:
+            with session_pool.session(vcenter) as service_instance:
+                page, more = page_vm_fields(session_pool.content(service_instance), fields, limit - len(vms),
+                                            after=after if server == cursor_server else None, **filters)
+        except Exception as e:
+            print(f"Failed to list VMs from vCenter {server} with error: {e}")
+            raise HTTPException(status_code=502, detail=f"Failed to list VMs from vCenter {server}")
+        vms.extend({'vcenter': server, **vm} for vm in page)
+        if len(vms) >= limit:
+            last_vcenter = index == len(vcenters) - 1
+            return vms, encode_cursor(server, vms[-1]['vm_id']) if more or not last_vcenter else None
+    return vms, None
+
+@router.get("/vms", tags=["VM"])
+async def list_vms(fields: Optional[str] = Query(None, description="Comma-separated; vm_id and vcenter are always included"),
+                   vcenter: Optional[str] = None,
+                   cluster: Optional[str] = None,
+                   power_state: Optional[str] = Query(None, pattern="^(poweredOn|poweredOff|suspended)$"),
+                   name_prefix: Optional[str] = None,
+                   limit: int = Query(VMS_DEFAULT_LIMIT, ge=1, le=VMS_MAX_LIMIT),
+                   cursor: Optional[str] = None):
+    """
+    Page through VMs live from vCenter, fetching only the properties the
+    requested fields and filters need. Pass next_cursor back as cursor for
+    the following page; it is null on the last one.
+    """
+    selected = VMS_DEFAULT_FIELDS if fields is None else [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in selected if field not in VM_FIELD_PATHS and field not in ('vm_id', 'vcenter')]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    selected = [field for field in dict.fromkeys(selected) if field in VM_FIELD_PATHS]
+
+    vcenters = get_vcenters()
+    cursor_server, after = decode_cursor(cursor) if cursor else (None, None)
+    if vcenter is not None:
+        vcenters = [creds for creds in vcenters if creds['server'] == vcenter]
+        if not vcenters:
+            raise HTTPException(status_code=404, detail="vCenter not found")
+    if cursor_server is not None:
+        servers = [creds['server'] for creds in vcenters]
+        if cursor_server not in servers:
+            raise HTTPException(status_code=400, detail="Cursor does not match the vCenters being listed")
+        vcenters = vcenters[servers.index(cursor_server):]
+
+    vms, next_cursor = await run_in_threadpool(page_vms, vcenters, selected, limit, cursor_server, after,
+                                               name_prefix=name_prefix, power_state=power_state, cluster=cluster)
+    return {"vms": vms, "next_cursor": next_cursor}
+
+@router.get("/find-vcenter/{vm_name}", tags=["VM"])
+async def find_vcenter(vm_name: str):
+    output_json_file = VM_DETAILS_FILE  # Specify the path to your JSON file
+    # Resident index keyed by casefolded name; rebuilt by /capture-vm-details, no file I/O here
+    entry = get_vm_index(output_json_file).find_by_name(vm_name)
+    if entry:
+        return entry[1]
+
+    raise HTTPException(status_code=404, detail="VM not found")
+
+@router.get("/find-vms-by-ip/{ip_address}", tags=["VM"])
+async def find_vms_by_ip(ip_address: str):
+    entries = get_vm_index(VM_DETAILS_FILE).find_by_ip(ip_address)
+    if not entries:
+        raise HTTPException(status_code=404, detail="VM not found")
+    return [{"vcenter": vcenter, **vm} for vcenter, vm in entries]
+
+@router.get("/find-vms-by-network/{network_name}", tags=["VM"])
+async def find_vms_by_network(network_name: str):
+    entries = get_vm_index(VM_DETAILS_FILE).find_by_network(network_name)
+    if not entries:
+        raise HTTPException(status_code=404, detail="No VMs found on network")
+    return [{"vcenter": vcenter, **vm} for vcenter, vm in entries]
+
+@router.get("/find-vms-by-datastore/{datastore_name}", tags=["VM"])
+async def find_vms_by_datastore(datastore_name: str):
+    entries = get_vm_index(VM_DETAILS_FILE).find_by_datastore(datastore_name)
+    if not entries:
+        raise HTTPException(status_code=404, detail="No VMs found on datastore")
+    return [{"vcenter": vcenter, **vm} for vcenter, vm in entries]
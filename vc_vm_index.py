@@ -0,0 +1,175 @@
+from vc_changes import get_change_log
+from vc_fanout import save_json_atomic
+from vc_generations import generation_counter
+from vc_metrics import snapshot_io_seconds
+from vc_snapshot import Snapshot, SnapshotError, snapshot_path, snapshot_is_current, write_snapshot
+import json
+import os
+import threading
+
+# table -> (record field it is built from, whether keys are casefolded)
+INDEX_TABLES = {
+    'name': ('vm_name', True),
+    'moid': ('vm_id', False),
+    'ip': ('ip_addresses', False),
+    'network': ('networks', True),
+    'datastore': ('datastores', True),
+}
+
+class VMIndex:
+    """
+    Lookup tables over a {vcenter: [vm, ...]} snapshot.
+
+    Every table maps a key to rows in snapshot order, so the first entry is
+    the one a linear scan would have found. Names are matched
+    case-insensitively. Tables are built on first use; over a binary snapshot
+    each one reads only its own column, and records are decoded only when a
+    lookup returns them.
+    """
+
+    def __init__(self, all_vms=None):
+        self._entries = [(vcenter, vm) for vcenter, vms in (all_vms or {}).items()
+                         if isinstance(vms, list) for vm in vms]
+        self._snapshot = None
+        self._tables = {}
+        self._lock = threading.Lock()
+        self.vm_count = len(self._entries)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        index = cls()
+        index._snapshot = snapshot
+        index.vm_count = len(snapshot)
+        return index
+
+    def entry(self, row):
+        if self._snapshot is not None:
+            return self._snapshot.entry(row)
+        return self._entries[row]
+
+    def iter_entries(self):
+        # Every (vcenter, vm) in snapshot order
+        if self._snapshot is not None:
+            return self._snapshot.entries()
+        return iter(self._entries)
+
+    def iter_names(self):
+        # Every (vcenter, vm_name), reading only the name column of a binary snapshot
+        if self._snapshot is not None:
+            names = self._snapshot.column('vm_name')
+            return ((vcenter['server'], names[row]) for vcenter in self._snapshot.vcenters
+                    for row in range(vcenter['start'], vcenter['start'] + vcenter['count']))
+        return ((vcenter, vm.get('vm_name')) for vcenter, vm in self._entries)
+
+    def _column(self, field):
+        if self._snapshot is not None:
+            return self._snapshot.iter_column(field)
+        return (vm.get(field) for _, vm in self._entries)
+
+    def _table(self, table):
+        rows_by_key = self._tables.get(table)
+        if rows_by_key is not None:
+            return rows_by_key
+        with self._lock:
+            if table not in self._tables:
+                field, fold = INDEX_TABLES[table]
+                rows_by_key = {}
+                for row, values in enumerate(self._column(field)):
+                    if isinstance(values, str):
+                        values = [values]
+                    for value in set(values or []):
+                        if value:
+                            rows_by_key.setdefault(value.casefold() if fold else value, []).append(row)
+                self._tables[table] = rows_by_key
+            return self._tables[table]
+
+    def _find(self, table, key):
+        return [self.entry(row) for row in self._table(table).get(key, [])]
+
+    def find_by_name(self, vm_name):
+        rows = self._table('name').get(vm_name.casefold())
+        return self.entry(rows[0]) if rows else None
+
+    def find_by_moid(self, vm_id):
+        return self._find('moid', vm_id)
+
+    def find_by_ip(self, ip_address):
+        return self._find('ip', ip_address)
+
+    def find_by_network(self, network_name):
+        return self._find('network', network_name.casefold())
+
+    def find_by_datastore(self, datastore_name):
+        return self._find('datastore', datastore_name.casefold())
+
+
+_indexes = {}   # snapshot file path -> (generation, VMIndex)
+_lock = threading.Lock()
+
+def load_vm_index(file_path):
+    # Prefer the memory-mapped binary snapshot; the JSON is the fallback for older captures
+    if snapshot_is_current(file_path):
+        try:
+            with snapshot_io_seconds.time(file=os.path.basename(snapshot_path(file_path)), operation='load'):
+                return VMIndex.from_snapshot(Snapshot(snapshot_path(file_path)))
+        except (OSError, SnapshotError) as e:
+            print(f"Failed to map {snapshot_path(file_path)} with error: {e}; reading {file_path} instead.")
+    try:
+        with snapshot_io_seconds.time(file=os.path.basename(file_path), operation='load'):
+            with open(file_path, 'r') as file:
+                return VMIndex(json.load(file))
+    except FileNotFoundError:
+        print(f"{file_path} was not found; VM index is empty until the next capture.")
+    except json.JSONDecodeError:
+        print(f"Error decoding JSON from {file_path}; VM index is empty until the next capture.")
+    return VMIndex()
+
+def get_vm_index(file_path):
+    """
+    Return the resident index for a snapshot file, reloading it when another
+    process has published a newer generation.
+
+    The check is one read of the shared generation counter, so API workers
+    pick up a collector's captures without a restart or any per-request file I/O.
+    """
+    generation = generation_counter(file_path).value()
+    cached = _indexes.get(file_path)
+    if cached is None or cached[0] != generation:
+        with _lock:
+            cached = _indexes.get(file_path)
+            if cached is None or cached[0] != generation:
+                # Read the generation before the file, so a publish during the load triggers another one
+                cached = _indexes[file_path] = (generation, load_vm_index(file_path))
+    return cached[1]
+
+def publish_vm_snapshot(file_path, all_vms):
+    """
+    Write a new snapshot, JSON and binary, and swap in its index.
+
+    The new index is built before it replaces the old one, so concurrent
+    lookups see either the previous snapshot or the new one, never a mix.
+    Bumping the generation afterwards tells other processes to remap it.
+    """
+    save_json_atomic(file_path, all_vms)
+    write_snapshot(snapshot_path(file_path), all_vms)
+    index = VMIndex.from_snapshot(Snapshot(snapshot_path(file_path)))
+    get_change_log().record_vms(snapshot_source(file_path), VMIndex(all_vms).iter_entries())
+    _install(file_path, index)
+    return index
+
+def refresh_vm_index(file_path):
+    """
+    Rebuild the resident index from a snapshot that was written to disk incrementally.
+    """
+    index = load_vm_index(file_path)
+    get_change_log().record_vms(snapshot_source(file_path), index.iter_entries())
+    _install(file_path, index)
+    return index
+
+def snapshot_source(file_path):
+    # vm_details.json -> vm_details, the source name in the change feed
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+def _install(file_path, index):
+    with _lock:
+        _indexes[file_path] = (generation_counter(file_path).bump(), index)
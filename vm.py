@@ -1,21 +1,32 @@
-from fastapi import FastAPI, HTTPException, Body
+from typing import List, Optional
+from fastapi import APIRouter, FastAPI, HTTPException, Body
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from pyVim.connect import SmartConnect, Disconnect
 from pyVmomi import vim
-import ssl
 from pyVim.task import WaitForTask
-
-app = FastAPI()
+from vc_common import load_vcenter_creds_for_server
+from vc_session_pool import session_pool
+from vc_tasks import task_tracker, jobs_router
+from vc_admission import admission, AdmissionRejected, VCENTER_FAILURES
+from vc_object_cache import object_cache
+from vc_bulk_provision import (BULK_MAX_PER_DATASTORE, BULK_MAX_PER_HOST, build_clone_spec,
+                               start_provisioning_batch, get_provisioning_batch)
+from vc_metrics import install_metrics
+from vc_placement import apply_placement
+import time
+
+router = APIRouter()
 
 class VMDeleteRequest(BaseModel):
     vcenter_server: str
     vm_name: str
 
 class VMCreationRequest(BaseModel):
-    vcenter_server: str
-    datacenter_name: str
-    cluster_name: str
-    datastore_name: str
+    # Placement may be left out when auto_place is set; see vc_placement.apply_placement
+    vcenter_server: Optional[str] = None
+    datacenter_name: Optional[str] = None
+    cluster_name: Optional[str] = None
+    datastore_name: Optional[str] = None
     template_name: str
     vm_name: str
     cpu: int
@@ -24,162 +35,198 @@ class VMCreationRequest(BaseModel):
     network_name: str
     enable_cpu_hot_add: bool = False
     enable_memory_hot_add: bool = False
-
-def get_ssl_context():
-    context = ssl._create_unverified_context()
-    return context
-
-import json
-
-def load_vcenter_creds_for_server(vcenter_server: str):
-    try:
-        with open('creds.json', 'r') as file:
-            creds_list = json.load(file)
-            for creds in creds_list:
-                if creds['server'] == vcenter_server:
-                    return creds
-    except FileNotFoundError:
-        print("The creds.json file was not found.")
-    except json.JSONDecodeError:
-        print("Error decoding JSON from creds.json.")
-    
-    return None
-    
+    auto_place: bool = False
 
 def get_obj(content, vimtype, name):
     """
     Get the vsphere object associated with a given text name.
     """
-    obj = None
-    container = content.viewManager.CreateContainerView(content.rootFolder, vimtype, True)
-    for c in container.view:
-        if c.name == name:
-            obj = c
-            break
-    container.Destroy()
-    return obj
+    return object_cache.lookup(content, vimtype, name)
 
-def find_network(content, network_name, datacenter):
+def find_network_in_datacenter(content, network_name, datacenter):
     """
     Find a network by name within a specific datacenter.
     """
-    networks = datacenter.networkFolder.childEntity
-    for network in networks:
-        if isinstance(network, vim.Network) and network.name == network_name:
-            return network
-    return None
+    return object_cache.lookup(content, [vim.Network], network_name, scope=datacenter)
 
-def create_vm_from_template(service_instance, vm_creation_request: VMCreationRequest):
-    content = service_instance.RetrieveContent()
-
-    # Objects have been found by get_obj and find_network functions
-    datacenter = get_obj(content, [vim.Datacenter], vm_creation_request.datacenter_name)
-    cluster = get_obj(content, [vim.ComputeResource], vm_creation_request.cluster_name)
-    datastore = get_obj(content, [vim.Datastore], vm_creation_request.datastore_name)
-    template_vm = get_obj(content, [vim.VirtualMachine], vm_creation_request.template_name)
-    network = find_network(content, vm_creation_request.network_name, datacenter)
-
-    # Create a clone specification
-    clone_spec = vim.vm.CloneSpec()
-
-    # Relocation spec
-    reloc_spec = vim.vm.RelocateSpec()
-    reloc_spec.datastore = datastore
-    reloc_spec.pool = cluster.resourcePool
-    clone_spec.location = reloc_spec
-
-    # Configuration spec (for customizing CPU, memory, etc.)
-    config_spec = vim.vm.ConfigSpec()
-    config_spec.numCPUs = vm_creation_request.cpu
-    config_spec.memoryMB = vm_creation_request.memory * 1024  # Convert GB to MB
-    config_spec.cpuHotAddEnabled = vm_creation_request.enable_cpu_hot_add
-    config_spec.memoryHotAddEnabled = vm_creation_request.enable_memory_hot_add
-    clone_spec.config = config_spec
-
-    # Network configuration
-    nic_spec = vim.vm.device.VirtualDeviceSpec()
-    nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
-    nic_spec.device = vim.vm.device.VirtualVmxnet3()
-    nic_spec.device.backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo()
-    nic_spec.device.backing.network = network
-    nic_spec.device.backing.deviceName = network.name
-    nic_spec.device.connectable = vim.vm.device.VirtualDevice.ConnectInfo()
-    nic_spec.device.connectable.startConnected = True
+def start_create_vm_from_template(service_instance, vm_creation_request: VMCreationRequest):
+    content = session_pool.content(service_instance)
 
-    # Add the network adapter to the clone spec
-    device_change = [nic_spec]
-    config_spec.deviceChange = device_change
-    clone_spec.config = config_spec
+    # Resolve the shared objects in one round trip (or none, when they are cached)
+    datacenter, cluster, datastore, template_vm = object_cache.resolve(content, [
+        ([vim.Datacenter], vm_creation_request.datacenter_name),
+        ([vim.ComputeResource], vm_creation_request.cluster_name),
+        ([vim.Datastore], vm_creation_request.datastore_name),
+        ([vim.VirtualMachine], vm_creation_request.template_name),
+    ])
+    network = find_network_in_datacenter(content, vm_creation_request.network_name, datacenter)
+
+    clone_spec = build_clone_spec(vm_creation_request, cluster, datastore, network)
 
     # Execute the clone task
     clone_task = template_vm.Clone(folder=datacenter.vmFolder, name=vm_creation_request.vm_name, spec=clone_spec)
+    return clone_task, None
+
+def create_vm_from_template(service_instance, vm_creation_request: VMCreationRequest):
+    clone_task, _ = start_create_vm_from_template(service_instance, vm_creation_request)
 
     # Wait for the clone task to complete
     WaitForTask(clone_task)
 
     return {"vm_name": vm_creation_request.vm_name, "status": "VM creation completed"}
 
-@app.post("/create-vm/")
-async def create_vm_endpoint(vm_creation_request: VMCreationRequest):
-    vcenter_creds = load_vcenter_creds_for_server(vm_creation_request.vcenter_server)
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter_creds['server'], user=vcenter_creds['user'], pwd=vcenter_creds['password'], sslContext=ssl_context)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
+async def submit_vm_task(vcenter_creds, operation, target, start, success_result, failure_detail=None):
+    """
+    Submit a vSphere task from a worker thread and return its job without waiting.
 
-    try:
-        vm_creation_response = create_vm_from_template(service_instance, vm_creation_request)
-    except Exception as e:
-        Disconnect(service_instance)
-        raise HTTPException(status_code=500, detail=f"VM creation failed: {str(e)}")
+    start(service_instance) returns (task, error); an error string becomes a 400
+    as before, and the task is handed to the shared tracker for polling.
+
+    Submits go through the vCenter's admission controller. When it is at its
+    limit the request is queued instead: the job comes back with status
+    queued, its queue_position and a retry_after estimate, and starts on its
+    own once admitted. A full queue is a 429 with a Retry-After header.
+    Only VCENTER_FAILURES and failed tasks count as errors against the limit.
+    """
+    server = vcenter_creds['server']
+
+    def submit(ticket, job_id=None):
+        try:
+            service_instance = session_pool.acquire(vcenter_creds)
+        except Exception as e:
+            ticket.release(failed=isinstance(e, VCENTER_FAILURES))
+            raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
+
+        started = time.monotonic()
+        try:
+            # A cached moref may point at an object that is gone; retry_stale re-resolves once
+            task, error = object_cache.retry_stale(session_pool.content(service_instance),
+                                                   lambda: start(service_instance))
+        except Exception as e:
+            ticket.release(failed=isinstance(e, VCENTER_FAILURES))
+            if failure_detail is None:
+                raise
+            raise HTTPException(status_code=500, detail=f"{failure_detail}: {str(e)}")
+        finally:
+            session_pool.release(service_instance)
+
+        if error:
+            # The request was wrong, not vCenter; this is no reason to back off
+            ticket.release()
+            raise HTTPException(status_code=400, detail=error)
+        ticket.submitted(time.monotonic() - started)
+        job = task_tracker.submit(vcenter_creds, operation, target, task, success_result,
+                                  on_finish=ticket.finished, job_id=job_id)
+        ticket.attach(job['job_id'])
+        return job
+
+    ticket = admission.try_admit(server, operation)
+    if ticket is not None:
+        try:
+            return await run_in_threadpool(submit, ticket)
+        finally:
+            # Failed before a job took the ticket over; a no-op if submit() already released it
+            if ticket.job_id is None:
+                ticket.release()
+
+    job = task_tracker.queue(vcenter_creds, operation, target)
+
+    def run_queued(ticket):
+        try:
+            submit(ticket, job['job_id'])
+        except HTTPException as e:
+            task_tracker.fail(job['job_id'], e.detail)
+        except Exception as e:
+            task_tracker.fail(job['job_id'], str(e))
 
-    Disconnect(service_instance)
-    return vm_creation_response
+    try:
+        job['queue_position'], job['retry_after'] = admission.enqueue(server, operation, job['job_id'], run_queued)
+    except AdmissionRejected as e:
+        task_tracker.discard(job['job_id'])
+        raise HTTPException(status_code=429, headers={'Retry-After': str(e.retry_after)},
+                            detail={'message': f"{e}; retry later", 'queued': e.queued,
+                                    'retry_after': e.retry_after})
+    return job
+
+@router.post("/create-vm/", status_code=202)
+async def create_vm_endpoint(vm_creation_request: VMCreationRequest):
+    placement = apply_placement(vm_creation_request)
+    vcenter_creds = load_vcenter_creds_for_server(vm_creation_request.vcenter_server)
+    if not vcenter_creds:
+        raise HTTPException(status_code=404, detail="vCenter credentials not found")
+    # Returns the job right away; poll /jobs/{job_id} for the clone's progress
+    job = await submit_vm_task(
+        vcenter_creds, "create-vm", vm_creation_request.vm_name,
+        lambda service_instance: start_create_vm_from_template(service_instance, vm_creation_request),
+        {"vm_name": vm_creation_request.vm_name, "status": "VM creation completed"},
+        failure_detail="VM creation failed")
+    if placement is not None:
+        job['placement'] = placement
+    return job
+
+class BulkVMCreationRequest(BaseModel):
+    vms: List[VMCreationRequest]
+    max_per_datastore: int = BULK_MAX_PER_DATASTORE
+    max_per_host: int = BULK_MAX_PER_HOST
+
+@router.post("/create-vms/bulk", status_code=202)
+async def create_vms_bulk_endpoint(request: BulkVMCreationRequest):
+    if not request.vms:
+        raise HTTPException(status_code=400, detail="No VMs requested")
+    if request.max_per_datastore < 1 or request.max_per_host < 1:
+        raise HTTPException(status_code=400, detail="max_per_datastore and max_per_host must be at least 1")
+
+    for vm in request.vms:
+        apply_placement(vm)
+    vcenters = {vm.vcenter_server: load_vcenter_creds_for_server(vm.vcenter_server) for vm in request.vms}
+    # Lookups and clones run on the batch's own thread; poll /create-vms/bulk/{batch_id} for per-item results
+    batch = start_provisioning_batch(request.vms, vcenters, request.max_per_datastore, request.max_per_host)
+    return batch.snapshot()
+
+@router.get("/create-vms/bulk/{batch_id}")
+async def get_bulk_creation(batch_id: str):
+    batch = get_provisioning_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch.snapshot()
 
 
 def find_vm_by_name(service_instance, vm_name: str):
-    content = service_instance.RetrieveContent()
-    container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-    for vm in container.view:
-        if vm.name == vm_name:
-            return vm
-    return None
+    return object_cache.lookup(session_pool.content(service_instance), [vim.VirtualMachine], vm_name)
 
-def delete_vm(service_instance, vm_name: str):
+def start_delete_vm(service_instance, vm_name: str):
     vm = find_vm_by_name(service_instance, vm_name)
     if vm is None:
-        return "VM not found"
+        return None, "VM not found"
+
+    try:
+        return vm.Destroy_Task(), None
+    except Exception as e:
+        return None, f"Failed to delete VM: {str(e)}"
+
+def delete_vm(service_instance, vm_name: str):
+    task, error = start_delete_vm(service_instance, vm_name)
+    if error:
+        return error
     
     try:
-        task = vm.Destroy_Task()
         WaitForTask(task)
         return "VM deleted successfully"
     except Exception as e:
         return f"Failed to delete VM: {str(e)}"
 
     
-@app.post("/delete-vm/")
+@router.post("/delete-vm/", status_code=202)
 async def delete_vm_endpoint(request: VMDeleteRequest):
     # Load vCenter credentials (implement this function based on your setup)
     vcenter_creds = load_vcenter_creds_for_server(request.vcenter_server)
     if not vcenter_creds:
         raise HTTPException(status_code=404, detail="vCenter credentials not found")
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter_creds['server'], user=vcenter_creds['user'], pwd=vcenter_creds['password'], sslContext=ssl_context)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
-
-    # Attempt to delete the VM
-    delete_status = delete_vm(service_instance, request.vm_name)
-
-    Disconnect(service_instance)
-    
-    if delete_status != "VM deleted successfully":
-        raise HTTPException(status_code=400, detail=delete_status)
-    
-    return {"detail": delete_status}
+    # Submit the delete and hand back the job
+    return await submit_vm_task(
+        vcenter_creds, "delete-vm", request.vm_name,
+        lambda service_instance: start_delete_vm(service_instance, request.vm_name),
+        "VM deleted successfully")
 
 
 ####################
@@ -191,25 +238,9 @@ class NetworkAdditionRequest(BaseModel):
     network_name: str
 
 def find_network(content, network_name):
-    for datacenter in content.rootFolder.childEntity:
-        if not hasattr(datacenter, 'networkFolder'):
-            continue
-        network_folder = datacenter.networkFolder
-        networks = [net for net in network_folder.childEntity if net.name == network_name]
-        if networks:
-            return networks[0]  # Return the first matching network
-    return None
-
-def add_network_to_vm(service_instance, vm_name: str, network_name: str):
-    content = service_instance.RetrieveContent()
-    vm = find_vm_by_name(service_instance, vm_name)
-    if vm is None:
-        return "VM not found"
-
-    network = find_network(content, network_name)
-    if not network:
-        return "Network not found"
+    return object_cache.lookup(content, [vim.Network], network_name)
 
+def build_nic_spec(network):
     nic_spec = vim.vm.device.VirtualDeviceSpec()
     nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
     nic_spec.device = vim.vm.device.VirtualVmxnet3()
@@ -218,31 +249,36 @@ def add_network_to_vm(service_instance, vm_name: str, network_name: str):
     nic_spec.device.backing.deviceName = network.name
     nic_spec.device.connectable = vim.vm.device.VirtualDevice.ConnectInfo()
     nic_spec.device.connectable.startConnected = True
+    return nic_spec
+
+def start_add_network_to_vm(service_instance, vm_name: str, network_name: str):
+    vm = find_vm_by_name(service_instance, vm_name)
+    if vm is None:
+        return None, "VM not found"
+
+    network = find_network(session_pool.content(service_instance), network_name)
+    if not network:
+        return None, "Network not found"
 
-    spec = vim.vm.ConfigSpec(deviceChange=[nic_spec])
-    task = vm.ReconfigVM_Task(spec=spec)
+    spec = vim.vm.ConfigSpec(deviceChange=[build_nic_spec(network)])
+    return vm.ReconfigVM_Task(spec=spec), None
+
+def add_network_to_vm(service_instance, vm_name: str, network_name: str):
+    task, error = start_add_network_to_vm(service_instance, vm_name, network_name)
+    if error:
+        return error
     WaitForTask(task)
     return "Network adapter added successfully"
 
-@app.post("/add-network-to-vm/")
+@router.post("/add-network-to-vm/", status_code=202)
 async def add_network_to_vm_endpoint(request: NetworkAdditionRequest):
     vcenter_creds = load_vcenter_creds_for_server(request.vcenter_server)
     if not vcenter_creds:
         raise HTTPException(status_code=404, detail="vCenter credentials not found")
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter_creds['server'], user=vcenter_creds['user'], pwd=vcenter_creds['password'],sslContext=ssl_context)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
-
-    add_network_status = add_network_to_vm(service_instance, request.vm_name, request.network_name)
-
-    Disconnect(service_instance)
-    
-    if add_network_status != "Network adapter added successfully":
-        raise HTTPException(status_code=400, detail=add_network_status)
-    
-    return {"detail": add_network_status}
+    return await submit_vm_task(
+        vcenter_creds, "add-network-to-vm", request.vm_name,
+        lambda service_instance: start_add_network_to_vm(service_instance, request.vm_name, request.network_name),
+        "Network adapter added successfully")
 
 
 
@@ -253,20 +289,18 @@ class NetworkRemovalRequest(BaseModel):
     vm_name: str
     network_label: str  # Optional: Use if you want to remove a specific network adapter by its label
 
-def remove_network_from_vm(service_instance, vm_name: str, network_label: str):
-    content = service_instance.RetrieveContent()
+def start_remove_network_from_vm(service_instance, vm_name: str, network_label: str):
     vm = find_vm_by_name(service_instance, vm_name)
     if not vm:
-        return "VM not found"
+        return None, "VM not found"
 
     # Find the network adapter to remove
     for device in vm.config.hardware.device:
-        print(device.deviceInfo)
         if isinstance(device, vim.vm.device.VirtualEthernetCard) and device.deviceInfo.label == network_label:
             nic_key = device.key
             break
     else:
-        return "Network adapter not found"
+        return None, "Network adapter not found"
 
     # Create a device spec to remove the network adapter
     virtual_device_spec = vim.vm.device.VirtualDeviceSpec()
@@ -277,30 +311,25 @@ def remove_network_from_vm(service_instance, vm_name: str, network_label: str):
     config_spec = vim.vm.ConfigSpec(deviceChange=[virtual_device_spec])
 
     # Reconfigure the VM
-    task = vm.ReconfigVM_Task(spec=config_spec)
+    return vm.ReconfigVM_Task(spec=config_spec), None
+
+def remove_network_from_vm(service_instance, vm_name: str, network_label: str):
+    task, error = start_remove_network_from_vm(service_instance, vm_name, network_label)
+    if error:
+        return error
     WaitForTask(task)
     return "Network adapter removed successfully"
 
 
-@app.post("/remove-network-from-vm/")
+@router.post("/remove-network-from-vm/", status_code=202)
 async def remove_network_from_vm_endpoint(request: NetworkRemovalRequest):
     vcenter_creds = load_vcenter_creds_for_server(request.vcenter_server)
     if not vcenter_creds:
         raise HTTPException(status_code=404, detail="vCenter credentials not found")
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter_creds['server'], user=vcenter_creds['user'], pwd=vcenter_creds['password'],sslContext=ssl_context)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
-
-    remove_network_status = remove_network_from_vm(service_instance, request.vm_name, request.network_label)
-
-    Disconnect(service_instance)
-    
-    if remove_network_status != "Network adapter removed successfully":
-        raise HTTPException(status_code=400, detail=remove_network_status)
-    
-    return {"detail": remove_network_status}
+    return await submit_vm_task(
+        vcenter_creds, "remove-network-from-vm", request.vm_name,
+        lambda service_instance: start_remove_network_from_vm(service_instance, request.vm_name, request.network_label),
+        "Network adapter removed successfully")
 
 
 
@@ -313,37 +342,26 @@ class DiskAdditionRequest(BaseModel):
     datastore_name: str
 
 def find_datastore(service_instance, datastore_name):
-    content = service_instance.RetrieveContent()
-    for datacenter in content.rootFolder.childEntity:
-        if hasattr(datacenter, 'datastoreFolder'):
-            datastore_folder = datacenter.datastoreFolder
-            for datastore in datastore_folder.childEntity:
-                if datastore.name == datastore_name:
-                    return datastore
-    return None
-
-
-def add_disk_to_vm(service_instance, vm_name: str, disk_size_gb: int, datastore_name: str):
-    content = service_instance.RetrieveContent()
-    vm = find_vm_by_name(service_instance, vm_name)
-    if not vm:
-        return "VM not found"
+    return object_cache.lookup(session_pool.content(service_instance), [vim.Datastore], datastore_name)
 
-    datastore = find_datastore(service_instance, datastore_name)
-    if not datastore:
-        return "Datastore not found"
 
-    # Create a new virtual disk
-    spec = vim.vm.ConfigSpec()
+def next_disk_unit_numbers(devices, count):
+    """
+    Unit numbers for count new disks, following the highest one in use and skipping 7.
+    """
     unit_number = 0
-    for dev in vm.config.hardware.device:
+    for dev in devices:
         if hasattr(dev.backing, 'fileName'):
             unit_number = max(unit_number, int(dev.unitNumber) + 1)
-            if unit_number == 7:  # SCSI controller reserved
-                unit_number += 1
-
-    dev_changes = []
-    new_disk_kb = disk_size_gb * 1024 * 1024
+    unit_numbers = []
+    while len(unit_numbers) < count:
+        if unit_number == 7:  # SCSI controller reserved
+            unit_number += 1
+        unit_numbers.append(unit_number)
+        unit_number += 1
+    return unit_numbers
+
+def build_disk_spec(datastore, disk_size_gb, unit_number):
     disk_spec = vim.vm.device.VirtualDeviceSpec()
     disk_spec.fileOperation = "create"
     disk_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
@@ -352,35 +370,42 @@ def add_disk_to_vm(service_instance, vm_name: str, disk_size_gb: int, datastore_
     disk_spec.device.backing.diskMode = 'persistent'
     disk_spec.device.backing.datastore = datastore
     disk_spec.device.unitNumber = unit_number
-    disk_spec.device.capacityInKB = new_disk_kb
+    disk_spec.device.capacityInKB = disk_size_gb * 1024 * 1024
     disk_spec.device.controllerKey = 1000  # Typically SCSI controller key
-    dev_changes.append(disk_spec)
-    spec.deviceChange = dev_changes
+    return disk_spec
+
+def start_add_disk_to_vm(service_instance, vm_name: str, disk_size_gb: int, datastore_name: str):
+    vm = find_vm_by_name(service_instance, vm_name)
+    if not vm:
+        return None, "VM not found"
+
+    datastore = find_datastore(service_instance, datastore_name)
+    if not datastore:
+        return None, "Datastore not found"
+
+    # Create a new virtual disk
+    unit_number = next_disk_unit_numbers(vm.config.hardware.device, 1)[0]
+    spec = vim.vm.ConfigSpec(deviceChange=[build_disk_spec(datastore, disk_size_gb, unit_number)])
 
     # Add the disk to the VM
-    task = vm.ReconfigVM_Task(spec=spec)
+    return vm.ReconfigVM_Task(spec=spec), None
+
+def add_disk_to_vm(service_instance, vm_name: str, disk_size_gb: int, datastore_name: str):
+    task, error = start_add_disk_to_vm(service_instance, vm_name, disk_size_gb, datastore_name)
+    if error:
+        return error
     WaitForTask(task)
     return "Disk added successfully"
 
-@app.post("/add-disk-to-vm/")
+@router.post("/add-disk-to-vm/", status_code=202)
 async def add_disk_to_vm_endpoint(request: DiskAdditionRequest):
     vcenter_creds = load_vcenter_creds_for_server(request.vcenter_server)
     if not vcenter_creds:
         raise HTTPException(status_code=404, detail="vCenter credentials not found")
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter_creds['server'], user=vcenter_creds['user'], pwd=vcenter_creds['password'],sslContext=ssl_context)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
-
-    add_disk_status = add_disk_to_vm(service_instance, request.vm_name, request.disk_size_gb, request.datastore_name)
-
-    Disconnect(service_instance)
-    
-    if add_disk_status != "Disk added successfully":
-        raise HTTPException(status_code=400, detail=add_disk_status)
-    
-    return {"detail": add_disk_status}
+    return await submit_vm_task(
+        vcenter_creds, "add-disk-to-vm", request.vm_name,
+        lambda service_instance: start_add_disk_to_vm(service_instance, request.vm_name, request.disk_size_gb, request.datastore_name),
+        "Disk added successfully")
 
 
 ########
@@ -390,11 +415,10 @@ class DiskRemovalRequest(BaseModel):
     vm_name: str
     disk_label: str
 
-def remove_disk_from_vm(service_instance, vm_name: str, disk_label: str):
-    content = service_instance.RetrieveContent()
+def start_remove_disk_from_vm(service_instance, vm_name: str, disk_label: str):
     vm = find_vm_by_name(service_instance, vm_name)
     if not vm:
-        return "VM not found"
+        return None, "VM not found"
 
     # Find the disk to remove
     for device in vm.config.hardware.device:
@@ -402,7 +426,7 @@ def remove_disk_from_vm(service_instance, vm_name: str, disk_label: str):
             disk_key = device.key
             break
     else:
-        return "Disk not found"
+        return None, "Disk not found"
 
     # Create a device spec to remove the disk
     virtual_device_spec = vim.vm.device.VirtualDeviceSpec()
@@ -413,26 +437,133 @@ def remove_disk_from_vm(service_instance, vm_name: str, disk_label: str):
     config_spec = vim.vm.ConfigSpec(deviceChange=[virtual_device_spec])
 
     # Reconfigure the VM
-    task = vm.ReconfigVM_Task(spec=config_spec)
+    return vm.ReconfigVM_Task(spec=config_spec), None
+
+def remove_disk_from_vm(service_instance, vm_name: str, disk_label: str):
+    task, error = start_remove_disk_from_vm(service_instance, vm_name, disk_label)
+    if error:
+        return error
     WaitForTask(task)
     return "Disk removed successfully"
 
-@app.post("/remove-disk-from-vm/")
+@router.post("/remove-disk-from-vm/", status_code=202)
 async def remove_disk_from_vm_endpoint(request: DiskRemovalRequest):
     vcenter_creds = load_vcenter_creds_for_server(request.vcenter_server)
     if not vcenter_creds:
         raise HTTPException(status_code=404, detail="vCenter credentials not found")
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter_creds['server'], user=vcenter_creds['user'], pwd=vcenter_creds['password'],sslContext=ssl_context)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
+    return await submit_vm_task(
+        vcenter_creds, "remove-disk-from-vm", request.vm_name,
+        lambda service_instance: start_remove_disk_from_vm(service_instance, request.vm_name, request.disk_label),
+        "Disk removed successfully")
 
-    remove_disk_status = remove_disk_from_vm(service_instance, request.vm_name, request.disk_label)
+########
+# Reconfigure several devices, CPU and memory in one task
+class DiskSpecRequest(BaseModel):
+    disk_size_gb: int
+    datastore_name: str
 
-    Disconnect(service_instance)
-    
-    if remove_disk_status != "Disk removed successfully":
-        raise HTTPException(status_code=400, detail=remove_disk_status)
-    
-    return {"detail": remove_disk_status}
\ No newline at end of file
+class VMReconfigureRequest(BaseModel):
+    vcenter_server: str
+    vm_name: str
+    cpu: Optional[int] = None
+    memory: Optional[int] = None  # In GB
+    add_disks: List[DiskSpecRequest] = []
+    remove_disk_labels: List[str] = []
+    add_networks: List[str] = []  # Network names
+    remove_network_labels: List[str] = []
+
+def start_reconfigure_vm(service_instance, request: VMReconfigureRequest):
+    if not (request.add_disks or request.remove_disk_labels or request.add_networks or
+            request.remove_network_labels or request.cpu is not None or request.memory is not None):
+        return None, "Nothing to reconfigure"
+
+    content = session_pool.content(service_instance)
+    vm = find_vm_by_name(service_instance, request.vm_name)
+    if not vm:
+        return None, "VM not found"
+
+    # Every datastore and network named in the request, resolved in one round trip
+    datastore_names = list(dict.fromkeys(disk.datastore_name for disk in request.add_disks))
+    network_names = list(dict.fromkeys(request.add_networks))
+    resolved = object_cache.resolve(content, [([vim.Datastore], name) for name in datastore_names] +
+                                             [([vim.Network], name) for name in network_names])
+    datastores = dict(zip(datastore_names, resolved[:len(datastore_names)]))
+    networks = dict(zip(network_names, resolved[len(datastore_names):]))
+    for name, datastore in datastores.items():
+        if datastore is None:
+            return None, f"Datastore {name} not found"
+    for name, network in networks.items():
+        if network is None:
+            return None, f"Network {name} not found"
+
+    devices = vm.config.hardware.device
+    device_changes = []
+    for label in request.remove_disk_labels:
+        disk = next((device for device in devices
+                     if isinstance(device, vim.vm.device.VirtualDisk) and device.deviceInfo.label == label), None)
+        if disk is None:
+            return None, f"Disk {label} not found"
+        device_changes.append(vim.vm.device.VirtualDeviceSpec(
+            operation=vim.vm.device.VirtualDeviceSpec.Operation.remove,
+            device=vim.vm.device.VirtualDisk(key=disk.key)))
+    for label in request.remove_network_labels:
+        nic = next((device for device in devices
+                    if isinstance(device, vim.vm.device.VirtualEthernetCard) and device.deviceInfo.label == label), None)
+        if nic is None:
+            return None, f"Network adapter {label} not found"
+        device_changes.append(vim.vm.device.VirtualDeviceSpec(
+            operation=vim.vm.device.VirtualDeviceSpec.Operation.remove,
+            device=vim.vm.device.VirtualEthernetCard(key=nic.key)))
+
+    # New disks get consecutive unit numbers after the existing ones
+    unit_numbers = next_disk_unit_numbers(devices, len(request.add_disks))
+    if unit_numbers and unit_numbers[-1] > 15:
+        return None, "Not enough free unit numbers on the SCSI controller"
+    for disk, unit_number in zip(request.add_disks, unit_numbers):
+        device_changes.append(build_disk_spec(datastores[disk.datastore_name], disk.disk_size_gb, unit_number))
+    for name in request.add_networks:
+        device_changes.append(build_nic_spec(networks[name]))
+
+    config_spec = vim.vm.ConfigSpec(deviceChange=device_changes)
+    if request.cpu is not None:
+        config_spec.numCPUs = request.cpu
+    if request.memory is not None:
+        config_spec.memoryMB = request.memory * 1024  # Convert GB to MB
+
+    # One ReconfigVM_Task for all changes, so vCenter applies them together
+    return vm.ReconfigVM_Task(spec=config_spec), None
+
+def reconfigure_vm(service_instance, request: VMReconfigureRequest):
+    task, error = start_reconfigure_vm(service_instance, request)
+    if error:
+        return error
+    WaitForTask(task)
+    return "VM reconfigured successfully"
+
+@router.post("/reconfigure-vm/", status_code=202)
+async def reconfigure_vm_endpoint(request: VMReconfigureRequest):
+    vcenter_creds = load_vcenter_creds_for_server(request.vcenter_server)
+    if not vcenter_creds:
+        raise HTTPException(status_code=404, detail="vCenter credentials not found")
+    return await submit_vm_task(
+        vcenter_creds, "reconfigure-vm", request.vm_name,
+        lambda service_instance: start_reconfigure_vm(service_instance, request),
+        "VM reconfigured successfully")
+
+@router.get("/session-pool-stats")
+async def session_pool_stats():
+    return session_pool.stats()
+
+@router.get("/admission-stats")
+async def admission_stats():
+    return admission.stats()
+
+@router.get("/object-cache-stats")
+async def object_cache_stats():
+    return object_cache.stats()
+
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(router)
+app.include_router(jobs_router)
+install_metrics(app)
@@ -1,11 +1,15 @@
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import APIRouter, FastAPI, HTTPException, Body
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from pyVim.connect import SmartConnect, Disconnect
 from pyVmomi import vim
-import ssl
 from pyVim.task import WaitForTask
+from vc_common import load_vcenter_creds_for_server
+from vc_session_pool import session_pool
+from vc_tasks import task_tracker, jobs_router
+from vc_object_cache import object_cache
+from vc_metrics import install_metrics
 
-app = FastAPI()
+router = APIRouter()
 
 class VMCreationRequest(BaseModel):
     vcenter_server: str
@@ -21,52 +25,20 @@ class VMCreationRequest(BaseModel):
     enable_cpu_hot_add: bool = False
     enable_memory_hot_add: bool = False
 
-def get_ssl_context():
-    context = ssl._create_unverified_context()
-    return context
-
-import json
-
-def load_vcenter_creds_for_server(vcenter_server: str):
-    try:
-        with open('creds.json', 'r') as file:
-            creds_list = json.load(file)
-            for creds in creds_list:
-                if creds['server'] == vcenter_server:
-                    return creds
-    except FileNotFoundError:
-        print("The creds.json file was not found.")
-    except json.JSONDecodeError:
-        print("Error decoding JSON from creds.json.")
-    
-    return None
-    
-
 def get_obj(content, vimtype, name):
     """
     Get the vsphere object associated with a given text name.
     """
-    obj = None
-    container = content.viewManager.CreateContainerView(content.rootFolder, vimtype, True)
-    for c in container.view:
-        if c.name == name:
-            obj = c
-            break
-    container.Destroy()
-    return obj
+    return object_cache.lookup(content, vimtype, name)
 
 def find_network(content, network_name, datacenter):
     """
     Find a network by name within a specific datacenter.
     """
-    networks = datacenter.networkFolder.childEntity
-    for network in networks:
-        if isinstance(network, vim.Network) and network.name == network_name:
-            return network
-    return None
+    return object_cache.lookup(content, [vim.Network], network_name, scope=datacenter)
 
-def create_vm_from_template(service_instance, vm_creation_request: VMCreationRequest):
-    content = service_instance.RetrieveContent()
+def start_create_vm_from_template(service_instance, vm_creation_request: VMCreationRequest):
+    content = session_pool.content(service_instance)
 
     # Objects have been found by get_obj and find_network functions
     datacenter = get_obj(content, [vim.Datacenter], vm_creation_request.datacenter_name)
@@ -109,26 +81,41 @@ def create_vm_from_template(service_instance, vm_creation_request: VMCreationReq
 
     # Execute the clone task
     clone_task = template_vm.Clone(folder=datacenter.vmFolder, name=vm_creation_request.vm_name, spec=clone_spec)
+    return clone_task
+
+def create_vm_from_template(service_instance, vm_creation_request: VMCreationRequest):
+    clone_task = start_create_vm_from_template(service_instance, vm_creation_request)
 
     # Wait for the clone task to complete
     WaitForTask(clone_task)
 
     return {"vm_name": vm_creation_request.vm_name, "status": "VM creation completed"}
 
-@app.post("/create-vm/")
+@router.post("/create-vm/", status_code=202)
 async def create_vm_endpoint(vm_creation_request: VMCreationRequest):
     vcenter_creds = load_vcenter_creds_for_server(vm_creation_request.vcenter_server)
-    ssl_context = get_ssl_context()
-    try:
-        service_instance = SmartConnect(host=vcenter_creds['server'], user=vcenter_creds['user'], pwd=vcenter_creds['password'], sslContext=ssl_context)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
-
-    try:
-        vm_creation_response = create_vm_from_template(service_instance, vm_creation_request)
-    except Exception as e:
-        Disconnect(service_instance)
-        raise HTTPException(status_code=500, detail=f"VM creation failed: {str(e)}")
-
-    Disconnect(service_instance)
-    return vm_creation_response
+
+    # Lookups and the Clone call block, so run them off the event loop and return the job
+    def submit():
+        try:
+            service_instance = session_pool.acquire(vcenter_creds)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to connect to vCenter: {str(e)}")
+
+        try:
+            clone_task = start_create_vm_from_template(service_instance, vm_creation_request)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"VM creation failed: {str(e)}")
+        finally:
+            session_pool.release(service_instance)
+
+        return task_tracker.submit(vcenter_creds, "create-vm", vm_creation_request.vm_name, clone_task,
+                                   {"vm_name": vm_creation_request.vm_name, "status": "VM creation completed"})
+
+    return await run_in_threadpool(submit)
+
+# Standalone app for running this module on its own; vc_service mounts the routers instead
+app = FastAPI()
+app.include_router(router)
+app.include_router(jobs_router)
+install_metrics(app)